@@ -0,0 +1,47 @@
+import os
+from typing import Optional
+
+# Форматы сохранения аудио.
+#   mp3 / flac — перекодирование через ffmpeg (как раньше);
+#   native     — лучшая аудиодорожка YouTube без перекодирования (opus → .opus, aac → .m4a);
+#   opus / m4a — предпочитаем дорожку в этом кодеке и только перепаковываем её в контейнер
+#                (если такой дорожки нет — перекодируем).
+# yt-dlp только выбирает и скачивает дорожку ("format"); что делать с ней дальше,
+# решает transcode.plan() на отдельном этапе конвейера.
+
+FORMATS = {
+    "mp3":    {"format": "bestaudio/best", "codec": "mp3", "exts": ("mp3",)},
+    "flac":   {"format": "bestaudio/best", "codec": "flac", "exts": ("flac",)},
+    "native": {"format": "bestaudio/best", "codec": "best", "exts": ("opus", "m4a", "ogg", "mp3", "flac")},
+    "opus":   {"format": "bestaudio[acodec=opus]/bestaudio/best", "codec": "opus", "exts": ("opus",)},
+    "m4a":    {"format": "bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best", "codec": "m4a", "exts": ("m4a",)},
+}
+DEFAULT = "mp3"
+ALL_EXTS = ("mp3", "flac", "opus", "m4a", "ogg")
+
+
+def normalize(fmt: Optional[str]) -> str:
+    fmt = str(fmt or DEFAULT).lower()
+    return fmt if fmt in FORMATS else DEFAULT
+
+
+def ydl_format(fmt: str) -> str:
+    return FORMATS[normalize(fmt)]["format"]
+
+
+def exts(fmt: str) -> tuple[str, ...]:
+    """Расширения, которые может получить файл в этом формате (первое — основное)."""
+    return FORMATS[normalize(fmt)]["exts"]
+
+
+def is_transcoding(fmt: str) -> bool:
+    return normalize(fmt) in ("mp3", "flac")
+
+
+def locate(out_dir: str, stem: str, fmt: str) -> Optional[str]:
+    """Итоговый файл после загрузки: <stem>.<ext> с одним из расширений формата."""
+    for ext in exts(fmt):
+        path = os.path.join(out_dir, f"{stem}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
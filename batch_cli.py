@@ -0,0 +1,374 @@
+"""
+Пакетный (неинтерактивный) режим: для cron и планировщиков задач.
+
+    SpotyDown https://open.spotify.com/playlist/... https://open.spotify.com/track/... \\
+        --out D:\\Music --threads 6 --summary result.json
+    SpotyDown --file urls.txt
+    SpotyDown --file batch.json      # {"urls": [...], "settings": {...}, "out": "..."}
+
+Все плейлисты и треки идут через ОДИН конвейер: общий бюджет потоков, общий кеш
+поиска и обложек, общие экземпляры yt-dlp. Треки разных плейлистов подаются по
+очереди (round-robin), так что большой плейлист не задерживает маленькие.
+
+Коды выхода: 0 — всё скачано, 1 — часть треков не скачалась, 2 — ничего не сделано
+(ошибка аргументов, ни один источник не открылся).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+import concurrent.futures
+
+import tracing
+import rate_limit
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_FATAL = 2
+
+SETTING_KEYS = ("threads", "search_threads", "search_plan", "audio_bitrate_kbps", "audio_format", "debug", "trace",
+                "library_mode", "transcode_threads", "ffmpeg_threads", "concurrency", "search_bounds",
+                "download_bounds", "rate_limits", "retries")
+
+
+def _read_url_file(path: str) -> tuple[list[str], dict, str | None]:
+    """Текстовый файл (URL по строке, # — комментарий) или JSON {"urls", "settings", "out"}."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.lower().endswith(".json"):
+        data = json.loads(text)
+        if isinstance(data, list):
+            return [str(u) for u in data], {}, None
+        return [str(u) for u in data.get("urls") or []], dict(data.get("settings") or {}), data.get("out")
+    urls = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls, {}, None
+
+
+def classify_url(url: str) -> str:
+    u = url.lower()
+    if "youtube.com" in u or "youtu.be" in u:
+        return "youtube"
+    if "/playlist/" in u or u.startswith("spotify:playlist:"):
+        return "playlist"
+    if "/track/" in u or u.startswith("spotify:track:"):
+        return "track"
+    return "unknown"
+
+
+def interleave(streams: list):
+    """Round-robin по итераторам: по одному элементу из каждого, пока все не кончатся."""
+    active = [iter(s) for s in streams]
+    while active:
+        for it in list(active):
+            try:
+                yield next(it)
+            except StopIteration:
+                active.remove(it)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(
+        prog="SpotyDown",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    ap.add_argument("urls", nargs="*", help="ссылки на плейлисты/треки Spotify или видео YouTube")
+    ap.add_argument("--file", help="файл со ссылками (.txt) или заданием (.json)")
+    ap.add_argument("--out", help="папка музыки (по умолчанию — из конфига)")
+    ap.add_argument("--threads", type=int, help="потоки загрузки")
+    ap.add_argument("--search-threads", type=int, help="потоки поиска")
+    ap.add_argument("--concurrency", choices=("fixed", "auto"),
+                    help="auto — подбирать число поисков/загрузок на ходу (--threads/--search-threads — старт)")
+    ap.add_argument("--search-bounds", type=int, nargs=2, metavar=("MIN", "MAX"), help="границы потоков поиска в auto")
+    ap.add_argument("--download-bounds", type=int, nargs=2, metavar=("MIN", "MAX"),
+                    help="границы потоков загрузки в auto")
+    ap.add_argument("--retries", type=int, help="повторов трека при временных сбоях (0 — не повторять)")
+    ap.add_argument("--rate-limit", dest="rate_limit_args", action="append", default=[], metavar="КАТЕГОРИЯ=N",
+                    help="запросов в секунду: search, spotify, cover (0 — без ограничения); можно несколько раз")
+    ap.add_argument("--transcode-threads", type=int, help="одновременные процессы ffmpeg (по умолчанию — число ядер)")
+    ap.add_argument("--ffmpeg-threads", type=int, help="потоков на один ffmpeg (0 — авто)")
+    ap.add_argument("--search-plan", choices=("adaptive", "merged", "full"))
+    ap.add_argument("--format", dest="audio_format", choices=("mp3", "flac", "native", "opus", "m4a"),
+                    help="mp3/flac — перекодирование; native/opus/m4a — без перекодирования")
+    ap.add_argument("--bitrate", dest="audio_bitrate_kbps", type=int, choices=(160, 320))
+    ap.add_argument("--library", dest="library_mode", choices=("folders", "links", "m3u"),
+                    help="раскладка: копии по папкам / общее хранилище + ссылки / общее хранилище + .m3u8")
+    ap.add_argument("--cookies", help="путь к cookies.txt (по умолчанию ищется как обычно)")
+    ap.add_argument("--no-cookies", action="store_true", help="не использовать cookies.txt")
+    ap.add_argument("--new-copy", action="store_true",
+                    help="не синхронизировать существующую папку плейлиста, а создать новую копию")
+    ap.add_argument("--prune", action="store_true", help="удалять файлы треков, которых больше нет в плейлисте")
+    ap.add_argument("--trace", action="store_true", help="сохранить трассу этапов")
+    ap.add_argument("--summary", help="куда записать JSON-итог (по умолчанию — в stdout)")
+    return ap
+
+
+class _Source:
+    """Один URL из задания и его итог."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.kind = classify_url(url)
+        self.name = None
+        self.folder = None
+        self.total = 0
+        self.ok = 0
+        self.skipped = 0
+        self.failed: list[str] = []
+        self.age_restricted: list[str] = []
+        self.error: str | None = None
+        self.manifest = None
+        self.keys: set[str] = set()
+        self.tracks: list[dict] = []
+        self.m3u = None
+        self.pages_complete = True
+        self.pruned = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "kind": self.kind,
+            "name": self.name,
+            "folder": self.folder,
+            "total": self.total,
+            "ok": self.ok,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "age_restricted": self.age_restricted,
+            "pruned": self.pruned,
+            "m3u": self.m3u,
+            "error": self.error,
+        }
+
+
+def run(argv: list[str], app) -> int:
+    """
+    Точка входа пакетного режима. app — модуль spotify_downloader
+    (передаётся явно: при запуске как скрипт он живёт в sys.modules под именем __main__).
+    """
+    ap = build_parser()
+    args = ap.parse_args(argv)
+
+    app._load_cli_settings_from_config()
+    urls = list(args.urls)
+    out_dir = args.out
+    if args.file:
+        try:
+            file_urls, file_settings, file_out = _read_url_file(args.file)
+        except (OSError, ValueError) as e:
+            print(f"Не удалось прочитать {args.file}: {e}", file=sys.stderr)
+            return EXIT_FATAL
+        urls += file_urls
+        out_dir = out_dir or file_out
+        for k, v in file_settings.items():
+            if k in SETTING_KEYS:
+                app.CLI_SETTINGS[k] = v
+    for k in SETTING_KEYS:
+        v = getattr(args, k, None)
+        if v is not None and v is not False:   # 0 — допустимое значение (--ffmpeg-threads 0)
+            app.CLI_SETTINGS[k] = v
+    for spec in args.rate_limit_args:
+        name, _, value = spec.partition("=")
+        try:
+            app.CLI_SETTINGS["rate_limits"] = dict(app.CLI_SETTINGS.get("rate_limits") or {},
+                                                   **{name.strip(): float(value)})
+        except ValueError:
+            print(f"Неверный --rate-limit: {spec} (нужно, например, search=5)", file=sys.stderr)
+            return EXIT_FATAL
+    app.DEBUG = bool(app.CLI_SETTINGS.get("debug"))
+    tracing.enable(app.CLI_SETTINGS.get("trace"))
+    rate_limit.configure(app.CLI_SETTINGS.get("rate_limits"))
+
+    if not urls:
+        ap.print_usage(sys.stderr)
+        print("Не указано ни одной ссылки", file=sys.stderr)
+        return EXIT_FATAL
+
+    if not out_dir:
+        out_dir = (app.load_config() or {}).get("music_dir") or os.getcwd()
+    os.makedirs(out_dir, exist_ok=True)
+
+    cookies_file = None
+    if not args.no_cookies:
+        cookies_file = args.cookies or app.find_cookie_file()
+
+    store = app.get_track_store(out_dir)
+
+    started = time.time()
+    sources = [_Source(u) for u in urls]
+    # прогресс и сообщения приложения — в stderr, stdout остаётся под JSON-итог
+    with contextlib.redirect_stdout(sys.stderr), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=app.SPOTIFY_PAGE_THREADS) as pages_pool:
+        streams = [_open_source(app, src, out_dir, cookies_file, pages_pool, not args.new_copy, store)
+                   for src in sources]
+        streams = [s for s in streams if s is not None]
+
+        lock = threading.Lock()
+        done_count = [0]
+
+        def _on_done(job):
+            src = job["source"]
+            err = job.get("error")
+            line = f"{app._track_label(job['track'])}" + (f" ({err})" if err else "")
+            with lock:
+                done_count[0] += 1
+                if not err:
+                    src.ok += 1
+                elif err == "требуются куки":
+                    src.age_restricted.append(line)
+                else:
+                    src.failed.append(line)
+                n = done_count[0]
+            print(f"[{n}] {'ok' if not err else 'ошибка'}: {line}")
+
+        if tracing.ENABLED:
+            tracing.reset()
+        result = app.run_jobs(interleave(streams), on_done=_on_done) if streams else None
+
+    for src in sources:
+        if store is not None and store.mode == "m3u" and src.kind == "playlist" and src.tracks:
+            src.m3u = os.path.join(out_dir, f"{src.name}.m3u8")
+            try:
+                app.write_playlist_m3u(store, src.m3u, src.tracks)
+            except OSError as e:
+                print(f"Не удалось записать {src.m3u}: {e}", file=sys.stderr)
+                src.m3u = None
+        if src.manifest is None:
+            continue
+        if args.prune and src.kind == "playlist" and src.pages_complete and src.error is None:
+            removed = src.manifest.removed(src.keys)
+            src.pruned = src.manifest.prune(k for k, _ in removed)
+        src.manifest.save()
+
+    trace_path = tracing.export() if tracing.ENABLED else None
+
+    opened = [s for s in sources if s.error is None]
+    ok = sum(s.ok for s in sources)
+    failed = sum(len(s.failed) + len(s.age_restricted) for s in sources)
+    if not opened and not ok:
+        code = EXIT_FATAL
+    elif failed or len(opened) < len(sources):
+        code = EXIT_PARTIAL
+    else:
+        code = EXIT_OK
+
+    summary = {
+        "started": started,
+        "duration_s": round(time.time() - started, 3),
+        "exit_code": code,
+        "out": out_dir,
+        "settings": {k: app.CLI_SETTINGS.get(k) for k in SETTING_KEYS},
+        "totals": {
+            "sources": len(sources),
+            "sources_failed": len(sources) - len(opened),
+            "tracks": sum(s.total for s in sources),
+            "ok": ok,
+            "skipped": sum(s.skipped for s in sources),
+            "failed": failed,
+        },
+        "sources": [s.as_dict() for s in sources],
+        "library": store.stats_snapshot() if store is not None else None,
+        "stats": result["stats"] if result else None,
+        "trace": trace_path,
+    }
+    text = json.dumps(summary, ensure_ascii=False, indent=1)
+    if args.summary:
+        try:
+            with open(args.summary, "w", encoding="utf-8") as f:
+                f.write(text)
+        except OSError as e:
+            print(f"Не удалось записать итог в {args.summary}: {e}", file=sys.stderr)
+            print(text)
+    else:
+        print(text)
+    return code
+
+
+def _open_source(app, src: _Source, out_dir: str, cookies_file, pages_pool, sync: bool, store=None):
+    """Открывает источник и возвращает генератор заданий для конвейера (или None при ошибке)."""
+    try:
+        if src.kind == "playlist":
+            return _open_playlist(app, src, out_dir, cookies_file, pages_pool, sync, store)
+        if src.kind == "track":
+            track = app.get_spotify_track(src.url)
+            if not track:
+                raise ValueError("трек недоступен")
+        elif src.kind == "youtube":
+            from single_track_cli import yt_get_video_info, parse_title_guess
+            info = yt_get_video_info(src.url, cookies_file)
+            if not info:
+                raise ValueError("не удалось получить информацию о видео")
+            artist, title = parse_title_guess(info["title"])
+            track = {
+                "id": None,
+                "artist": artist or info["uploader"] or "Unknown Artist",
+                "title": title or info["title"] or "Unknown Title",
+                "album": info["uploader"] or "YouTube",
+                "duration_ms": info["duration"] * 1000,
+                "cover_url": info.get("thumbnail"),
+                "youtube_url": info["url"],
+            }
+        else:
+            raise ValueError("неизвестный тип ссылки")
+    except Exception as e:
+        src.error = str(e) or e.__class__.__name__
+        print(f"Пропуск {src.url}: {src.error}")
+        return None
+
+    # одиночный трек — в свою папку «Артист - Название», как в интерактивном режиме
+    src.name = app._track_label(track)
+    src.total = 1
+    src.folder = os.path.join(out_dir, f"{app.sanitize_filename(track['artist'])} - {app.sanitize_filename(track['title'])}")
+    os.makedirs(src.folder, exist_ok=True)
+    # одиночному треку хранилище нужно только в режиме links (в m3u его некуда «положить»)
+    track_store = store if store is not None and store.mode == "links" else None
+    return iter([app.make_job(1, 1, track, src.folder, cookies_file, source=src, store=track_store)])
+
+
+def _open_playlist(app, src: _Source, out_dir: str, cookies_file, pages_pool, sync: bool, store=None):
+    name, owner, total, pages = app.open_spotify_playlist(src.url, executor=pages_pool)
+    src.name = f"{name} ({owner})"
+    src.total = total
+    m3u_mode = store is not None and store.mode == "m3u"
+    if m3u_mode:
+        # плейлист — .m3u8 рядом с хранилищем, своей папки нет
+        folder = store.root
+    else:
+        folder = os.path.join(out_dir, src.name)
+        if not sync:
+            counter = 1
+            while os.path.exists(folder):
+                folder = os.path.join(out_dir, f"{src.name}_{counter}")
+                counter += 1
+        os.makedirs(folder, exist_ok=True)
+        src.manifest = app.SyncManifest(folder)
+        src.manifest.playlist_url = src.url
+    src.folder = folder
+
+    def jobs():
+        idx = 0
+        try:
+            for _, page in pages:
+                for t in page:
+                    src.keys.add(app.track_key(t))
+                    src.tracks.append(t)
+                    if src.manifest is not None:
+                        src.manifest.adopt_existing([t], app.track_file_name)
+                        if src.manifest.has(t):
+                            src.skipped += 1
+                            continue
+                    idx += 1
+                    yield app.make_job(idx, total, t, folder, cookies_file, src.manifest, src, store)
+        except Exception as e:
+            src.pages_complete = False
+            src.error = f"плейлист получен не полностью: {e}"
+            print(f"{src.url}: {src.error}")
+
+    return jobs()
@@ -0,0 +1,255 @@
+"""
+Сквозной офлайн-бенчмарк: плейлист из локального «Spotify» (benchmarks/fakes.py),
+поиск и скачивание через подменный YoutubeDL, настоящие теги и обложки.
+Ни Spotify, ни YouTube не трогаются; конфиг, кеши и файлы — во временной папке.
+
+Что меряется для каждого размера плейлиста:
+  playlist  — get_spotify_playlist_info (все страницы),
+  search    — find_best_match на выборке треков (холодный кеш),
+  track     — один трек целиком (process_track): поиск → загрузка → ffmpeg → теги,
+  pipeline  — run_playlist_pipeline по потоку страниц, как в меню «скачать плейлист»:
+              треков в минуту, перцентили по этапам, время до первого файла.
+В конце — пиковый RSS процесса.
+
+Ограничители частоты запросов (rate_limit) по умолчанию выключены: меряется конвейер,
+а не лимит в N запросов/с. --rate-limit search=10 — прогон с лимитами, как у приложения.
+
+    python benchmarks/bench_e2e.py [--sizes 100,1000,10000] [--search-ms 80 --search-jitter-ms 40]
+                                   [--error-rate 0.01] [--rate-limit search=10] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeSpotify, FakeYoutubeDLFactory, Latency  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _fmt_stage(name: str, st: dict) -> str:
+    return (f"    {name:<9} n={st['count']:<6} p50={st['p50'] * 1000:7.1f} мс "
+            f"p90={st['p90'] * 1000:7.1f} мс p99={st['p99'] * 1000:7.1f} мс busy={st['busy_s']:7.1f} с")
+
+
+def _reset_caches(sd):
+    import covers
+    sd.SEARCH_CACHE.clear()
+    mc = sd.get_match_cache()
+    if mc is not None:
+        mc.clear()
+    covers.clear()
+
+
+def bench_size(sd, fake: FakeSpotify, size: int, args, workdir: str, quiet) -> dict:
+    from pipeline import percentile
+
+    url = fake.playlist_url(size)
+    result = {"size": size}
+
+    # 1. метаданные плейлиста
+    started = time.perf_counter()
+    name, owner, tracks = sd.get_spotify_playlist_info(url)
+    result["playlist_s"] = time.perf_counter() - started
+    result["playlist_tracks"] = len(tracks)
+
+    # 2. поиск по выборке
+    _reset_caches(sd)
+    sample = tracks[:min(len(tracks), args.search_sample)]
+    opts = {"quiet": True, "no_warnings": True, "extract_flat": True}
+    lat = []
+    found = 0
+    for t in sample:
+        s = time.perf_counter()
+        if sd.find_best_match(t, opts, None):
+            found += 1
+        lat.append(time.perf_counter() - s)
+    result["search"] = {
+        "count": len(sample), "found": found,
+        "p50": percentile(lat, 50), "p90": percentile(lat, 90), "p99": percentile(lat, 99),
+    }
+
+    # 3. один трек целиком: process_track — те же этапы, что у конвейера, последовательно
+    _reset_caches(sd)
+    single_dir = os.path.join(workdir, f"single_{size}")
+    os.makedirs(single_dir, exist_ok=True)
+    job = sd.make_job(1, 1, tracks[0], single_dir, None)
+    s = time.perf_counter()
+    with quiet():
+        ok = sd.process_track(job)
+    result["track_s"] = time.perf_counter() - s
+    result["track_ok"] = bool(ok)
+
+    # 4. весь плейлист: страницы потоком в конвейер
+    _reset_caches(sd)
+    out_dir = os.path.join(workdir, f"playlist_{size}")
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    _, _, total, pages = sd.open_spotify_playlist(url)
+
+    def stream():
+        for _, page in pages:
+            yield from page
+
+    with quiet():
+        res = sd.run_playlist_pipeline(stream(), out_dir, None, total=total)
+    wall = time.perf_counter() - started
+    done = total - len(res["failed"]) - len(res["age_restricted"])
+    result["pipeline"] = {
+        "wall_s": wall,
+        "ok": done,
+        "failed": len(res["failed"]),
+        "age_restricted": len(res["age_restricted"]),
+        "tracks_per_min": done / wall * 60 if wall else 0.0,
+        "first_file_s": res["stats"]["first_file_s"],
+        "queries_per_track": res["stats"]["queries_per_track"],
+        "covers": res["stats"]["covers"],
+        "stages": res["stats"]["stages"],
+    }
+    if not args.keep:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        shutil.rmtree(single_dir, ignore_errors=True)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def print_result(r: dict):
+    p = r["pipeline"]
+    print(f"\n=== {r['size']} треков ===")
+    print(f"  плейлист:  {r['playlist_s']:.2f} с ({r['playlist_tracks']} треков)")
+    s = r["search"]
+    print(f"  поиск:     {s['found']}/{s['count']}, p50={s['p50'] * 1000:.1f} мс "
+          f"p90={s['p90'] * 1000:.1f} мс p99={s['p99'] * 1000:.1f} мс")
+    print(f"  один трек: {r['track_s']:.2f} с ({'ok' if r['track_ok'] else 'ошибка'})")
+    first = f"{p['first_file_s']:.2f} с" if p["first_file_s"] is not None else "—"
+    print(f"  конвейер:  {p['wall_s']:.1f} с, {p['tracks_per_min']:.0f} треков/мин, "
+          f"ok={p['ok']} ошибок={p['failed']} куки={p['age_restricted']}, первый файл {first}, "
+          f"запросов/трек {p['queries_per_track']:.2f}")
+    cv = p["covers"]
+    print(f"  обложки:   скачано {cv['fetches']}, соединений {cv['connections']} "
+          f"(переиспользовано {cv['connections_reused']})")
+    for name, st in p["stages"].items():
+        print(_fmt_stage(name, st))
+    print(f"  пиковый RSS: {r['peak_rss_mb']:.0f} МБ")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="100,1000,10000")
+    ap.add_argument("--spotify-ms", type=float, default=60)
+    ap.add_argument("--spotify-jitter-ms", type=float, default=30)
+    ap.add_argument("--search-ms", type=float, default=80)
+    ap.add_argument("--search-jitter-ms", type=float, default=40)
+    ap.add_argument("--download-ms", type=float, default=150)
+    ap.add_argument("--download-jitter-ms", type=float, default=100)
+    ap.add_argument("--cover-ms", type=float, default=30)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля сбоев поиска/загрузки/API")
+    ap.add_argument("--age-restricted-rate", type=float, default=0.0)
+    ap.add_argument("--miss-rate", type=float, default=0.02, help="доля треков без правильного видео")
+    ap.add_argument("--audio-seconds", type=float, default=2.0, help="длина генерируемых MP3")
+    ap.add_argument("--search-sample", type=int, default=50)
+    ap.add_argument("--threads", type=int, default=None, help="потоки загрузки (по умолчанию из настроек)")
+    ap.add_argument("--search-threads", type=int, default=None)
+    ap.add_argument("--rate-limit", dest="rate_limits", action="append", default=[], metavar="КАТЕГОРИЯ=N",
+                    help="запросов в секунду для категории (по умолчанию все без ограничения); можно несколько раз")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--keep", action="store_true", help="не удалять скачанные файлы")
+    ap.add_argument("--verbose", action="store_true", help="не глушить вывод приложения")
+    ap.add_argument("--json", dest="json_path", default=None, help="записать результаты в JSON")
+    args = ap.parse_args(argv)
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    rates = {}
+    for spec in args.rate_limits:
+        name, _, value = spec.partition("=")
+        try:
+            rates[name.strip()] = float(value)
+        except ValueError:
+            ap.error(f"неверный --rate-limit: {spec} (нужно, например, search=10)")
+
+    workdir = tempfile.mkdtemp(prefix="spotydown-bench-")
+    # конфиг, кеш совпадений и кеш обложек приложения — тоже во временной папке
+    os.environ["APPDATA"] = workdir
+
+    import spotipy
+    import rate_limit
+    import ydl_pool
+    import spotify_downloader as sd
+    import spotify_client
+
+    rate_limit.configure({name: 0 for name in rate_limit.DEFAULT_RATES})
+    rate_limit.configure(rates)
+    sd.CLI_SETTINGS["audio_format"] = "mp3"   # генерируемые файлы — MP3
+    if args.threads:
+        sd.CLI_SETTINGS["threads"] = args.threads
+    if args.search_threads:
+        sd.CLI_SETTINGS["search_threads"] = args.search_threads
+
+    err = args.error_rate
+    fake = FakeSpotify(
+        api=Latency(args.spotify_ms, args.spotify_jitter_ms, err, seed=args.seed),
+        covers=Latency(args.cover_ms, args.cover_ms / 2, err, seed=args.seed + 1),
+        miss_rate=args.miss_rate,
+    ).start()
+    factory = FakeYoutubeDLFactory(
+        fake,
+        search=Latency(args.search_ms, args.search_jitter_ms, err, seed=args.seed + 2),
+        download=Latency(args.download_ms, args.download_jitter_ms, err, seed=args.seed + 3),
+        audio_seconds=args.audio_seconds,
+        age_restricted_rate=args.age_restricted_rate,
+    )
+    ydl_pool.set_factory(factory)
+
+    def fake_client():
+        sp = spotipy.Spotify(auth="bench", requests_timeout=10)
+        sp.prefix = fake.base_url + "/v1/"
+        return sp
+
+    spotify_client.set_factory(lambda client_id, client_secret: fake_client())
+
+    @contextlib.contextmanager
+    def quiet():
+        if args.verbose:
+            yield
+            return
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+    results = []
+    try:
+        for size in sizes:
+            r = bench_size(sd, fake, size, args, workdir, quiet)
+            print_result(r)
+            results.append(r)
+    finally:
+        ydl_pool.set_factory(None)
+        fake.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\nвызовов API Spotify: {fake.api.calls} (сбоев {fake.api.errors}), "
+          f"поисков: {factory.search_latency.calls} (сбоев {factory.search_latency.errors}), "
+          f"загрузок: {factory.download_latency.calls} (сбоев {factory.download_latency.errors}), "
+          f"экземпляров YoutubeDL: {factory.instances}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=1)
+    return 0 if all(r["pipeline"]["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Микробенчмарк оценки кандидатов: прежний алгоритм find_best_match
+(SequenceMatcher дважды на entry + дедупликация `entry not in list`)
+против scoring.TrackScorer. Заодно проверяет, что на эталонном наборе
+оба выбирают одно и то же видео.
+
+    python benchmarks/bench_scoring.py [--tracks 2000] [--seed 1]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scoring import TrackScorer  # noqa: E402
+
+WORDS = (
+    "love night fire dream heart city rain summer shadow light gold wild "
+    "ocean river star blue paper sound echo young forever midnight road "
+    "Любовь ночь город звезда дождь лето"
+).split()
+SUFFIXES = [
+    " (Official Audio)", " (Official Video)", " [Lyrics]", " (Remix)", " - cover",
+    " (Sped Up)", " (Live)", "", " (Audio)", " HD",
+]
+
+
+def _phrase(rng, lo, hi):
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(lo, hi)))
+
+
+def make_reference_set(n_tracks: int, seed: int):
+    """[(track_info, [ответы 4 запросов по 5 entries])] — синтетика в духе выдачи ytsearch."""
+    rng = random.Random(seed)
+    data = []
+    for t in range(n_tracks):
+        artist = ", ".join(_phrase(rng, 1, 2) for _ in range(rng.randint(1, 2)))
+        title = _phrase(rng, 1, 4)
+        duration = rng.randint(120, 320)
+        track = {"artist": artist, "title": title, "duration_ms": duration * 1000}
+        pool = []
+        for v in range(12):
+            kind = rng.random()
+            if kind < 0.5:
+                yt_title = f"{artist} - {title}{rng.choice(SUFFIXES)}"
+            elif kind < 0.7:
+                yt_title = f"{title}{rng.choice(SUFFIXES)}"
+            else:
+                yt_title = f"{_phrase(rng, 1, 2)} - {_phrase(rng, 1, 4)}"
+            dur = duration + rng.choice([0, 0, 1, -2, 5, 30, -45, 90]) if rng.random() > 0.05 else None
+            pool.append({
+                "id": f"t{t}v{v}",
+                "url": f"https://www.youtube.com/watch?v=t{t}v{v}",
+                "title": yt_title,
+                "uploader": rng.choice([artist.split(",")[0], f"{artist.split(',')[0]} - Topic", "Random Channel"]),
+                "duration": dur,
+            })
+        # 4 запроса по 5 результатов с перекрытиями, как в реальной выдаче
+        answers = [[dict(e) for e in rng.sample(pool, 5)] for _ in range(4)]
+        data.append((track, answers))
+    return data
+
+
+def legacy_best(track_info, answers):
+    """Копия прежнего find_best_match (без сети)."""
+    def similarity(a, b):
+        return SequenceMatcher(None, a.lower(), b.lower()).ratio()
+
+    all_results = []
+    for res in answers:
+        for entry in res:
+            if entry and entry not in all_results:
+                all_results.append(entry)
+    best_match, best_score = None, -1.0
+    spotify_duration = (track_info.get("duration_ms") or 0) / 1000.0
+    for entry in all_results:
+        title = (entry.get("title") or "").strip()
+        if not title:
+            continue
+        raw_dur = entry.get("duration")
+        entry_duration = float(raw_dur) if raw_dur is not None else None
+        title_similarity = similarity(title, track_info["title"])
+        artist_in_title = similarity(title, track_info["artist"])
+        if entry_duration is not None:
+            duration_diff = abs(entry_duration - spotify_duration)
+            duration_score = 1.0 / (1.0 + duration_diff)
+        else:
+            duration_diff = None
+            duration_score = 0.5
+        title_lower = title.lower()
+        kw_bonus = 0.0
+        if any(k in title_lower for k in ["official", "original", "audio", "lyrics"]):
+            kw_bonus += 0.05
+        if any(k in title_lower for k in ["cover", "remix", "speed up", "sped up"]):
+            kw_bonus -= 0.2
+        score = title_similarity * 0.65 + artist_in_title * 0.30 + duration_score * 0.05 + kw_bonus
+        if score > best_score and (duration_diff is None or duration_diff <= 20):
+            best_score = score
+            best_match = entry
+    return best_match, best_score
+
+
+def new_best(track_info, answers):
+    scorer = TrackScorer(track_info)
+    for res in answers:
+        scorer.score_batch(res)
+    return scorer.best_entry, scorer.best_score
+
+
+def _bench(fn, data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for track, answers in data:
+            fn(track, answers)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tracks", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    data = make_reference_set(args.tracks, args.seed)
+
+    mismatches = 0
+    for track, answers in data:
+        old_entry, old_score = legacy_best(track, answers)
+        new_entry, new_score = new_best(track, answers)
+        old_id = old_entry["id"] if old_entry else None
+        new_id = new_entry["id"] if new_entry else None
+        if old_id != new_id or (old_entry and old_score != new_score):
+            mismatches += 1
+
+    t_old = _bench(legacy_best, data, args.repeat)
+    t_new = _bench(new_best, data, args.repeat)
+    print(f"треков: {len(data)}, кандидатов на трек: 20")
+    print(f"прежний алгоритм: {t_old * 1000:8.1f} мс ({t_old / len(data) * 1e6:6.1f} мкс/трек)")
+    print(f"TrackScorer:      {t_new * 1000:8.1f} мс ({t_new / len(data) * 1e6:6.1f} мкс/трек)")
+    print(f"ускорение:        {t_old / t_new:8.2f}x")
+    print(f"расхождений в выборе: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
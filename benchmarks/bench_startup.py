@@ -0,0 +1,213 @@
+"""
+Бенчмарк холодного старта: каждый замер — отдельный процесс Python, как при запуске
+собранного exe. Сеть не нужна: конфиг во временной папке, поиск — через подменный
+YoutubeDL из benchmarks/fakes.py (но настоящий импорт yt_dlp входит в замер).
+
+  import  — import spotify_downloader (всё, что грузится до main()),
+  menu    — запуск программы до главного меню и выход из него («0»),
+  search  — импорт + первый find_best_match (первый YoutubeDL, match-кеш, оценка),
+  --importtime — самые дорогие модули по python -X importtime.
+
+Бюджеты (--budget-menu-ms / --budget-search-ms) превращают бенчмарк в проверку:
+код выхода 1, если медиана вышла за бюджет.
+
+    python benchmarks/bench_startup.py [--runs 5] [--budget-menu-ms 1500] [--importtime] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR_NAME = "SpotifyPlaylistDownloader"
+
+HEAVY = ("yt_dlp", "spotipy", "mutagen", "PIL", "selenium", "undetected_chromedriver")
+
+IMPORT_CHILD = r"""
+import sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import spotify_downloader
+loaded = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"import_s": time.perf_counter() - t0, "heavy_loaded": loaded}}))
+"""
+
+SEARCH_CHILD = r"""
+import sys, time, json
+t0 = time.perf_counter()
+sys.path[:0] = [{root!r}, {bench!r}]
+import spotify_downloader as sd
+import ydl_pool
+from fakes import FakeSpotify, FakeYoutubeDLFactory, Latency
+imported = time.perf_counter() - t0
+
+fake = FakeSpotify(Latency(), Latency())
+track = fake.catalog(1).tracks[0]
+factory = FakeYoutubeDLFactory(fake, Latency(), Latency())
+yt_dlp_ok = True
+
+def make(params):
+    global yt_dlp_ok
+    try:
+        ydl_pool.load_yt_dlp()   # цена импорта yt_dlp — часть «первого поиска»
+    except ImportError:
+        yt_dlp_ok = False
+    return factory(params)
+
+ydl_pool.set_factory(make)
+sd._load_cli_settings_from_config()
+mc = sd.get_match_cache()
+if mc is not None:
+    mc.clear()   # APPDATA общий для всех прогонов — иначе со второго раза поиск придёт из кеша
+match = sd.find_best_match(track, {{}}, None)
+fake.server.server_close()
+print(json.dumps({{"import_s": imported, "first_search_s": time.perf_counter() - t0,
+                  "found": bool(match), "yt_dlp_imported": yt_dlp_ok}}))
+"""
+
+
+def _env(appdata: str) -> dict:
+    env = dict(os.environ)
+    env["APPDATA"] = appdata
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    env["PYTHONIOENCODING"] = "utf-8"
+    return env
+
+
+def _prepare_config(appdata: str, music_dir: str):
+    cfg_dir = os.path.join(appdata, APP_DIR_NAME)
+    os.makedirs(cfg_dir, exist_ok=True)
+    with open(os.path.join(cfg_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"music_dir": music_dir}, f)
+
+
+def _run_child(code: str, env: dict, cwd: str) -> tuple[float, dict]:
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], env=env, cwd=cwd,
+                          capture_output=True, text=True, encoding="utf-8")
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode)
+    return wall, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _run_menu(env: dict, cwd: str) -> float:
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, "spotify_downloader.py")],
+                          input="0\n", env=env, cwd=cwd, capture_output=True, text=True, encoding="utf-8")
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        err = proc.stderr.strip().splitlines()
+        raise RuntimeError(err[-1] if err else proc.returncode)
+    return wall
+
+
+def importtime_top(env: dict, cwd: str, top: int) -> list[tuple[str, float]]:
+    """
+    [(пакет, мс)] по убыванию: накопленное время первого импорта каждого пакета
+    верхнего уровня (вложенные импорты того же пакета не суммируются повторно).
+    """
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); import spotify_downloader"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, cwd=cwd,
+                          capture_output=True, text=True, encoding="utf-8")
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3:
+            continue
+        try:
+            cumulative_us = float(parts[1].strip())
+        except ValueError:   # строка заголовка
+            continue
+        name = parts[2][1:]
+        level = (len(name) - len(name.lstrip())) // 2
+        rows.append((level, name.strip().split(".")[0], cumulative_us))
+
+    # importtime печатает модуль после его вложенных импортов — идём с конца, чтобы знать родителя
+    totals: dict[str, float] = {}
+    stack: list[str] = []
+    for level, root, cumulative_us in reversed(rows):
+        del stack[level:]
+        parent = stack[-1] if stack else None
+        if root != parent:
+            totals[root] = totals.get(root, 0.0) + cumulative_us / 1000.0
+        stack.append(root)
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+
+def _median_ms(values: list[float]) -> float:
+    return statistics.median(values) * 1000 if values else 0.0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-menu-ms", type=float, default=None, help="бюджет медианы «до меню»")
+    ap.add_argument("--budget-search-ms", type=float, default=None, help="бюджет медианы «до первого поиска»")
+    ap.add_argument("--importtime", action="store_true", help="показать самые дорогие импорты")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--json", help="сохранить результаты в JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="spotydown-startup-")
+    appdata = os.path.join(workdir, "appdata")
+    music = os.path.join(workdir, "music")
+    os.makedirs(music, exist_ok=True)
+    _prepare_config(appdata, music)
+    env = _env(appdata)
+
+    results = {"runs": args.runs, "import_s": [], "menu_s": [], "search_s": [], "heavy_loaded": []}
+    try:
+        import_code = IMPORT_CHILD.format(root=ROOT, heavy=HEAVY)
+        search_code = SEARCH_CHILD.format(root=ROOT, bench=BENCH_DIR)
+        for _ in range(args.runs):
+            wall, data = _run_child(import_code, env, workdir)
+            results["import_s"].append(wall)
+            results["heavy_loaded"] = data["heavy_loaded"]
+            results["menu_s"].append(_run_menu(env, workdir))
+            wall, data = _run_child(search_code, env, workdir)
+            results["search_s"].append(wall)
+            results["search_found"] = data["found"]
+            results["yt_dlp_imported"] = data["yt_dlp_imported"]
+
+        print(f"Холодный старт, медиана из {args.runs} (процесс целиком, вместе с запуском Python):")
+        print(f"  import            {_median_ms(results['import_s']):8.1f} мс")
+        print(f"  до меню и выход   {_median_ms(results['menu_s']):8.1f} мс")
+        print(f"  до первого поиска {_median_ms(results['search_s']):8.1f} мс"
+              + ("" if results.get("yt_dlp_imported") else "  [yt_dlp не установлен — без его импорта]"))
+        if results["heavy_loaded"]:
+            print(f"  [!] при импорте загружены тяжёлые пакеты: {', '.join(results['heavy_loaded'])}")
+        else:
+            print("  тяжёлые пакеты при импорте не загружаются")
+
+        if args.importtime:
+            results["importtime_ms"] = importtime_top(env, workdir, args.top)
+            print("\nСамые дорогие импорты (накопленно, мс):")
+            for name, ms in results["importtime_ms"]:
+                print(f"  {name:<28} {ms:8.1f}")
+
+        failed = []
+        if args.budget_menu_ms is not None and _median_ms(results["menu_s"]) > args.budget_menu_ms:
+            failed.append(f"до меню {_median_ms(results['menu_s']):.0f} мс > {args.budget_menu_ms:.0f} мс")
+        if args.budget_search_ms is not None and _median_ms(results["search_s"]) > args.budget_search_ms:
+            failed.append(f"до поиска {_median_ms(results['search_s']):.0f} мс > {args.budget_search_ms:.0f} мс")
+        results["budget_failed"] = failed
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        if failed:
+            print("\nБюджет превышен: " + "; ".join(failed))
+            sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
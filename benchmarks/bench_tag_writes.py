@@ -0,0 +1,140 @@
+"""
+Сколько байт записывается на диск на один трек: ffmpeg + теги с обложкой.
+
+  раньше — ffmpeg пишет файл без тегов, потом mutagen вставляет ID3/FLAC-блок с обложкой
+           в начало файла (места под него нет — файл переписывается целиком);
+  сейчас — transcode.transcode(tags=...): MP3/FLAC ffmpeg тегирует сам, за один проход;
+           остальные форматы по-прежнему дописывает mutagen.
+  правка — повторная запись тегов (другой альбом) поверх результата: с запасом в
+           заголовке (HEADER_PADDING) она идёт на месте.
+
+Запись ffmpeg — размер нового файла; запись mutagen — число блоков по 4 КБ, которые
+отличаются от файла до сохранения (сдвиг данных при вставке тега меняет их все).
+Сеть не нужна: источник — синус из lavfi (как «сырой» WAV от загрузки), обложка —
+синтетическая, нормализованная covers.normalize_jpeg. Нужны ffmpeg, mutagen и Pillow.
+
+    python benchmarks/bench_tag_writes.py [--seconds 200] [--formats mp3,flac,m4a,opus] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import covers  # noqa: E402
+import tagging  # noqa: E402
+import transcode  # noqa: E402
+from fakes import cover_jpeg  # noqa: E402
+
+BLOCK = 4096
+TRACK = {"title": "Бенчмарк тегов", "artist": "Bench Artist", "album": "Bench Album"}
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def changed_bytes(before: bytes, after: bytes) -> int:
+    """Байты в блоках по BLOCK, которые пришлось записать, чтобы из before получить after."""
+    total = 0
+    for off in range(0, len(after), BLOCK):
+        block = after[off:off + BLOCK]
+        if block != before[off:off + BLOCK]:
+            total += len(block)
+    return total
+
+
+def _tag_write(path: str, track: dict, cover: bytes) -> int:
+    old = _read(path)
+    tagging.write_tags(path, track, cover, "image/jpeg")
+    return changed_bytes(old, _read(path))
+
+
+def make_source(path: str, seconds: float):
+    cmd = [transcode.ffmpeg_binary(), "-y", "-nostdin", "-v", "error", "-f", "lavfi",
+           "-i", f"sine=frequency=440:duration={seconds}", "-ac", "2", "-ar", "44100", path]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def run_format(fmt: str, src: str, workdir: str, cover: bytes) -> dict:
+    out = {"format": fmt}
+    tags = {**TRACK, "cover": cover, "cover_mime": "image/jpeg"}
+    edited = {**TRACK, "album": "Bench Album (Deluxe Edition)"}
+
+    for mode in ("before", "after"):
+        folder = os.path.join(workdir, f"{fmt}_{mode}")
+        os.makedirs(folder, exist_ok=True)
+        raw = os.path.join(folder, "track.src.wav")
+        shutil.copyfile(src, raw)
+        started = time.perf_counter()
+        path, tagged = transcode.transcode(raw, folder, "track", fmt, acodec="pcm_s16le",
+                                           tags=tags if mode == "after" else None)
+        ffmpeg_bytes = os.path.getsize(path)
+        mutagen_bytes = 0 if tagged else _tag_write(path, TRACK, cover)
+        elapsed = time.perf_counter() - started
+        out[mode] = {
+            "tagged_by_ffmpeg": tagged,
+            "ffmpeg_bytes": ffmpeg_bytes,
+            "mutagen_bytes": mutagen_bytes,
+            "total_bytes": ffmpeg_bytes + mutagen_bytes,
+            "file_bytes": os.path.getsize(path),
+            "seconds": elapsed,
+            "edit_bytes": _tag_write(path, edited, cover),
+        }
+    return out
+
+
+def _kb(n: int) -> str:
+    return f"{n / 1024:9.0f} КБ"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=200.0, help="длительность трека")
+    ap.add_argument("--formats", default="mp3,flac,m4a,opus")
+    ap.add_argument("--json", help="сохранить результаты в JSON")
+    args = ap.parse_args()
+
+    if shutil.which(transcode.ffmpeg_binary()) is None:
+        print("ffmpeg не найден в PATH — измерять нечего")
+        return 1
+    cover = cover_jpeg()
+    if not cover:
+        print("Pillow не установлен — без обложки измерение не показательно")
+        return 1
+    cover = covers.normalize_jpeg(cover)
+
+    workdir = tempfile.mkdtemp(prefix="spotydown-tags-")
+    results = []
+    try:
+        src = os.path.join(workdir, "source.wav")
+        make_source(src, args.seconds)
+        print(f"Трек {args.seconds:.0f} с, обложка {len(cover) // 1024} КБ; записано на диск на один трек:")
+        print(f"  {'формат':<6} {'раньше':>12} {'сейчас':>12} {'экономия':>9}   "
+              f"{'правка тегов: раньше':>22} {'сейчас':>12}")
+        for fmt in [f.strip() for f in args.formats.split(",") if f.strip()]:
+            r = run_format(fmt, src, workdir, cover)
+            results.append(r)
+            b, a = r["before"], r["after"]
+            saved = 1 - a["total_bytes"] / b["total_bytes"] if b["total_bytes"] else 0.0
+            note = "" if a["tagged_by_ffmpeg"] else "  [теги пишет mutagen]"
+            print(f"  {fmt:<6} {_kb(b['total_bytes'])} {_kb(a['total_bytes'])} {saved:8.0%}   "
+                  f"{_kb(b['edit_bytes']):>22} {_kb(a['edit_bytes'])}{note}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+Офлайн-стенды для бенчмарков: локальный «Spotify Web API» на http.server
+и подменный YoutubeDL (синтетическая выдача ytsearch + маленькие MP3 вместо скачивания).
+Задержка, разброс и доля ошибок настраиваются отдельно для каждой стороны.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+TRACKS_PER_ALBUM = 12
+
+
+class Latency:
+    """base_ms ± jitter_ms на вызов; error_rate — доля вызовов, которые падают."""
+
+    def __init__(self, base_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 1):
+        self.base = base_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def wait(self) -> bool:
+        """Спит положенное время; False — этот вызов должен завершиться ошибкой."""
+        with self._lock:
+            self.calls += 1
+            delay = self.base + self._rng.uniform(-self.jitter, self.jitter)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        return not fail
+
+
+class Catalog:
+    """Детерминированный синтетический плейлист: у каждого трека есть «правильное» видео."""
+
+    def __init__(self, size: int, base_url: str = "", miss_rate: float = 0.02):
+        self.size = size
+        self.base_url = base_url
+        self.miss_rate = miss_rate
+        self.tracks = [self._track(i) for i in range(size)]
+        # любой запрос из plan_search_queries → индекс трека
+        self._by_query: dict[str, int] = {}
+        for i, t in enumerate(self.tracks):
+            artist, title = t["artist"], t["title"]
+            for q in (f"{artist} - {title} official audio", f"{artist} - {title}",
+                      f"{title} {artist}", title):
+                self._by_query[q.lower()] = i
+
+    @staticmethod
+    def _track(i: int) -> dict:
+        return {
+            "id": f"fake{i:07d}",
+            "artist": f"Artist {i % 997:03d}" + (f", Feat {i % 13}" if i % 7 == 0 else ""),
+            "title": f"Song {i:06d}",
+            "album": f"Album {i // TRACKS_PER_ALBUM:05d}",
+            "album_idx": i // TRACKS_PER_ALBUM,
+            "duration_s": 120 + (i * 37) % 200,
+        }
+
+    def spotify_item(self, i: int) -> dict:
+        t = self.tracks[i]
+        return {"track": {
+            "id": t["id"],
+            "name": t["title"],
+            "duration_ms": t["duration_s"] * 1000,
+            "artists": [{"name": a} for a in t["artist"].split(", ")],
+            "album": {"name": t["album"], "images": [{"url": f"{self.base_url}/img/{t['album_idx']}.jpg"}]},
+        }}
+
+    def lookup(self, query: str):
+        i = self._by_query.get(query.strip().lower())
+        return None if i is None else self.tracks[i]
+
+    def search(self, query: str, n: int) -> list[dict]:
+        """n результатов: правильное видео на случайной позиции + «ремиксы», «каверы» и мусор."""
+        rng = random.Random(zlib.crc32(query.encode("utf-8")))
+        track = self.lookup(query)
+        entries = []
+        for k in range(n):
+            vid = f"x{zlib.crc32(f'{query}/{k}'.encode('utf-8')):08x}"
+            entries.append({
+                "id": vid,
+                "url": f"https://www.youtube.com/watch?v={vid}",
+                "title": f"Random Upload {rng.randint(1, 99999)}",
+                "uploader": "Random Channel",
+                "duration": rng.randint(60, 600),
+            })
+        if track is None:
+            return entries
+        missing = (zlib.crc32(track["id"].encode("utf-8")) % 1000) < self.miss_rate * 1000
+        first_artist = track["artist"].split(",")[0]
+        decoys = [
+            (f"{track['artist']} - {track['title']} (Remix)", track["duration_s"] + 40),
+            (f"{track['title']} - cover", track["duration_s"] + 3),
+            (f"{track['artist']} - {track['title']} (Live)", track["duration_s"] + 25),
+        ]
+        for k, (title, dur) in enumerate(decoys[:max(0, n - 1)]):
+            entries[k + 1].update(title=title, duration=dur, uploader=first_artist)
+        if not missing:
+            vid = f"ok{track['id']}"
+            entries[rng.randrange(n)].update(
+                id=vid,
+                url=f"https://www.youtube.com/watch?v={vid}",
+                title=f"{track['artist']} - {track['title']} (Official Audio)",
+                uploader=f"{first_artist} - Topic",
+                duration=track["duration_s"],
+            )
+        return entries
+
+
+def silent_mp3(seconds: float) -> bytes:
+    """Валидный MPEG-1 Layer III 128 kbps / 44.1 kHz из «пустых» кадров (mutagen его читает)."""
+    frame = b"\xff\xfb\x90\x00" + b"\x00" * (417 - 4)
+    return frame * max(1, int(seconds * 44100 / 1152))
+
+
+def cover_jpeg(size: int = 1000) -> bytes:
+    """Квадратная JPEG-обложка; без Pillow — пустые байты (теги запишутся без картинки)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b""
+    img = Image.new("RGB", (size, size))
+    px = img.load()
+    for y in range(0, size, 4):
+        for x in range(0, size, 4):
+            px[x, y] = (x % 256, y % 256, (x * y) % 256)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+class FakeSpotify:
+    """
+    Минимальный Spotify Web API на 127.0.0.1:
+      GET  /v1/playlists/<id>         — метаданные + первая страница треков
+      GET  /v1/playlists/<id>/tracks  — страницы по offset/limit (и /items, как в новом spotipy)
+      POST /api/token                 — client credentials
+      GET  /img/<n>.jpg               — обложки альбомов
+    ID плейлиста вида bench<N> отдаёт каталог из N треков.
+    """
+
+    def __init__(self, api: Latency, covers: Latency, miss_rate: float = 0.02):
+        self.api = api
+        self.covers = covers
+        self.miss_rate = miss_rate
+        self.catalogs: dict[int, Catalog] = {}
+        self._lock = threading.Lock()
+        self._cover = cover_jpeg()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def catalog(self, size: int) -> Catalog:
+        with self._lock:
+            if size not in self.catalogs:
+                self.catalogs[size] = Catalog(size, self.base_url, self.miss_rate)
+            return self.catalogs[size]
+
+    def playlist_url(self, size: int) -> str:
+        self.catalog(size)
+        return f"https://open.spotify.com/playlist/bench{size}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: bytes, ctype: str = "application/json", headers=None):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, data):
+                self._send(200, json.dumps(data).encode("utf-8"))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                if not fake.api.wait():
+                    return self._send(503, b"{}")
+                self._json({"access_token": "bench", "token_type": "Bearer", "expires_in": 3600})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.startswith("/img/"):
+                    if not fake.covers.wait():
+                        return self._send(503, b"")
+                    etag = '"bench-cover"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self._send(304, b"", "image/jpeg", headers={"ETag": etag})
+                    return self._send(200, fake._cover, "image/jpeg", headers={"ETag": etag})
+
+                # spotipy до 2.25 ходит за страницами в /tracks, новее — в /items
+                m = re.match(r"^/v1/playlists/bench(\d+)(/tracks|/items)?$", url.path)
+                if not m:
+                    return self._send(404, b'{"error": {"status": 404}}')
+                if not fake.api.wait():
+                    return self._send(503, b'{"error": {"status": 503}}', headers={"Retry-After": "0"})
+                cat = fake.catalog(int(m.group(1)))
+                qs = parse_qs(url.query)
+                if m.group(2):
+                    offset = int(qs.get("offset", ["0"])[0])
+                    limit = int(qs.get("limit", ["100"])[0])
+                    items = [cat.spotify_item(i) for i in range(offset, min(offset + limit, cat.size))]
+                    return self._json({"items": items, "offset": offset, "limit": limit, "total": cat.size})
+                items = [cat.spotify_item(i) for i in range(min(100, cat.size))]
+                self._json({
+                    "name": f"Bench {cat.size}",
+                    "owner": {"display_name": "bench"},
+                    "tracks": {"total": cat.size, "items": items},
+                })
+
+        return Handler
+
+
+class FakeYoutubeDLFactory:
+    """
+    Возвращает классы-подмены YoutubeDL для ydl_pool.set_factory():
+    поиск отвечает из каталога, download() пишет короткий MP3 по outtmpl.
+    """
+
+    def __init__(self, spotify: FakeSpotify, search: Latency, download: Latency,
+                 audio_seconds: float = 2.0, age_restricted_rate: float = 0.0):
+        self.spotify = spotify
+        self.search_latency = search
+        self.download_latency = download
+        self.audio = silent_mp3(audio_seconds)
+        self.age_restricted_rate = age_restricted_rate
+        self.instances = 0
+        self._lock = threading.Lock()
+
+    def _find(self, query: str):
+        for cat in self.spotify.catalogs.values():
+            if cat.lookup(query) is not None:
+                return cat
+        return next(iter(self.spotify.catalogs.values()), None)
+
+    def __call__(self, params: dict):
+        with self._lock:
+            self.instances += 1
+        return _FakeYoutubeDL(self, params)
+
+
+class _FakeYoutubeDL:
+    def __init__(self, factory: FakeYoutubeDLFactory, params: dict):
+        self.factory = factory
+        self.params = dict(params)
+        if isinstance(self.params.get("outtmpl"), str):
+            self.params["outtmpl"] = {"default": self.params["outtmpl"]}
+
+    def extract_info(self, url: str, download: bool = False):
+        f = self.factory
+        if download:
+            # загрузка одного видео: как у yt-dlp, путь к файлу — в requested_downloads
+            path = self._download_one(url)
+            return {"acodec": "mp3", "ext": "mp3", "requested_downloads": [{"filepath": path}]}
+        if not f.search_latency.wait():
+            raise Exception("HTTP Error 503: Service Unavailable")
+        m = re.match(r"^ytsearch(\d*):(.*)$", url, re.S)
+        if not m:
+            raise Exception(f"Unsupported URL: {url}")
+        n, query = int(m.group(1) or 1), m.group(2)
+        cat = f._find(query)
+        entries = cat.search(query, n) if cat is not None else []
+        return {"_type": "playlist", "entries": entries}
+
+    def _download_one(self, url: str) -> str:
+        f = self.factory
+        if not f.download_latency.wait():
+            raise Exception("HTTP Error 503: Service Unavailable")
+        if f.age_restricted_rate and (zlib.crc32(url.encode("utf-8")) % 1000) < f.age_restricted_rate * 1000:
+            raise Exception("ERROR: Sign in to confirm your age")
+        ext = "mp3"
+        for pp in self.params.get("postprocessors") or []:
+            if pp.get("key") == "FFmpegExtractAudio":
+                ext = pp.get("preferredcodec") or ext
+        path = (self.params.get("outtmpl") or {}).get("default", "%(id)s.%(ext)s")
+        path = path.replace("%(ext)s", ext).replace("%(id)s", url.rsplit("=", 1)[-1])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(f.audio)
+        return path
+
+    def download(self, urls):
+        for url in urls:
+            self._download_one(url)
+        return 0
+
+    def close(self):
+        pass
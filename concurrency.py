@@ -0,0 +1,173 @@
+import threading
+import time
+from typing import Callable, Optional
+
+import tracing
+
+# Адаптивное число одновременных поисков/загрузок (AIMD, как окно TCP).
+# Потоков у этапа конвейера запускается по верхней границе, но работать одновременно
+# может не больше limit — остальные ждут в acquire(). Раз в окно контроллер смотрит,
+# что было за это окно:
+#   - троттлинг YouTube (429, «not a bot», 403) → limit × 0.5;
+#   - много ошибок или латентность выросла вдвое против лучшей → limit × 0.75;
+#   - все слоты были заняты, а пропускная способность не упала → limit + 1;
+#   - иначе — без изменений.
+# Ошибки приходят не из результата этапа (трек «не найден» — не ошибка сети),
+# а из report(exc): его зовут обработчики исключений yt-dlp в том же потоке.
+# Ответы из кешей помечаются skip_sample() — иначе их микросекунды стали бы
+# «лучшей латентностью», и лимит резался бы без причины.
+
+THROTTLE_MARKERS = (
+    "429", "too many requests", "not a bot", "rate limit", "rate-limit",
+    "http error 403", "throttl", "temporarily unavailable",
+)
+
+WINDOW_S = 5.0
+MIN_SAMPLES = 4
+ERROR_RATE_DECREASE = 0.2
+LATENCY_FACTOR = 2.0
+
+_signal = threading.local()
+
+
+def classify(exc) -> str:
+    """"throttle" — YouTube ограничивает нас; "error" — прочий сбой."""
+    text = str(exc).lower()
+    return "throttle" if any(m in text for m in THROTTLE_MARKERS) else "error"
+
+
+def report(exc):
+    """Отмечает сбой в текущем потоке; учитывается при ближайшем release() этого потока."""
+    kind = classify(exc)
+    if getattr(_signal, "kind", None) != "throttle":
+        _signal.kind = kind
+
+
+def skip_sample():
+    """Текущая работа потока обошлась без сети (кеш) — в статистику окна её не берём."""
+    _signal.skip = True
+
+
+def _take_signal() -> tuple[Optional[str], bool]:
+    kind = getattr(_signal, "kind", None)
+    skip = getattr(_signal, "skip", False)
+    _signal.kind = None
+    _signal.skip = False
+    return kind, skip
+
+
+class AIMDLimit:
+    """Динамический лимит одновременной работы для одного этапа."""
+
+    def __init__(self, name: str, initial: int, lower: int, upper: int,
+                 window_s: Optional[float] = None, log: Optional[Callable[[str], None]] = None):
+        self.name = name
+        self.lower = max(1, int(lower))
+        self.upper = max(self.lower, int(upper))
+        self.limit = min(self.upper, max(self.lower, int(initial)))
+        self.window_s = WINDOW_S if window_s is None else window_s
+        self.log = log
+        self.decisions: list[dict] = []
+        self.samples = 0          # за весь прогон: сколько работ попало в выборку окна
+        self.skipped = 0          # и сколько отброшено skip_sample()
+        self._cond = threading.Condition()
+        self._active = 0
+        self._saturated = False
+        self._started = time.perf_counter()
+        self._window_start = self._started
+        self._last_cut = float("-inf")
+        self._reset_window()
+        self._best_latency: Optional[float] = None
+        self._prev_throughput: Optional[float] = None
+
+    def _reset_window(self):
+        self._samples = 0
+        self._errors = 0
+        self._throttles = 0
+        self._latency_sum = 0.0
+        self._saturated = self._active >= self.limit
+
+    def acquire(self):
+        _take_signal()   # сбросить всё, что поток отметил вне лимита
+        with self._cond:
+            if self._active >= self.limit:
+                self._saturated = True
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+            if self._active >= self.limit:
+                self._saturated = True
+
+    def release(self, latency: float, failed: bool = False):
+        signal, skip = _take_signal()
+        signal = signal or ("error" if failed else None)
+        with self._cond:
+            self._active -= 1
+            if skip and signal is None:
+                self.skipped += 1
+                self._cond.notify_all()
+                return
+            self.samples += 1
+            self._samples += 1
+            self._latency_sum += latency
+            if signal == "throttle":
+                self._throttles += 1
+            elif signal == "error":
+                self._errors += 1
+            now = time.perf_counter()
+            # на троттлинг реагируем сразу, но не чаще раза в окно — иначе пачка
+            # одновременных 429 срежет лимит до нижней границы
+            throttled_now = signal == "throttle" and now - self._last_cut >= self.window_s
+            if throttled_now or (now - self._window_start >= self.window_s and self._samples >= MIN_SAMPLES):
+                self._adjust(now)
+            self._cond.notify_all()
+
+    def _adjust(self, now: float):
+        elapsed = max(now - self._window_start, 1e-6)
+        throughput = self._samples / elapsed
+        latency = self._latency_sum / self._samples
+        error_rate = (self._errors + self._throttles) / self._samples
+        old = self.limit
+
+        if self._throttles:
+            new, reason = max(self.lower, int(old * 0.5)), "троттлинг"
+        elif error_rate > ERROR_RATE_DECREASE:
+            new, reason = max(self.lower, int(old * 0.75)), "ошибки"
+        elif self._best_latency is not None and latency > self._best_latency * LATENCY_FACTOR:
+            new, reason = max(self.lower, int(old * 0.75)), "латентность"
+        elif (self._saturated and old < self.upper
+              and (self._prev_throughput is None or throughput >= self._prev_throughput * 0.95)):
+            new, reason = old + 1, "рост"
+        else:
+            new, reason = old, None
+
+        if not self._throttles and self._errors == 0:
+            self._best_latency = latency if self._best_latency is None else min(self._best_latency, latency)
+        self._prev_throughput = throughput
+        self.limit = new
+        if new < old:
+            self._last_cut = now
+
+        if reason is not None and new != old:
+            decision = {
+                "t": round(now - self._started, 2), "stage": self.name, "from": old, "to": new,
+                "reason": reason, "throughput": round(throughput, 2), "latency_s": round(latency, 3),
+                "errors": self._errors, "throttles": self._throttles,
+            }
+            self.decisions.append(decision)
+            if self.log:
+                try:
+                    self.log(f"[{self.name}] {old} → {new}: {reason} "
+                             f"({throughput:.2f}/с, {latency:.2f} с, ошибок {self._errors}, "
+                             f"троттлинг {self._throttles})")
+                except Exception:
+                    pass
+        tracing.counter(f"limit.{self.name}", {"limit": self.limit})
+        self._window_start = now
+        self._reset_window()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {"limit": self.limit, "lower": self.lower, "upper": self.upper,
+                    "samples": self.samples, "skipped": self.skipped,
+                    "decisions": list(self.decisions)}
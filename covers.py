@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from app_config import _config_dir
+from http_pools import ConnectionStats
+from singleflight import SingleFlight
+import tracing
+import rate_limit
+
+COVER_SIZE = 640
+COVER_MAX_BYTES = 400 * 1024
+
+MEMORY_CACHE_ITEMS = 64                  # ~64 альбома × ≤400KB в памяти
+DISK_CACHE_DIR = "cover_cache"
+DISK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Обложки качаются через общий пул keep-alive соединений (urllib3, приходит вместе с
+# requests/spotipy) вместо нового TCP+TLS на каждую. Пул ограничен: на хост не больше
+# POOL_PER_HOST соединений, лишние потоки ждут свободное. Запись на диске старше
+# REVALIDATE_AFTER_S переспрашивается условным запросом (ETag / Last-Modified): 304 —
+# берём файл с диска без скачивания и без повторной нормализации.
+POOL_HOSTS = 8            # i.scdn.co, i.ytimg.com, ... — пулов одновременно
+POOL_PER_HOST = 4
+FETCH_TIMEOUT_S = 20
+REVALIDATE_AFTER_S = 30 * 24 * 3600
+
+# Статистика: сколько байт не скачали и сколько CPU не потратили на нормализацию
+STATS = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "fetches": 0,
+    "shared_waits": 0,
+    "bytes_saved": 0,
+    "cpu_saved_s": 0.0,
+    "not_modified": 0,
+}
+
+_lock = threading.Lock()
+_memory: "OrderedDict[str, tuple[bytes, int, float]]" = OrderedDict()
+_flight = SingleFlight()
+_disk_writes = 0
+_http = None
+_connections = ConnectionStats()
+
+
+def _count(name: str, value=1):
+    with _lock:
+        STATS[name] += value
+
+
+def _disk_dir() -> str:
+    path = os.path.join(_config_dir(), DISK_CACHE_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _disk_paths(url: str) -> tuple[str, str]:
+    h = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    base = os.path.join(_disk_dir(), h)
+    return base + ".jpg", base + ".json"
+
+
+def _memory_get(url: str):
+    with _lock:
+        item = _memory.get(url)
+        if item is not None:
+            _memory.move_to_end(url)
+        return item
+
+
+def _memory_put(url: str, item: tuple[bytes, int, float]):
+    with _lock:
+        _memory[url] = item
+        _memory.move_to_end(url)
+        while len(_memory) > MEMORY_CACHE_ITEMS:
+            _memory.popitem(last=False)
+
+
+def _disk_get(url: str):
+    img_path, meta_path = _disk_paths(url)
+    try:
+        with open(img_path, "rb") as f:
+            data = f.read()
+        meta = {}
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception:
+            pass
+        os.utime(img_path, None)  # для вытеснения по давности использования
+        return (data, int(meta.get("raw_bytes", 0)), float(meta.get("cpu_s", 0.0))), meta
+    except OSError:
+        return None
+
+
+def _write_meta(meta_path: str, meta: dict):
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _disk_put(url: str, item: tuple[bytes, int, float], validators: dict | None = None):
+    global _disk_writes
+    data, raw_bytes, cpu_s = item
+    img_path, meta_path = _disk_paths(url)
+    try:
+        tmp = img_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, img_path)
+        _write_meta(meta_path, {"url": url, "raw_bytes": raw_bytes, "cpu_s": cpu_s,
+                                "checked_at": time.time(), **(validators or {})})
+    except OSError:
+        return
+    with _lock:
+        _disk_writes += 1
+        need_evict = _disk_writes % 50 == 0
+    if need_evict:
+        _evict_disk()
+
+
+def _evict_disk():
+    try:
+        d = _disk_dir()
+        files = []
+        total = 0
+        for name in os.listdir(d):
+            if not name.endswith(".jpg"):
+                continue
+            p = os.path.join(d, name)
+            st = os.stat(p)
+            files.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        files.sort()
+        for _, size, p in files:
+            if total <= DISK_CACHE_MAX_BYTES:
+                break
+            for victim in (p, p[:-4] + ".json"):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+    except OSError:
+        pass
+
+
+class CoverHTTPError(Exception):
+    """Сервер обложек ответил кодом ≥ 400. status и headers читает rate_limit (429, Retry-After)."""
+
+    def __init__(self, url: str, status: int, headers=None):
+        super().__init__(f"HTTP Error {status}: {url}")
+        self.status = status
+        self.headers = headers
+
+
+def _pool():
+    """Общий на процесс urllib3.PoolManager (создаётся при первой обложке)."""
+    global _http
+    with _lock:
+        if _http is None:
+            import urllib3
+            _http = _connections.install(urllib3.PoolManager(
+                num_pools=POOL_HOSTS, maxsize=POOL_PER_HOST, block=True,
+                timeout=urllib3.Timeout(total=FETCH_TIMEOUT_S),
+                # соединение, которое сервер закрыл между запросами, переоткрываем один раз
+                retries=urllib3.Retry(total=None, connect=1, read=1, redirect=5, status=0),
+                headers={"User-Agent": "Mozilla/5.0"},
+            ))
+        return _http
+
+
+def _fetch_once(url: str, etag: str | None = None, last_modified: str | None = None):
+    """(сырые байты или None при 304, {"etag", "last_modified"} ответа)."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    resp = _pool().request("GET", url, headers=headers)
+    if resp.status >= 400:
+        raise CoverHTTPError(url, resp.status, resp.headers)
+    validators = {k: v for k, v in (("etag", resp.headers.get("ETag")),
+                                    ("last_modified", resp.headers.get("Last-Modified"))) if v}
+    if resp.status == 304:
+        return None, validators
+    return resp.data, validators
+
+
+def fetch(url: str, etag: str | None = None, last_modified: str | None = None):
+    return rate_limit.call("cover", _fetch_once, url, etag, last_modified)
+
+
+def fetch_raw(url: str) -> bytes:
+    return fetch(url)[0]
+
+
+# Ступени качества JPEG (как у прежнего линейного цикла 88 → 58 с шагом 6)
+QUALITY_STEPS = (88, 82, 76, 70, 64, 58)
+
+
+def _is_ready_jpeg(img, raw: bytes) -> bool:
+    """Уже baseline JPEG 640×640 RGB без поворота по EXIF и в пределах лимита — перекодировать незачем."""
+    if img.format != "JPEG" or img.mode != "RGB" or img.size != (COVER_SIZE, COVER_SIZE):
+        return False
+    if len(raw) > COVER_MAX_BYTES:
+        return False
+    if img.info.get("progressive") or img.info.get("progression"):
+        return False
+    try:
+        if img.getexif().get(0x0112, 1) != 1:
+            return False
+    except Exception:
+        return False
+    return True
+
+
+def _encode_bounded(img) -> bytes:
+    """Подбор качества: сначала 88 (обычно сразу влезает), иначе бинарный поиск по ступеням."""
+    encoded: dict[int, bytes] = {}
+
+    def enc(q):
+        if q not in encoded:
+            buf = BytesIO()
+            img.save(buf, format="JPEG", quality=q, optimize=True, progressive=False, subsampling="4:2:0")
+            encoded[q] = buf.getvalue()
+        return encoded[q]
+
+    best = enc(QUALITY_STEPS[0])
+    if len(best) <= COVER_MAX_BYTES:
+        return best
+    # размер монотонно падает с качеством: ищем самое высокое качество, которое влезает
+    lo, hi = 1, len(QUALITY_STEPS) - 1
+    fit = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        out = enc(QUALITY_STEPS[mid])
+        if len(out) <= COVER_MAX_BYTES:
+            fit = out
+            hi = mid - 1
+        else:
+            lo = mid + 1
+    return fit if fit is not None else enc(QUALITY_STEPS[-1])
+
+
+def normalize_jpeg(raw: bytes) -> bytes:
+    """Центр-кроп до COVER_SIZE×COVER_SIZE, RGB, baseline JPEG < ~COVER_MAX_BYTES."""
+    from PIL import Image, ImageOps
+
+    img = Image.open(BytesIO(raw))
+    if _is_ready_jpeg(img, raw):
+        return raw
+    if img.format == "JPEG":
+        # Большие JPEG (превью YouTube 1280×720 и т.п.) декодируем сразу в уменьшенном
+        # масштабе (1/2, 1/4, 1/8) — но так, чтобы сторона квадрата осталась ≥ COVER_SIZE
+        w, h = img.size
+        side = min(w, h)
+        if side >= COVER_SIZE * 2:
+            img.draft("RGB", (w * COVER_SIZE // side, h * COVER_SIZE // side))
+    try:
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        pass
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    w, h = img.size
+    side = min(w, h)
+    left = (w - side) // 2
+    top  = (h - side) // 2
+    img = img.crop((left, top, left + side, top + side))
+    if img.size != (COVER_SIZE, COVER_SIZE):
+        img = img.resize((COVER_SIZE, COVER_SIZE), Image.LANCZOS)
+    return _encode_bounded(img)
+
+
+def _revalidate(url: str, meta: dict) -> tuple[bool, bytes | None, dict]:
+    """
+    Условный запрос для устаревшей записи диска: (запись годится, новые сырые байты, валидаторы).
+    Без ETag/Last-Modified или при сбое сети запись остаётся как есть — так было и до проверок.
+    """
+    etag, last_modified = meta.get("etag"), meta.get("last_modified")
+    if not (etag or last_modified) or time.time() - float(meta.get("checked_at", 0)) < REVALIDATE_AFTER_S:
+        return True, None, {}
+    try:
+        with tracing.span("cover.revalidate"):
+            raw, validators = fetch(url, etag, last_modified)
+    except Exception:
+        return True, None, {}
+    if raw is None:
+        _count("not_modified")
+        try:
+            _write_meta(_disk_paths(url)[1], {**meta, **validators, "checked_at": time.time()})
+        except OSError:
+            pass
+        return True, None, {}
+    return False, raw, validators
+
+
+def _load(url: str) -> tuple[bytes, int, float]:
+    raw, validators = None, {}
+    cached = _disk_get(url)
+    if cached is not None:
+        item, meta = cached
+        fresh, raw, validators = _revalidate(url, meta)
+        if fresh:
+            _count("disk_hits")
+            _count("bytes_saved", item[1])
+            _count("cpu_saved_s", item[2])
+            _memory_put(url, item)
+            return item
+
+    if raw is None:
+        with tracing.span("cover.fetch"):
+            raw, validators = fetch(url)
+    _count("fetches")
+    started = time.thread_time()
+    with tracing.span("cover.encode", raw_bytes=len(raw)):
+        data = normalize_jpeg(raw)
+    item = (data, len(raw), time.thread_time() - started)
+    _memory_put(url, item)
+    _disk_put(url, item, validators)
+    return item
+
+
+def get_cover(url: str) -> tuple[bytes, str, str]:
+    """
+    Обложка в «плеер-совместимом» виде: (bytes, mime, ext), пустые строки — если не получилось.
+    Порядок: память (LRU) → диск → сеть. Одновременные запросы одного URL
+    ждут единственную загрузку вместо параллельных.
+    """
+    if not url:
+        return b"", "", ""
+    item = _memory_get(url)
+    if item is not None:
+        _count("memory_hits")
+        _count("bytes_saved", item[1])
+        _count("cpu_saved_s", item[2])
+        return item[0], "image/jpeg", "jpg"
+    try:
+        item, shared = _flight.do(url, lambda: _load(url))
+    except Exception:
+        return b"", "", ""
+    if shared:
+        _count("shared_waits")
+        _count("bytes_saved", item[1])
+        _count("cpu_saved_s", item[2])
+    return item[0], "image/jpeg", "jpg"
+
+
+def stats_snapshot() -> dict:
+    with _lock:
+        out = dict(STATS)
+    out.update(_connections.snapshot())
+    return out
+
+
+def clear():
+    """Очищает кеш обложек в памяти и на диске."""
+    with _lock:
+        _memory.clear()
+    try:
+        d = _disk_dir()
+        for name in os.listdir(d):
+            try:
+                os.remove(os.path.join(d, name))
+            except OSError:
+                pass
+    except OSError:
+        pass
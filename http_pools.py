@@ -0,0 +1,47 @@
+import threading
+
+# Счётчики keep-alive соединений для пулов urllib3 (обложки, сессия Spotify).
+# Считаются нарастающим итогом в момент события — открыто новое соединение или отправлен
+# запрос, — а не по живым пулам: PoolManager держит не больше num_pools пулов и
+# вытесняет старые вместе с их num_connections/num_requests.
+# urllib3 импортируется только в install(), когда пул уже создаётся.
+
+
+class ConnectionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def install(self, manager):
+        """Подменяет классы пулов у urllib3.PoolManager (в т.ч. requests' adapter.poolmanager) на считающие."""
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+        stats = self
+
+        def counted(base):
+            class CountedPool(base):
+                def _new_conn(self):
+                    stats._count("opened")
+                    return super()._new_conn()
+
+                def _make_request(self, *args, **kwargs):
+                    stats._count("requests")
+                    return super()._make_request(*args, **kwargs)
+
+            CountedPool.__name__ = f"Counted{base.__name__}"
+            return CountedPool
+
+        manager.pool_classes_by_scheme = {"http": counted(HTTPConnectionPool),
+                                          "https": counted(HTTPSConnectionPool)}
+        return manager
+
+    def snapshot(self) -> dict:
+        """{"connections": открыто, "connections_reused": запросов по уже открытым}."""
+        with self._lock:
+            opened, requests = self.opened, self.requests
+        return {"connections": opened, "connections_reused": max(0, requests - opened)}
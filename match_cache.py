@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from typing import Optional
+
+from app_config import _config_dir
+
+CACHE_FILE = "match_cache.sqlite3"
+
+DEFAULT_TTL = 30 * 24 * 3600           # найденные совпадения живут 30 дней
+DEFAULT_NEGATIVE_TTL = 24 * 3600       # «ничего не нашлось» — сутки, потом пробуем снова
+DEFAULT_MAX_ENTRIES = 50000
+
+# Что храним из entry yt-dlp: этого хватает и для загрузки, и для отладки
+_ENTRY_FIELDS = ("id", "url", "title", "uploader", "channel", "duration")
+
+def normalize_text(s: str) -> str:
+    s = unicodedata.normalize("NFKC", s or "").casefold()
+    return re.sub(r"\s+", " ", s).strip()
+
+def cache_key(track_info: dict) -> tuple[str, str]:
+    """(нормализованные «артист|название», Spotify ID или пустая строка)."""
+    norm = f"{normalize_text(track_info.get('artist', ''))}|{normalize_text(track_info.get('title', ''))}"
+    return norm, track_info.get("id") or ""
+
+
+class MatchCache:
+    """
+    Постоянный кеш «трек Spotify → видео YouTube» в SQLite рядом с config.json.
+    Хранит score/длительность/время, умеет TTL, ограничение размера (вытесняются
+    давно не использованные) и отрицательные записи для треков без совпадения.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_TTL,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path or os.path.join(_config_dir(), CACHE_FILE)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            " norm TEXT NOT NULL,"
+            " track_id TEXT NOT NULL,"
+            " entry TEXT,"
+            " score REAL,"
+            " duration REAL,"
+            " created REAL NOT NULL,"
+            " used REAL NOT NULL,"
+            " PRIMARY KEY (norm, track_id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS matches_used ON matches(used)")
+        self.purge_expired()
+
+    def get(self, track_info: dict) -> tuple[bool, Optional[dict]]:
+        """Возвращает (нашли_в_кеше, entry). entry=None при попадании — отрицательная запись."""
+        norm, track_id = cache_key(track_info)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT entry, created FROM matches WHERE norm=? AND track_id=?", (norm, track_id)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return False, None
+            entry_json, created = row
+            ttl = self.ttl if entry_json else self.negative_ttl
+            if created + ttl < now:
+                self._db.execute("DELETE FROM matches WHERE norm=? AND track_id=?", (norm, track_id))
+                self.misses += 1
+                return False, None
+            self._db.execute("UPDATE matches SET used=? WHERE norm=? AND track_id=?", (now, norm, track_id))
+            self.hits += 1
+        return True, (json.loads(entry_json) if entry_json else None)
+
+    def put(self, track_info: dict, entry: Optional[dict], score: Optional[float] = None):
+        """Сохраняет совпадение (или отрицательную запись, если entry=None)."""
+        norm, track_id = cache_key(track_info)
+        now = time.time()
+        entry_json = None
+        duration = None
+        if entry:
+            entry_json = json.dumps({k: entry.get(k) for k in _ENTRY_FIELDS}, ensure_ascii=False)
+            duration = entry.get("duration")
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO matches (norm, track_id, entry, score, duration, created, used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (norm, track_id, entry_json, score, duration, now, now),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict_locked()
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM matches WHERE (entry IS NOT NULL AND created < ?) OR (entry IS NULL AND created < ?)",
+                (now - self.ttl, now - self.negative_ttl),
+            )
+            self._evict_locked()
+
+    def _evict_locked(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM matches").fetchone()
+        extra = count - self.max_entries
+        if extra > 0:
+            self._db.execute(
+                "DELETE FROM matches WHERE rowid IN (SELECT rowid FROM matches ORDER BY used ASC LIMIT ?)",
+                (extra,),
+            )
+
+    def size(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM matches").fetchone()
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM matches")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {"size": self.size(), "hits": self.hits, "misses": self.misses}
+
+
+_instance: Optional[MatchCache] = None
+_instance_failed = False
+_instance_lock = threading.Lock()
+
+def get_match_cache() -> Optional[MatchCache]:
+    """Общий экземпляр кеша. None — если файл БД открыть не удалось (тогда работаем без него)."""
+    global _instance, _instance_failed
+    if _instance is None and not _instance_failed:
+        with _instance_lock:
+            if _instance is None and not _instance_failed:
+                try:
+                    _instance = MatchCache()
+                except Exception:
+                    _instance_failed = True
+    return _instance
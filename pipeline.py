@@ -0,0 +1,319 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+# Результат функции этапа:
+#   NEXT — передать задание на следующий этап (после последнего — задание завершено),
+#   DONE — задание завершено на этом этапе (успех/ошибка этап пишет в само задание);
+#   RETRY — повторить этот же этап позже, через job["retry_in"] секунд. Задание ждёт
+#           в отложенной очереди, а не в потоке — остальные треки идут своим чередом;
+#   WAIT — то же, но это не повтор после сбоя, а опрос «занято другим заданием»:
+#          не считается в retries и не попадает в латентности этапа;
+#   HOLD — отложить задание до release_held() (например, ждёт новых cookies). Когда
+#          незавершёнными остаются только такие задания, wait() зовёт on_idle, а кого
+#          тот не вернул в работу — завершает как есть.
+NEXT = "next"
+DONE = "done"
+RETRY = "retry"
+WAIT = "wait"
+HOLD = "hold"
+
+_STOP = object()
+
+
+class Stage:
+    """Один этап конвейера: свой пул воркеров и своя ограниченная очередь."""
+
+    def __init__(self, name: str, func: Callable[[dict], str], workers: int, maxsize: int, limiter=None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        # limiter (concurrency.AIMDLimit) — сколько из workers потоков реально работают одновременно
+        self.limiter = limiter
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(maxsize)))
+        self.threads: list[threading.Thread] = []
+        self.processed = 0
+        self.retries = 0
+        self.busy_seconds = 0.0
+        self.first_at: Optional[float] = None
+        self.last_at: Optional[float] = None
+        self.latencies: list[float] = []
+        self._lock = threading.Lock()
+
+    def _record(self, started: float, finished: float):
+        with self._lock:
+            self.processed += 1
+            self.busy_seconds += finished - started
+            self.latencies.append(finished - started)
+            if self.first_at is None:
+                self.first_at = finished
+            self.last_at = finished
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class Pipeline:
+    """
+    Потоковый конвейер «этап → очередь → этап».
+    Задания (dict) проходят этапы по порядку, каждый этап обслуживает свой пул потоков.
+    Очереди ограничены, поэтому быстрый этап упирается в медленный (backpressure),
+    а не копит в памяти весь плейлист.
+    """
+
+    def __init__(self, on_done: Optional[Callable[[dict], None]] = None,
+                 on_stage: Optional[Callable[[str, dict], None]] = None,
+                 on_worker_exit: Optional[Callable[[], None]] = None,
+                 on_idle: Optional[Callable[[int], None]] = None):
+        self.stages: list[Stage] = []
+        self.on_done = on_done
+        self.on_stage = on_stage
+        self.on_worker_exit = on_worker_exit
+        self.on_idle = on_idle
+        self.started_at: Optional[float] = None
+        self.first_done_at: Optional[float] = None
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._running = False
+        # отложенные повторы: куча (когда, №, индекс этапа, задание) и поток-планировщик
+        self._delayed: list = []
+        self._delayed_seq = itertools.count()
+        self._delayed_cond = threading.Condition()
+        self._scheduler: Optional[threading.Thread] = None
+        self._stopping = False
+        # задания, отложенные результатом HOLD: (индекс этапа, задание)
+        self._held: list = []
+
+    def add_stage(self, name: str, func: Callable[[dict], str], workers: int = 1,
+                  maxsize: Optional[int] = None, limiter=None) -> Stage:
+        """
+        limiter — динамический лимит (concurrency.AIMDLimit): потоков запускается
+        по его верхней границе, а работают одновременно не больше limiter.limit.
+        """
+        if self._running:
+            raise RuntimeError("Нельзя добавлять этапы в запущенный конвейер")
+        if limiter is not None:
+            workers = limiter.upper
+            maxsize = maxsize if maxsize is not None else limiter.limit * 2
+        workers = max(1, int(workers))
+        stage = Stage(name, func, workers, maxsize if maxsize is not None else workers * 2, limiter)
+        self.stages.append(stage)
+        return stage
+
+    def stage(self, name: str) -> Stage:
+        for st in self.stages:
+            if st.name == name:
+                return st
+        raise KeyError(name)
+
+    def stage_stats(self) -> dict:
+        """{этап: {count, retries, busy_s, p50, p90, p99}} — латентности обработки одного задания, в секундах."""
+        out = {}
+        for st in self.stages:
+            with st._lock:
+                lat = list(st.latencies)
+                out[st.name] = {
+                    "count": st.processed,
+                    "retries": st.retries,
+                    "busy_s": st.busy_seconds,
+                    "p50": percentile(lat, 50),
+                    "p90": percentile(lat, 90),
+                    "p99": percentile(lat, 99),
+                }
+        return out
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._stopping = False
+        self.started_at = time.perf_counter()
+        self._scheduler = threading.Thread(target=self._schedule_loop, name="retry-scheduler", daemon=True)
+        self._scheduler.start()
+        for idx, st in enumerate(self.stages):
+            for n in range(st.workers):
+                t = threading.Thread(target=self._worker, args=(idx,), name=f"{st.name}-{n}", daemon=True)
+                st.threads.append(t)
+                t.start()
+
+    def submit(self, job: dict, stage: Optional[str] = None):
+        """Кладёт задание в очередь этапа (по умолчанию — первого). Блокируется, если очередь полна."""
+        with self._cond:
+            self._pending += 1
+        idx = 0 if stage is None else self.stages.index(self.stage(stage))
+        self.stages[idx].queue.put(job)
+
+    def wait(self):
+        """
+        Ждёт, пока все отправленные задания не будут завершены.
+        Если остались только отложенные (HOLD) — зовёт on_idle(их число): он может
+        вернуть их в работу через release_held(); оставшиеся завершаются как есть.
+        """
+        while True:
+            with self._cond:
+                while self._pending > 0 and not self._only_held():
+                    self._cond.wait()
+                if self._pending <= 0:
+                    return
+                held = len(self._held)
+            if self.on_idle:
+                try:
+                    self.on_idle(held)
+                except Exception:
+                    pass
+            with self._cond:
+                if not self._only_held():
+                    continue
+                held, self._held = self._held, []
+            for _, job in held:
+                self._finish(job)
+
+    def _only_held(self) -> bool:
+        return bool(self._held) and len(self._held) >= self._pending
+
+    def held_count(self) -> int:
+        with self._cond:
+            return len(self._held)
+
+    def release_held(self, stage: Optional[str] = None,
+                     prepare: Optional[Callable[[dict], None]] = None) -> int:
+        """
+        Возвращает отложенные (HOLD) задания в работу: на этап stage (по умолчанию —
+        тот, что их отложил). prepare(job) — поправить задание перед повтором.
+        """
+        with self._cond:
+            held, self._held = self._held, []
+        for idx, job in held:
+            if prepare:
+                prepare(job)
+            target = idx if stage is None else self.stages.index(self.stage(stage))
+            # через планировщик: очередь этапа может быть полна, а звать нас могут откуда угодно
+            self.retry_later(job, target, 0.0)
+        return len(held)
+
+    def close(self):
+        """Останавливает воркеры всех этапов (после wait())."""
+        if not self._running:
+            return
+        with self._delayed_cond:
+            self._stopping = True
+            self._delayed_cond.notify_all()
+        if self._scheduler is not None:
+            self._scheduler.join()
+            self._scheduler = None
+        for st in self.stages:
+            for _ in range(st.workers):
+                st.queue.put(_STOP)
+        for st in self.stages:
+            for t in st.threads:
+                t.join()
+            st.threads = []
+        self._running = False
+
+    def run(self, jobs: Iterable[dict]):
+        """Полный прогон: запуск, подача заданий (с backpressure), ожидание, остановка."""
+        self.start()
+        try:
+            for job in jobs:
+                self.submit(job)
+        finally:
+            # даже если источник заданий упал — доделываем уже отправленные
+            self.wait()
+            self.close()
+
+    def _worker(self, idx: int):
+        st = self.stages[idx]
+        while True:
+            job = st.queue.get()
+            if job is _STOP:
+                if self.on_worker_exit:
+                    try:
+                        self.on_worker_exit()
+                    except Exception:
+                        pass
+                break
+            if st.limiter is not None:
+                st.limiter.acquire()
+            started = time.perf_counter()
+            crashed = False
+            try:
+                res = st.func(job)
+            except Exception as e:
+                job.setdefault("error", f"ошибка этапа {st.name}: {e}")
+                res = DONE
+                crashed = True
+            finished = time.perf_counter()
+            if st.limiter is not None:
+                st.limiter.release(finished - started, crashed)
+            if res == WAIT:
+                self.retry_later(job, idx, job.pop("retry_in", 1.0))
+                continue
+            st._record(started, finished)
+            if res == RETRY:
+                with st._lock:
+                    st.retries += 1
+                self.retry_later(job, idx, job.pop("retry_in", 1.0))
+                continue
+            if res == HOLD:
+                with self._cond:
+                    self._held.append((idx, job))
+                    self._cond.notify_all()
+                continue
+            if self.on_stage:
+                try:
+                    self.on_stage(st.name, job)
+                except Exception:
+                    pass
+            if res == NEXT and idx + 1 < len(self.stages):
+                self.stages[idx + 1].queue.put(job)
+            else:
+                self._finish(job)
+
+    def retry_later(self, job: dict, stage_idx: int, delay: float):
+        """Вернёт задание в очередь этапа stage_idx через delay секунд (задание остаётся незавершённым)."""
+        with self._delayed_cond:
+            heapq.heappush(self._delayed, (time.perf_counter() + max(0.0, delay),
+                                           next(self._delayed_seq), stage_idx, job))
+            self._delayed_cond.notify()
+
+    def delayed_count(self) -> int:
+        with self._delayed_cond:
+            return len(self._delayed)
+
+    def _schedule_loop(self):
+        while True:
+            with self._delayed_cond:
+                while not self._stopping:
+                    if self._delayed:
+                        wait = self._delayed[0][0] - time.perf_counter()
+                        if wait <= 0:
+                            break
+                        self._delayed_cond.wait(wait)
+                    else:
+                        self._delayed_cond.wait()
+                if self._stopping:
+                    return
+                _, _, stage_idx, job = heapq.heappop(self._delayed)
+            # put вне блокировки: очередь этапа может быть полна (backpressure)
+            self.stages[stage_idx].queue.put(job)
+
+    def _finish(self, job: dict):
+        if self.first_done_at is None and not job.get("error"):
+            self.first_done_at = time.perf_counter()
+        if self.on_done:
+            try:
+                self.on_done(job)
+            except Exception:
+                pass
+        with self._cond:
+            self._pending -= 1
+            if self._pending <= 0 or self._only_held():
+                self._cond.notify_all()
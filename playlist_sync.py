@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+from typing import Callable, Iterable, Optional
+
+from audio_formats import ALL_EXTS
+
+# Манифест лежит прямо в папке плейлиста: Spotify ID трека → файл.
+# По нему повторный запуск качает только добавленные треки и видит удалённые.
+MANIFEST_NAME = ".spotydown.json"
+KNOWN_EXTS = ALL_EXTS
+SAVE_EVERY = 25
+
+
+def track_key(track: dict) -> str:
+    """Spotify ID; у локальных/недоступных треков ID нет — тогда «артист - название»."""
+    return track.get("id") or f"local:{track.get('artist', '')} - {track.get('title', '')}"
+
+
+class SyncManifest:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.tracks: dict[str, dict] = {}
+        self.playlist_url: Optional[str] = None
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.tracks = dict(data.get("tracks") or {})
+            self.playlist_url = data.get("playlist_url")
+        except Exception:
+            self.tracks = {}
+
+    def save(self):
+        with self._lock:
+            data = {
+                "playlist_url": self.playlist_url,
+                "updated": int(time.time()),
+                "tracks": self.tracks,
+            }
+            self._dirty = 0
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def has(self, track: dict) -> bool:
+        """Трек уже скачан: есть в манифесте и файл на месте."""
+        with self._lock:
+            entry = self.tracks.get(track_key(track))
+        return bool(entry) and os.path.exists(os.path.join(self.folder, entry["file"]))
+
+    def add(self, track: dict, file_path: str):
+        with self._lock:
+            self.tracks[track_key(track)] = {
+                "file": os.path.basename(file_path),
+                "artist": track.get("artist", ""),
+                "title": track.get("title", ""),
+            }
+            self._dirty += 1
+            need_save = self._dirty >= SAVE_EVERY
+        if need_save:
+            self.save()
+
+    def adopt_existing(self, tracks: Iterable[dict], file_name: Callable[[dict, str], str]):
+        """Папка от старой версии без манифеста: уже лежащие файлы считаем скачанными."""
+        for track in tracks:
+            if track_key(track) in self.tracks:
+                continue
+            for ext in KNOWN_EXTS:
+                name = file_name(track, ext)
+                if os.path.exists(os.path.join(self.folder, name)):
+                    self.add(track, name)
+                    break
+
+    def removed(self, current_keys: set[str]) -> list[tuple[str, dict]]:
+        """Треки из манифеста, которых больше нет в плейлисте."""
+        with self._lock:
+            return [(k, v) for k, v in self.tracks.items() if k not in current_keys]
+
+    def prune(self, keys: Iterable[str]) -> int:
+        """Удаляет файлы и записи для указанных треков. Возвращает число удалённых файлов."""
+        deleted = 0
+        for key in keys:
+            with self._lock:
+                entry = self.tracks.pop(key, None)
+                self._dirty += 1
+            if not entry:
+                continue
+            try:
+                os.remove(os.path.join(self.folder, entry["file"]))
+                deleted += 1
+            except OSError:
+                pass
+        return deleted
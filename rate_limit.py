@@ -0,0 +1,198 @@
+import email.utils
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+# Общие на весь процесс ограничители частоты запросов (token bucket) по категориям:
+#   search  — запросы ytsearch к YouTube,
+#   spotify — вызовы Spotify Web API,
+#   cover   — загрузка обложек.
+# Каждый поток перед запросом берёт жетон своей категории; жетоны пополняются
+# со скоростью rate в секунду, запас — burst. На 429 категория целиком
+# «засыпает»: на Retry-After, если сервер его прислал, иначе на экспоненциально
+# растущую паузу (сбрасывается после первого успешного запроса).
+
+DEFAULT_RATES = {"search": 10.0, "spotify": 10.0, "cover": 20.0}   # запросов в секунду, 0 — без ограничения
+BURST_SECONDS = 1.0      # запас жетонов = rate × BURST_SECONDS (но не меньше 1)
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 60.0
+RETRIES = 3
+
+LIMITED_MARKERS = ("429", "too many requests", "rate limit")
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float):
+        self.name = name
+        self._lock = threading.Lock()
+        self.configure(rate)
+        self._blocked_until = 0.0
+        self._failures = 0
+        self.stats = {"requests": 0, "waits": 0, "wait_s": 0.0, "limited": 0, "backoff_s": 0.0}
+
+    def configure(self, rate: float):
+        with self._lock:
+            self.rate = max(0.0, float(rate or 0))
+            self.burst = max(1.0, self.rate * BURST_SECONDS)
+            self._tokens = self.burst
+            self._updated = time.monotonic()
+
+    def acquire(self):
+        """Берёт жетон; если жетонов нет или категория на паузе после 429 — ждёт."""
+        with self._lock:
+            now = time.monotonic()
+            self.stats["requests"] += 1
+            delay = max(0.0, self._blocked_until - now)
+            if self.rate > 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # жетон резервируется сразу (баланс может уйти в минус) — ждём уже без блокировки
+                self._tokens -= 1
+                if self._tokens < 0:
+                    delay = max(delay, -self._tokens / self.rate)
+            if delay > 0:
+                self.stats["waits"] += 1
+                self.stats["wait_s"] += delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        """Пауза для всей категории после 429. Возвращает её длительность в секундах."""
+        with self._lock:
+            self._failures += 1
+            if retry_after is None:
+                delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (self._failures - 1))
+                delay *= random.uniform(0.8, 1.2)
+            else:
+                delay = min(BACKOFF_MAX_S, max(0.0, retry_after))
+            until = time.monotonic() + delay
+            if until > self._blocked_until:
+                self.stats["backoff_s"] += until - max(self._blocked_until, time.monotonic())
+                self._blocked_until = until
+            self.stats["limited"] += 1
+            return delay
+
+    def success(self):
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket(name: str) -> TokenBucket:
+    b = _buckets.get(name)
+    if b is None:
+        with _buckets_lock:
+            b = _buckets.get(name)
+            if b is None:
+                b = _buckets[name] = TokenBucket(name, DEFAULT_RATES.get(name, 0.0))
+    return b
+
+
+def configure(rates: Optional[dict]):
+    """rates — {категория: запросов в секунду}; неизвестные категории тоже допустимы."""
+    for name, rate in (rates or {}).items():
+        try:
+            bucket(name).configure(float(rate))
+        except (TypeError, ValueError):
+            pass
+
+
+def acquire(name: str):
+    bucket(name).acquire()
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Retry-After: число секунд или HTTP-дата."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        dt = email.utils.parsedate_to_datetime(str(value))
+        return max(0.0, dt.timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _headers_of(exc):
+    for obj in (exc, getattr(exc, "response", None)):
+        headers = getattr(obj, "headers", None) or getattr(obj, "hdrs", None)
+        if headers:
+            return headers
+    return None
+
+
+def _causes(exc):
+    # yt-dlp заворачивает исходную HTTPError в DownloadError.exc_info
+    seen = 0
+    while exc is not None and seen < 5:
+        yield exc
+        info = getattr(exc, "exc_info", None)
+        nested = info[1] if isinstance(info, tuple) and len(info) > 1 else None
+        exc = nested or exc.__cause__ or exc.__context__
+        seen += 1
+
+
+def is_rate_limited(exc) -> bool:
+    for e in _causes(exc):
+        status = getattr(e, "http_status", None) or getattr(e, "code", None) or getattr(e, "status", None)
+        if status == 429:
+            return True
+    text = str(exc).lower()
+    return any(m in text for m in LIMITED_MARKERS)
+
+
+def retry_after_of(exc) -> Optional[float]:
+    for e in _causes(exc):
+        headers = _headers_of(e)
+        if headers:
+            try:
+                value = headers.get("Retry-After") or headers.get("retry-after")
+            except Exception:
+                value = None
+            if value is not None:
+                return parse_retry_after(value)
+    return None
+
+
+def call(name: str, fn: Callable, *args, retries: int = RETRIES,
+         on_limited: Optional[Callable[[Exception], None]] = None, **kwargs):
+    """
+    fn(*args, **kwargs) под ограничителем категории name. На 429 — пауза (Retry-After
+    или экспонента) и повтор, до retries раз; прочие ошибки пробрасываются сразу.
+    """
+    b = bucket(name)
+    attempt = 0
+    while True:
+        b.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_rate_limited(e):
+                raise
+            if on_limited:
+                on_limited(e)
+            b.backoff(retry_after_of(e))
+            attempt += 1
+            if attempt > retries:
+                raise
+            continue
+        b.success()
+        return result
+
+
+def stats_snapshot() -> dict:
+    with _buckets_lock:
+        names = list(_buckets)
+    return {name: bucket(name).snapshot() for name in names}
@@ -0,0 +1,52 @@
+import random
+import socket
+from typing import Optional
+
+# Какие сбои стоит повторить. Временные (таймауты, обрывы соединения, 5xx, 429,
+# протухшая ссылка на поток — 403) повторяются позже в том же прогоне, с экспоненциальной
+# паузой и случайным разбросом; постоянные (видео удалено, приватное, недоступно в стране)
+# сразу считаются ошибкой трека. Неизвестная ошибка — постоянная: лишний повтор дороже.
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+MAX_ATTEMPTS = 3          # повторов на трек (поверх первой попытки)
+BASE_DELAY_S = 2.0
+MAX_DELAY_S = 60.0
+
+PERMANENT_MARKERS = (
+    "video unavailable", "private video", "has been removed", "copyright",
+    "not available in your country", "members-only", "members only",
+    "sign in to confirm your age", "unsupported url", "is not a valid url",
+)
+TRANSIENT_MARKERS = (
+    "timed out", "timeout", "connection reset", "connection aborted", "connection refused",
+    "temporary failure", "name resolution", "network is unreachable", "remote end closed",
+    "incompleteread", "incomplete read", "eof occurred", "http error 5", "503", "502", "504",
+    "429", "too many requests", "http error 403", "unable to download video data",
+    "fragment", "ssl",
+)
+
+
+def classify(exc) -> str:
+    if exc is None:
+        return PERMANENT
+    if isinstance(exc, (socket.timeout, TimeoutError, ConnectionError)):
+        return TRANSIENT
+    text = str(exc).lower()
+    if any(m in text for m in PERMANENT_MARKERS):
+        return PERMANENT
+    if any(m in text for m in TRANSIENT_MARKERS):
+        return TRANSIENT
+    return PERMANENT
+
+
+def backoff_delay(attempt: int, base: float = BASE_DELAY_S, cap: float = MAX_DELAY_S) -> float:
+    """Пауза перед повтором номер attempt (с 0): base·2^attempt, из них случайно от половины до полной."""
+    ceiling = min(cap, base * (2 ** max(0, attempt)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def should_retry(exc, attempts: int, max_attempts: Optional[int] = None) -> bool:
+    limit = MAX_ATTEMPTS if max_attempts is None else max_attempts
+    return attempts < limit and classify(exc) == TRANSIENT
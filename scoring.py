@@ -0,0 +1,152 @@
+from difflib import SequenceMatcher
+from typing import Iterable, Optional
+
+# Оценка кандидатов YouTube для трека Spotify.
+# Формула та же, что и раньше (SequenceMatcher по названию и артисту + длительность + ключевые слова),
+# но строки Spotify нормализуются один раз на трек, а индекс SequenceMatcher по ним строится
+# тоже один раз. Кандидаты, которые заведомо не могут обойти текущего лидера, отсекаются
+# по длительности и по верхним оценкам real_quick_ratio()/quick_ratio() без полного ratio().
+
+MAX_DURATION_DIFF = 20.0        # дальше по длительности — не рассматриваем
+CONFIDENT_MAX_DIFF = 2.0        # «почти идеальное» совпадение для раннего выхода из поиска
+BONUS_WORDS = ('official', 'original', 'audio', 'lyrics')
+PENALTY_WORDS = ('cover', 'remix', 'speed up', 'sped up')
+
+W_TITLE = 0.65
+W_ARTIST = 0.30
+W_DURATION = 0.05
+
+
+class Candidate:
+    __slots__ = ("entry", "title", "score", "duration", "duration_diff")
+
+    def __init__(self, entry, title, score, duration, duration_diff):
+        self.entry = entry
+        self.title = title
+        self.score = score
+        self.duration = duration
+        self.duration_diff = duration_diff
+
+
+def keyword_bonus(title_lower: str) -> float:
+    bonus = 0.0
+    if any(k in title_lower for k in BONUS_WORDS):
+        bonus += 0.05
+    if any(k in title_lower for k in PENALTY_WORDS):
+        bonus -= 0.2
+    return bonus
+
+
+def entry_key(entry: dict):
+    """Ключ дедупликации: ID видео (одно видео из разных запросов — один кандидат)."""
+    return entry.get('id') or entry.get('url') or id(entry)
+
+
+class TrackScorer:
+    """
+    Накопительная оценка кандидатов для одного трека.
+    score_batch() можно вызывать по мере прихода результатов каждого запроса;
+    лидер (best) совпадает с тем, что дал бы полный перебор в том же порядке.
+    """
+
+    def __init__(self, track_info: dict):
+        self.title_lower = (track_info.get('title') or "").lower()
+        self.artist_lower = (track_info.get('artist') or "").lower()
+        self.title_key = self.title_lower.strip()
+        self.first_artist = self.artist_lower.split(',')[0].strip()
+        self.duration = (track_info.get('duration_ms') or 0) / 1000.0
+
+        # seq2 — строка Spotify: SequenceMatcher строит по ней индекс один раз
+        self._sm_title = SequenceMatcher(None)
+        self._sm_title.set_seq2(self.title_lower)
+        self._sm_artist = SequenceMatcher(None)
+        self._sm_artist.set_seq2(self.artist_lower)
+
+        self._seen: set = set()
+        self.seen_count = 0
+        self.best: Optional[Candidate] = None
+        self.best_score = -1.0
+        self.confident = False
+        self.pruned = 0
+
+    def _ratios(self, title_lower: str, bonus: float, duration_score: float) -> Optional[tuple[float, float]]:
+        """Точные ratio() или None, если даже верхняя оценка не обгоняет лидера."""
+        sm_t, sm_a = self._sm_title, self._sm_artist
+        sm_t.set_seq1(title_lower)
+        sm_a.set_seq1(title_lower)
+        rest = duration_score * W_DURATION + bonus
+        if sm_t.real_quick_ratio() * W_TITLE + sm_a.real_quick_ratio() * W_ARTIST + rest <= self.best_score:
+            return None
+        if sm_t.quick_ratio() * W_TITLE + sm_a.quick_ratio() * W_ARTIST + rest <= self.best_score:
+            return None
+        return sm_t.ratio(), sm_a.ratio()
+
+    def score_batch(self, entries: Iterable[dict], exhaustive: bool = False) -> list[Candidate]:
+        """
+        Оценивает пачку entries (дубликаты по ID пропускаются).
+        exhaustive=True — считать score у всех (для DEBUG-вывода), без отсечений.
+        Возвращает оценённых кандидатов в порядке прихода.
+        """
+        scored = []
+        for entry in entries:
+            if not entry:
+                continue
+            key = entry_key(entry)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self.seen_count += 1
+
+            title = (entry.get('title') or "").strip()
+            if not title:
+                continue
+            raw_dur = entry.get('duration')
+            duration = float(raw_dur) if raw_dur is not None else None
+            if duration is not None:
+                duration_diff = abs(duration - self.duration)
+                duration_score = 1.0 / (1.0 + duration_diff)
+            else:
+                duration_diff = None
+                duration_score = 0.5
+            eligible = duration_diff is None or duration_diff <= MAX_DURATION_DIFF
+            if not eligible and not exhaustive:
+                self.pruned += 1
+                continue
+
+            title_lower = title.lower()
+            bonus = keyword_bonus(title_lower)
+            if exhaustive:
+                self._sm_title.set_seq1(title_lower)
+                self._sm_artist.set_seq1(title_lower)
+                ratios = (self._sm_title.ratio(), self._sm_artist.ratio())
+            else:
+                ratios = self._ratios(title_lower, bonus, duration_score)
+                if ratios is None:
+                    self.pruned += 1
+                    continue
+            score = ratios[0] * W_TITLE + ratios[1] * W_ARTIST + duration_score * W_DURATION + bonus
+
+            cand = Candidate(entry, title, score, duration, duration_diff)
+            scored.append(cand)
+            if eligible and score > self.best_score:
+                self.best_score = score
+                self.best = cand
+                self.confident = self._is_confident(cand)
+        return scored
+
+    def _is_confident(self, cand: Candidate) -> bool:
+        """Название и артист целиком есть в заголовке/канале, длительность почти совпала, без «cover/remix»."""
+        if cand.duration_diff is None or cand.duration_diff > CONFIDENT_MAX_DIFF:
+            return False
+        yt_title = cand.title.lower()
+        if any(k in yt_title for k in PENALTY_WORDS):
+            return False
+        if self.title_key not in yt_title:
+            return False
+        uploader = (cand.entry.get('uploader') or cand.entry.get('channel') or "").lower()
+        return self.first_artist in yt_title or self.first_artist in uploader
+
+    @property
+    def best_entry(self) -> Optional[dict]:
+        return self.best.entry if self.best else None
+
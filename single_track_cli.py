@@ -5,20 +5,18 @@ from rich.table import Table
 from rich.prompt import Prompt, IntPrompt, Confirm
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
-from mutagen.flac import FLAC, Picture
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC, error
-import urllib.request
-import yt_dlp as youtube_dl
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import ydl_pool
+import audio_formats
+import transcode
+import rate_limit
+import spotify_client
+import tagging
 from urllib.parse import urlparse, parse_qs
-from io import BytesIO
 from rich import box
 import sys
 
-COVER_SIZE = 640
-COVER_MAX_BYTES = 400 * 1024
+import covers
+from covers import COVER_SIZE
 
 console: Console
 sanitize_filename = None
@@ -75,10 +73,10 @@ def page(title: str, subtitle: str | None = None):
 
 def get_spotify_track_info(track_url: str, client_id: str, client_secret: str) -> dict:
     """Возвращает meta трека по URL из Spotify."""
-    auth = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
-    sp = spotipy.Spotify(auth_manager=auth)
-    track = sp.track(track_url)
+    sp = spotify_client.get_client(client_id, client_secret)
+    track = rate_limit.call("spotify", sp.track, track_url)
     info = {
+        "id": track.get("id"),
         "artist": ", ".join([a["name"] for a in track["artists"]]),
         "title": track["name"],
         "album": track["album"]["name"],
@@ -108,26 +106,44 @@ def yt_search_for_track(track_info: dict, cookies_file: Optional[str], limit: in
 
     seen_urls = set()
     collected: List[dict] = []
-    with youtube_dl.YoutubeDL(opts) as ydl:
-        for q in queries:
-            if len(collected) >= limit:
-                break
-            try:
-                res = ydl.extract_info(f"ytsearch5:{q}", download=False)
-                for e in (res.get("entries") or []):
-                    if not e:
-                        continue
-                    url = e.get("url")
-                    if not url or url in seen_urls:
-                        continue
-                    seen_urls.add(url)
-                    collected.append(e)
-                    if len(collected) >= limit:
-                        break
-            except Exception:
-                continue
+    ydl = ydl_pool.get_ydl("search", opts)
+    for q in queries:
+        if len(collected) >= limit:
+            break
+        try:
+            res = rate_limit.call("search", ydl.extract_info, f"ytsearch5:{q}", download=False)
+            for e in (res.get("entries") or []):
+                if not e:
+                    continue
+                url = e.get("url")
+                if not url or url in seen_urls:
+                    continue
+                seen_urls.add(url)
+                collected.append(e)
+                if len(collected) >= limit:
+                    break
+        except Exception:
+            continue
     return collected
 
+def _pick_thumbnail(thumbs: List[dict], fallback: Optional[str]) -> Optional[str]:
+    """
+    Самое маленькое превью, из которого ещё получается квадрат COVER_SIZE
+    (обе стороны ≥ COVER_SIZE) — меньше качать и декодировать.
+    Если размеры неизвестны — как раньше: первый .jpg или последнее (самое большое).
+    """
+    sized = [
+        t for t in thumbs
+        if t.get("url") and (t.get("width") or 0) >= COVER_SIZE and (t.get("height") or 0) >= COVER_SIZE
+    ]
+    if sized:
+        best = min(sized, key=lambda t: (t["width"] * t["height"], not t["url"].lower().endswith(".jpg")))
+        return best["url"]
+    if thumbs:
+        jpg = next((t.get("url") for t in thumbs if (t.get("url") or "").lower().endswith(".jpg")), None)
+        return jpg or thumbs[-1].get("url") or fallback
+    return fallback
+
 def yt_get_video_info(url: str, cookies_file: Optional[str]) -> Optional[dict]:
     """Достаёт инфу по прямой YouTube-ссылке (title/uploader/duration/thumbnail)."""
     url = normalize_youtube_url(url) 
@@ -148,25 +164,22 @@ def yt_get_video_info(url: str, cookies_file: Optional[str]) -> Optional[dict]:
         opts["cookiefile"] = cookies_file
 
     try:
-        with youtube_dl.YoutubeDL(opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            if info.get("_type") == "playlist":
-                entries = info.get("entries") or []
-                if entries:
-                    info = entries[0]
-            thumb = info.get("thumbnail")
-            thumbs = info.get("thumbnails") or []
-            if thumbs:
-                jpg = next((t.get("url") for t in thumbs if (t.get("url") or "").lower().endswith(".jpg")), None)
-                thumb = jpg or thumbs[-1].get("url") or thumb
-            return {
-                "title": info.get("title", ""),
-                "uploader": info.get("uploader", "") or info.get("channel", ""),
-                "duration": int(info.get("duration") or 0),
-                "thumbnail": thumb,
-                "url": normalize_youtube_url(info.get("webpage_url") or url),
-            }
+        ydl = ydl_pool.get_ydl("info", opts)
+        info = ydl.extract_info(url, download=False)
+        if info.get("_type") == "playlist":
+            entries = info.get("entries") or []
+            if entries:
+                info = entries[0]
+        thumb = _pick_thumbnail(info.get("thumbnails") or [], info.get("thumbnail"))
+        return {
+            "title": info.get("title", ""),
+            "uploader": info.get("uploader", "") or info.get("channel", ""),
+            "duration": int(info.get("duration") or 0),
+            "thumbnail": thumb,
+            "url": normalize_youtube_url(info.get("webpage_url") or url),
+        }
     except Exception:
+        ydl_pool.discard("info")
         return None
 
 
@@ -225,115 +238,15 @@ def choose_target_folder(default_name: str, base_music_dir: str) -> Optional[str
 
 def _fetch_cover_bytes(url: str) -> tuple[bytes, str, str]:
     """
-    Качаем обложку и нормализуем в 'spotify-совместимый' JPEG:
-    - квадрат 640x640 (центр-кроп)
-    - RGB, без альфы
-    - baseline JPEG (progressive=False)
-    - при необходимости ужимаем < COVER_MAX_BYTES
-    Возвращаем (bytes, mime, ext).
+    Обложка в 'spotify-совместимом' JPEG (640x640, RGB, baseline, < COVER_MAX_BYTES)
+    через общий кеш обложек (covers.py). Возвращаем (bytes, mime, ext).
     """
-    if not url:
-        return b"", "", ""
-
-    req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    try:
-        with urllib.request.urlopen(req, timeout=20) as resp:
-            data = resp.read()
-            
-    except Exception:
-        return b"", "", ""
-
-    try:
-        from PIL import Image, ImageOps 
-        img = Image.open(BytesIO(data))
-
-        try:
-            img = ImageOps.exif_transpose(img)
-        except Exception:
-            pass
-
-        if img.mode not in ("RGB",):
-            img = img.convert("RGB")
-
-        w, h = img.size
-        side = min(w, h)
-        left = (w - side) // 2
-        top  = (h - side) // 2
-        img = img.crop((left, top, left + side, top + side))
-
-        if img.size != (COVER_SIZE, COVER_SIZE):
-            img = img.resize((COVER_SIZE, COVER_SIZE), Image.LANCZOS)
-
-        quality = 88
-        def encode(q: int) -> bytes:
-            buf = BytesIO()
-            img.save(
-                buf,
-                format="JPEG",
-                quality=q,
-                optimize=True,
-                progressive=False,
-                subsampling="4:2:0",
-            )
-            return buf.getvalue()
-
-        out = encode(quality)
-        
-        while len(out) > COVER_MAX_BYTES and quality > 60:
-            quality -= 6
-            out = encode(quality)
-
-        return out, "image/jpeg", "jpg"
-
-    except ImportError:
-        return b"", "", ""
-    except Exception:
-        return b"", "", ""
+    return covers.get_cover(url)
 
 def _write_metadata_unified(audio_path: str, track_info: dict):
-    ext = os.path.splitext(audio_path)[1].lower()
-    title  = track_info.get("title", "") or ""
-    artist = track_info.get("artist", "") or ""
-    album  = track_info.get("album", "") or ""
-    cover_url = track_info.get("cover_url") or ""
-
-    # нормализуем обложку (у тебя уже есть _fetch_cover_bytes -> JPEG 640x640)
-    data, mime, _ = _fetch_cover_bytes(cover_url)
-
-    if ext == ".mp3":
-        audio = MP3(audio_path, ID3=ID3)
-        try: audio.add_tags()
-        except error: pass
-        try:
-            for k in list(audio.tags.keys()):
-                if k.startswith("APIC"): del audio.tags[k]
-        except Exception: pass
-        audio.tags.add(TIT2(encoding=3, text=title))
-        audio.tags.add(TPE1(encoding=3, text=artist))
-        audio.tags.add(TALB(encoding=3, text=album))
-        if data and mime:
-            try: audio.tags.add(APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data))
-            except Exception: pass
-        audio.save(v2_version=3)
-
-    elif ext == ".flac":
-        audio = FLAC(audio_path)
-        audio["title"]  = title
-        audio["artist"] = artist
-        audio["album"]  = album
-        try: audio.clear_pictures()
-        except Exception: pass
-        if data and mime:
-            try:
-                pic = Picture()
-                pic.type = 3
-                pic.desc = "Cover"
-                pic.mime = mime
-                pic.data = data
-                audio.add_picture(pic)
-            except Exception:
-                pass
-        audio.save()
+    # нормализуем обложку (_fetch_cover_bytes -> JPEG 640x640), теги — общий tagging.py
+    data, mime, _ = _fetch_cover_bytes(track_info.get("cover_url") or "")
+    tagging.write_tags(audio_path, track_info, data, mime)
 
 def download_audio_from_entry(track_info: dict, entry: dict, out_dir: str,
                               cookies_file: Optional[str],
@@ -343,17 +256,12 @@ def download_audio_from_entry(track_info: dict, entry: dict, out_dir: str,
     if not video_url:
         return False, "У выбранного результата нет URL"
 
-    final_ext = "mp3" if audio_format == "mp3" else "flac"
-    outtmpl = os.path.join(out_dir, f"{sanitize_filename(track_info['artist'])} - {sanitize_filename(track_info['title'])}.%(ext)s")
-
-    pp = {"key": "FFmpegExtractAudio", "preferredcodec": audio_format}
-    if audio_format == "mp3":
-        pp["preferredquality"] = str(bitrate_kbps)
+    audio_format = audio_formats.normalize(audio_format)
+    stem = f"{sanitize_filename(track_info['artist'])} - {sanitize_filename(track_info['title'])}"
+    outtmpl = os.path.join(out_dir, f"{stem}.src.%(ext)s")
 
     ydl_opts = {
-        "format": "bestaudio/best",
-        "outtmpl": outtmpl,
-        "postprocessors": [pp],
+        "format": audio_formats.ydl_format(audio_format),
         "quiet": True, "no_warnings": True,
         "retries": 3, "fragment_retries": 3, "continuedl": True,
         "skip_unavailable_fragments": True, "socket_timeout": 30,
@@ -364,21 +272,34 @@ def download_audio_from_entry(track_info: dict, entry: dict, out_dir: str,
         ydl_opts["cookiefile"] = cookies_file
 
     try:
-        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
+        ydl = ydl_pool.get_ydl("download", ydl_opts)
+        ydl_pool.set_outtmpl(ydl, outtmpl)
+        info = ydl.extract_info(video_url, download=True) or {}
     except Exception as e:
+        ydl_pool.discard("download")
         return False, str(e)
 
-    # итоговый путь с выбранным расширением
-    out_path = os.path.join(out_dir, f"{sanitize_filename(track_info['artist'])} - {sanitize_filename(track_info['title'])}.{final_ext}")
-    if os.path.exists(out_path):
+    downloads = info.get("requested_downloads") or [{}]
+    raw_path = downloads[0].get("filepath") or info.get("filepath")
+    if not raw_path or not os.path.exists(raw_path):
+        return False, "Файл не найден после скачивания"
+
+    # один трек — ffmpeg может занять все ядра (-threads 0); MP3/FLAC он сразу и тегирует
+    data, mime, _ = _fetch_cover_bytes(track_info.get("cover_url") or "")
+    tags = {"title": track_info.get("title", "") or "", "artist": track_info.get("artist", "") or "",
+            "album": track_info.get("album", "") or "", "cover": data, "cover_mime": mime}
+    try:
+        out_path, tagged = transcode.transcode(raw_path, out_dir, stem, audio_format,
+                                               acodec=info.get("acodec"), bitrate_kbps=bitrate_kbps,
+                                               threads=0, tags=tags)
+    except Exception as e:
+        return False, f"Ошибка конвертации: {e}"
+    if not tagged:
         try:
-            _write_metadata_unified(out_path, track_info)  # см. ниже
+            _write_metadata_unified(out_path, track_info)  # обложка уже в кеше covers.py
         except Exception as e:
             return False, f"Скачалось, но метаданные не записались: {e}"
-        return True, None
-    else:
-        return False, f"Файл не найден после скачивания ({final_ext})"
+    return True, None
 
 def download_audio_by_url(youtube_url: str, track_info: dict, out_dir: str,
                           cookies_file: Optional[str],
@@ -417,8 +338,8 @@ def cli_download_single_track(
 
             page("Один трек • Spotify", "[muted]Получаю метаданные трека...[/muted]")
             try:
-                sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=client_id, client_secret=client_secret))
-                tr = sp.track(sp_url)
+                sp = spotify_client.get_client(client_id, client_secret)
+                tr = rate_limit.call("spotify", sp.track, sp_url)
                 artist = ", ".join(a["name"] for a in tr["artists"])
                 title  = tr["name"]
                 album  = tr["album"]["name"]
@@ -439,6 +360,7 @@ def cli_download_single_track(
             console.print(Panel(meta, title="Мета из Spotify", border_style="title"))
 
             track_info = {
+                "id": tr.get("id"),
                 "artist": artist,
                 "title": title,
                 "album": album,
@@ -462,11 +384,11 @@ def cli_download_single_track(
                     if cookies_file and os.path.exists(cookies_file):
                         ydl_opts["cookiefile"] = cookies_file
                     query = f"{artist} - {title}"
-                    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                        res = ydl.extract_info(f"ytsearch10:{query}", download=False)
-                        for e in (res.get("entries") or []):
-                            if e:
-                                candidates.append(e)
+                    ydl = ydl_pool.get_ydl("search", ydl_opts)
+                    res = rate_limit.call("search", ydl.extract_info, f"ytsearch10:{query}", download=False)
+                    for e in (res.get("entries") or []):
+                        if e:
+                            candidates.append(e)
                 except Exception:
                     candidates = []
                 progress.update(t, completed=1)
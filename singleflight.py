@@ -0,0 +1,87 @@
+import threading
+from typing import Any, Callable, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Схлопывает одновременные вызовы с одинаковым ключом в один:
+    первый поток выполняет fn, остальные ждут и получают тот же результат (или ту же ошибку).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """Возвращает (результат, shared): shared=True — результат получен от чужого вызова."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+
+class InFlight:
+    """
+    Владение ключом на время долгой многоэтапной работы (скачать → перекодировать → теги).
+    В отличие от SingleFlight, второй претендент не ждёт в потоке: claim() сразу отвечает,
+    занят ли ключ, и задание можно отложить (Pipeline WAIT) и спросить снова.
+    """
+
+    OWNER = "owner"   # ключ наш — работаем
+    BUSY = "busy"     # ключ у другого — спросить позже
+    DONE = "done"     # другой уже закончил — взять его результат
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owners: dict[Hashable, Any] = {}
+        self._results: dict[Hashable, Any] = {}
+
+    def claim(self, key: Hashable, owner: Any) -> tuple[str, Any]:
+        with self._lock:
+            if key in self._results:
+                return self.DONE, self._results[key]
+            current = self._owners.get(key)
+            if current is None or current is owner:
+                self._owners[key] = owner
+                return self.OWNER, None
+            return self.BUSY, None
+
+    def finish(self, key: Hashable, owner: Any, result: Any = None):
+        """Освобождает ключ; result is None — работа не удалась, следующий претендент сделает её сам."""
+        with self._lock:
+            if self._owners.get(key) is owner:
+                del self._owners[key]
+            if result is not None:
+                self._results[key] = result
+
+    def clear(self):
+        with self._lock:
+            self._owners.clear()
+            self._results.clear()
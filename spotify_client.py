@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+from typing import Any
+
+from app_config import _config_dir
+from http_pools import ConnectionStats
+
+# Один клиент Spotify на процесс (на пару client_id/secret) вместо нового на каждое действие.
+# Раньше каждый плейлист и каждая ссылка на трек создавали свой SpotifyClientCredentials
+# (новый токен) и свой spotipy.Spotify (новое TLS-соединение). Теперь:
+#   - токен client credentials лежит в %APPDATA% и живёт до истечения (~1 час),
+#     в том числе между запусками программы;
+#   - все запросы идут через одну requests.Session с пулом keep-alive соединений,
+#     размером под параллельную загрузку страниц плейлиста.
+# spotipy и requests импортируются при первом запросе к Spotify.
+
+POOL_SIZE = 16            # соединений keep-alive на хост (страницы плейлиста качаются параллельно)
+REQUESTS_TIMEOUT = 20
+TOKEN_CACHE_PREFIX = "spotify_token_"
+
+STATS = {"clients": 0, "clients_reused": 0, "token_requests": 0, "tokens_reused": 0}
+
+_lock = threading.Lock()
+_clients: dict[tuple[str, str], Any] = {}
+_session = None
+_factory = None
+_connections = ConnectionStats()
+
+
+def _count(name: str):
+    with _lock:
+        STATS[name] += 1
+
+
+def set_factory(factory):
+    """Подменяет создание клиента (для офлайн-бенчмарков): factory(client_id, client_secret); None — настоящий."""
+    global _factory
+    with _lock:
+        _factory = factory
+        _clients.clear()
+
+
+def token_cache_path(client_id: str) -> str:
+    # свой файл на client_id: токен чужого приложения не подойдёт
+    digest = hashlib.sha1((client_id or "").encode("utf-8")).hexdigest()[:12]
+    return os.path.join(_config_dir(), f"{TOKEN_CACHE_PREFIX}{digest}.json")
+
+
+def shared_session(pool_size: int = POOL_SIZE):
+    """Общая requests.Session: пул keep-alive соединений и те же повторы, что spotipy ставит себе сам."""
+    global _session
+    with _lock:
+        if _session is not None:
+            return _session
+        import requests
+        import spotipy
+        from urllib3.util.retry import Retry
+        retry = Retry(
+            total=3, connect=None, read=False,
+            allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+            status=3, backoff_factor=0.3,
+            status_forcelist=spotipy.Spotify.default_retry_codes,
+        )
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(1, int(pool_size)),
+                                                max_retries=retry)
+        _connections.install(adapter.poolmanager)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+        return session
+
+
+def _counting_cache(cache_path: str):
+    """
+    Файловый кеш токена spotipy, который считает токены, а не вызовы API:
+    token_requests — токен пришлось запросить (spotipy сохраняет его в кеш),
+    tokens_reused  — действующий токен взят из файла, а не запрошен (раз на токен).
+    """
+    from spotipy.cache_handler import CacheFileHandler
+    from spotipy.oauth2 import SpotifyAuthBase
+
+    class CountingCacheFileHandler(CacheFileHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._seen: set[str] = set()
+            self._seen_lock = threading.Lock()
+
+        def _first_time(self, token_info) -> bool:
+            with self._seen_lock:
+                token = token_info.get("access_token")
+                if token in self._seen:
+                    return False
+                self._seen.add(token)
+                return True
+
+        def get_cached_token(self):
+            token_info = super().get_cached_token()
+            if (token_info and not SpotifyAuthBase.is_token_expired(token_info)
+                    and self._first_time(token_info)):
+                _count("tokens_reused")
+            return token_info
+
+        def save_token_to_cache(self, token_info):
+            self._first_time(token_info)
+            _count("token_requests")
+            super().save_token_to_cache(token_info)
+
+    return CountingCacheFileHandler(cache_path=cache_path)
+
+
+def _create(client_id: str, client_secret: str):
+    import spotipy
+    from spotipy.oauth2 import SpotifyClientCredentials
+    session = shared_session()
+    auth = SpotifyClientCredentials(
+        client_id=client_id, client_secret=client_secret,
+        requests_session=session, requests_timeout=REQUESTS_TIMEOUT,
+        cache_handler=_counting_cache(token_cache_path(client_id)),
+    )
+    return spotipy.Spotify(auth_manager=auth, requests_session=session,
+                           requests_timeout=REQUESTS_TIMEOUT)
+
+
+def get_client(client_id: str, client_secret: str):
+    """spotipy.Spotify на весь процесс; клиент потокобезопасен в той мере, в какой и был (общая Session)."""
+    key = (client_id, client_secret)
+    with _lock:
+        client = _clients.get(key)
+        factory = _factory
+    if client is not None:
+        _count("clients_reused")
+        return client
+    client = (factory or _create)(client_id, client_secret)
+    with _lock:
+        client = _clients.setdefault(key, client)
+        STATS["clients"] += 1
+    return client
+
+
+def stats_snapshot() -> dict:
+    """Счётчики: клиентов, токенов (запрошено/повторно использовано) и соединений (открыто/переиспользовано)."""
+    with _lock:
+        out = dict(STATS)
+    out.update(_connections.snapshot())
+    return out
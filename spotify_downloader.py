@@ -1,26 +1,13 @@
 import os
 import re
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-import yt_dlp as youtube_dl
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC, error
-from mutagen.flac import FLAC, Picture
-import urllib.request
 import time
-from difflib import SequenceMatcher
 import threading
 import json
-from http.cookiejar import MozillaCookieJar
-from selenium import webdriver
-from selenium.webdriver.common.by import By
 import concurrent.futures
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-import undetected_chromedriver as uc
-from PIL import Image, ImageOps
-from io import BytesIO 
+from http.cookiejar import MozillaCookieJar
+# selenium, undetected_chromedriver, spotipy, yt_dlp, mutagen и PIL импортируются
+# при первом использовании (см. benchmarks/bench_startup.py): меню должно
+# появляться без загрузки браузерной автоматизации и всех экстракторов yt-dlp.
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
@@ -35,6 +22,22 @@ from app_config import ensure_music_dir, change_music_dir, load_config, save_con
 from rich import box
 import sys
 from app_config import ensure_music_dir, change_music_dir, load_config, save_config, _config_dir
+from pipeline import Pipeline, NEXT, DONE, RETRY, WAIT, HOLD
+from match_cache import get_match_cache
+import ydl_pool
+import covers
+from scoring import TrackScorer
+from singleflight import SingleFlight, InFlight
+from playlist_sync import SyncManifest, track_key
+import tracing
+from track_store import TrackStore, write_m3u, MODES as LIBRARY_MODES
+import audio_formats
+import tagging
+import transcode
+import concurrency
+import rate_limit
+import retry_policy
+import spotify_client
 
 
 CLIENT_ID = '77bb678c39844763a230d7452c3b3f5e'
@@ -55,21 +58,45 @@ BOX_STYLE = box.SIMPLE if IS_WIN else box.ROUNDED
 console = Console(theme=THEME, emoji=True, legacy_windows=False)
 st_set_console(console)
 
+CPU_COUNT = os.cpu_count() or 2
+
 CLI_SETTINGS = {
     "threads": 4,
+    "search_threads": 8,
+    "search_plan": "adaptive",
     "debug": False,
     "audio_bitrate_kbps": 320,
     "audio_format": "mp3",
+    "trace": False,
+    "library_mode": "folders",
+    "transcode_threads": CPU_COUNT,
+    "ffmpeg_threads": 1,
+    # fixed — threads/search_threads как есть; auto — AIMD-контроллер в этих границах
+    "concurrency": "fixed",
+    "search_bounds": [2, 32],
+    "download_bounds": [1, 16],
+    # запросов в секунду по категориям (0 — без ограничения), см. rate_limit.py
+    "rate_limits": dict(rate_limit.DEFAULT_RATES),
+    "retries": retry_policy.MAX_ATTEMPTS,   # повторов трека при временных сбоях (0 — не повторять)
 }
 
-COVER_SIZE = 640                
-COVER_MAX_BYTES = 400 * 1024
+# Теги/обложки — в основном CPU, больше пары потоков смысла нет
+TAG_THREADS = max(1, min(4, CPU_COUNT))
+MAX_DOWNLOAD_THREADS = 32   # загрузка — это сеть, от числа ядер не зависит
 
 SEARCH_CACHE = {}
+search_cache_lock = threading.Lock()
+# одинаковые «артист - название» в одном прогоне ищет один поток, остальные ждут его результат
+_search_flight = SingleFlight()
+# как часто задание-дубль проверяет, готов ли файл у задания-владельца (см. _stage_download)
+DEDUP_POLL_S = 1.0
 
 cookies_lock = threading.Lock()
 cookies_last_checked = 0
 COOKIES_CHECK_INTERVAL = 1800  
+# последняя проверка cookies.txt (см. cookies_status) и как часто монитор смотрит на файл во время прогона
+_cookies_state = {"path": None, "mtime": None, "valid": False}
+COOKIES_POLL_S = 5
 
 COOKIES_NEED_REFRESH = False
 
@@ -136,9 +163,23 @@ def _load_cli_settings_from_config():
         st = cfg.get("cli_settings", {})
         if isinstance(st, dict):
             if "threads" in st: CLI_SETTINGS["threads"] = int(st["threads"])
+            if "search_threads" in st: CLI_SETTINGS["search_threads"] = int(st["search_threads"])
+            if "search_plan" in st: CLI_SETTINGS["search_plan"] = str(st["search_plan"]).lower()
             if "debug" in st: CLI_SETTINGS["debug"] = bool(st["debug"])
             if "audio_bitrate_kbps" in st: CLI_SETTINGS["audio_bitrate_kbps"] = int(st["audio_bitrate_kbps"])
-            if "audio_format" in st: CLI_SETTINGS["audio_format"] = str(st["audio_format"]).lower()
+            if "audio_format" in st: CLI_SETTINGS["audio_format"] = audio_formats.normalize(st["audio_format"])
+            if "trace" in st: CLI_SETTINGS["trace"] = bool(st["trace"])
+            if "library_mode" in st: CLI_SETTINGS["library_mode"] = str(st["library_mode"]).lower()
+            if "transcode_threads" in st: CLI_SETTINGS["transcode_threads"] = int(st["transcode_threads"])
+            if "ffmpeg_threads" in st: CLI_SETTINGS["ffmpeg_threads"] = int(st["ffmpeg_threads"])
+            if "concurrency" in st: CLI_SETTINGS["concurrency"] = str(st["concurrency"]).lower()
+            for key in ("search_bounds", "download_bounds"):
+                if key in st:
+                    lo, hi = (int(v) for v in st[key])
+                    CLI_SETTINGS[key] = [lo, hi]
+            if "retries" in st: CLI_SETTINGS["retries"] = int(st["retries"])
+            if isinstance(st.get("rate_limits"), dict):
+                CLI_SETTINGS["rate_limits"].update({k: float(v) for k, v in st["rate_limits"].items()})
     except Exception:
         pass
 
@@ -147,9 +188,20 @@ def _save_cli_settings_to_config():
         cfg = load_config() or {}
         cfg["cli_settings"] = {
             "threads": CLI_SETTINGS["threads"],
+            "search_threads": CLI_SETTINGS["search_threads"],
+            "search_plan": CLI_SETTINGS["search_plan"],
             "debug": CLI_SETTINGS["debug"],
             "audio_bitrate_kbps": CLI_SETTINGS["audio_bitrate_kbps"],
             "audio_format": CLI_SETTINGS["audio_format"],
+            "trace": CLI_SETTINGS["trace"],
+            "library_mode": CLI_SETTINGS["library_mode"],
+            "transcode_threads": CLI_SETTINGS["transcode_threads"],
+            "ffmpeg_threads": CLI_SETTINGS["ffmpeg_threads"],
+            "concurrency": CLI_SETTINGS["concurrency"],
+            "search_bounds": CLI_SETTINGS["search_bounds"],
+            "download_bounds": CLI_SETTINGS["download_bounds"],
+            "rate_limits": CLI_SETTINGS["rate_limits"],
+            "retries": CLI_SETTINGS["retries"],
         }
         save_config(cfg)
     except Exception:
@@ -158,6 +210,9 @@ def _save_cli_settings_to_config():
 def automate_youtube_login(driver, email, password, timeout=30):
     """Устойчивый вход в YouTube/Google-аккаунт"""
     from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     driver.get(
         "https://accounts.google.com/signin/v2/identifier"
         "?service=youtube&hl=ru&passive=true&continue=https://www.youtube.com/"
@@ -259,7 +314,10 @@ def export_cookies_selenium(driver, cookies_path):
 
 def setup_selenium_driver():
     """Настраивает и возвращает Selenium WebDriver (uc -> ChromeDriver)"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
     from selenium.webdriver.chrome.service import Service
+    import undetected_chromedriver as uc
     from shutil import which
 
     chrome_options = Options()
@@ -294,6 +352,9 @@ def automated_cookies_refresh():
     if not driver:
         print("Не удалось настроить Selenium. Пожалуйста, обновите cookies вручную.")
         return False
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
 
     try:
         driver.get("https://www.youtube.com/")
@@ -345,6 +406,101 @@ def check_cookies_validity(cookies_file):
     except Exception:
         return False
 
+def _cookies_mtime(path: str | None) -> float | None:
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+def cookies_status(cookies_file: str | None = None, force: bool = False) -> tuple[str | None, bool]:
+    """
+    (путь к cookies.txt, валиден ли он). Файл разбирается заново, только если сменились
+    путь или mtime либо прошло COOKIES_CHECK_INTERVAL (куки истекают и без правки файла).
+    """
+    global cookies_last_checked
+    path = cookies_file or find_cookie_file()
+    mtime = _cookies_mtime(path)
+    with cookies_lock:
+        state = _cookies_state
+        if (not force and state["path"] == path and state["mtime"] == mtime
+                and time.time() - cookies_last_checked < COOKIES_CHECK_INTERVAL):
+            return path, state["valid"]
+        valid = mtime is not None and check_cookies_validity(path)
+        state.update(path=path, mtime=mtime, valid=valid)
+        cookies_last_checked = time.time()
+        return path, valid
+
+class CookieMonitor:
+    """
+    Следит за cookies.txt во время прогона. Треки «Sign in to confirm your age» не падают,
+    а откладываются в конвейере (HOLD); как только на диске появляются новые валидные
+    cookies, они возвращаются в работу того же прогона — без второго прохода по плейлисту.
+    Между проверками — только stat(): файл разбирает cookies_status.
+    """
+
+    def __init__(self, pipe: Pipeline, poll_s: float = COOKIES_POLL_S):
+        self.pipe = pipe
+        self.poll_s = poll_s
+        self.cookies_file = None
+        self.resumed = 0
+        self._parked_sig = None   # (путь, mtime) cookies, с которыми треки упёрлись в возраст
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="cookie-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_s):
+            self.poll()
+
+    def park(self, job: dict) -> str:
+        """Откладывает задание до новых cookies. Отпускает его захваты, чтобы дубли не ждали вечно."""
+        if job.get("store_claimed"):
+            job["store"].release(job["track"])
+            job["store_claimed"] = False
+        if job.get("output_key"):
+            job["outputs"].finish(job.pop("output_key"), job, None)
+        path = job.get("cookies_file") or find_cookie_file()
+        with self._lock:
+            self.cookies_file = self.cookies_file or job.get("cookies_file")
+            self._parked_sig = (path, _cookies_mtime(path))
+        return HOLD
+
+    def poll(self, force: bool = False) -> int:
+        """Есть отложенные треки и cookies.txt сменился и валиден — возвращает треки в работу."""
+        global COOKIES_NEED_REFRESH
+        if not self.pipe.held_count():
+            return 0
+        path, valid = cookies_status(self.cookies_file, force=force)
+        if not valid and self.cookies_file:
+            # новые cookies могли сохранить в другую папку из cookie_candidates()
+            path, valid = cookies_status(None, force=force)
+        with self._lock:
+            if not valid or (path, _cookies_mtime(path)) == self._parked_sig:
+                return 0
+
+        def _prepare(job):
+            job.pop("error", None)
+            job["cookies_file"] = path
+            job["ydl_opts"] = _info_ydl_opts(path)
+
+        # с поиска: там задание заново проверит хранилище и дубли, а видео возьмёт из SEARCH_CACHE
+        n = self.pipe.release_held(stage="search", prepare=_prepare)
+        if n:
+            self.resumed += n
+            COOKIES_NEED_REFRESH = False
+            print(f"Новые cookies ({path}): снова качаю треки с возрастным ограничением: {n}")
+        return n
+
 def refresh_cookies():
     """Просит пользователя обновить куки или делает это автоматически"""
     print("\n" + "="*70)
@@ -370,58 +526,172 @@ def refresh_cookies():
         print("4) Нажми Enter для продолжения")
         input()
 
-        if os.path.exists(target) and check_cookies_validity(target):
+        if cookies_status(target, force=True)[1]:
             print(f"Новые куки успешно загружены: {target}")
             return True
         else:
             print("Не удалось найти валидный cookies.txt. Продолжаем без куки...")
             return False
 
-def get_spotify_playlist_info(playlist_url):
-    auth_manager = SpotifyClientCredentials(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
-    sp = spotipy.Spotify(auth_manager=auth_manager)
-    
-    playlist = sp.playlist(playlist_url)
+SPOTIFY_PAGE_SIZE = 100
+SPOTIFY_PAGE_THREADS = 4
+# Только нужные поля: артисты, название, альбом, длительность, обложка, ID
+SPOTIFY_TRACK_FIELDS = "track(id,name,duration_ms,artists(name),album(name,images(url)))"
+SPOTIFY_PLAYLIST_FIELDS = f"name,owner(display_name),tracks(total,items({SPOTIFY_TRACK_FIELDS}))"
+SPOTIFY_ITEMS_FIELDS = f"items({SPOTIFY_TRACK_FIELDS})"
+
+def _spotify_client():
+    # один на процесс: токен из кеша и keep-alive соединения (spotify_client.py)
+    return spotify_client.get_client(CLIENT_ID, CLIENT_SECRET)
+
+def _tracks_from_items(items) -> list[dict]:
+    tracks = []
+    for item in items or []:
+        track = (item or {}).get('track')
+        if not track or not track.get('artists'):
+            continue
+        album = track.get('album') or {}
+        images = album.get('images') or []
+        tracks.append({
+            'id': track.get('id'),
+            'artist': ', '.join([artist['name'] for artist in track['artists']]),
+            'title': track['name'],
+            'album': album.get('name') or "",
+            'duration_ms': track['duration_ms'],
+            'cover_url': images[0]['url'] if images else None
+        })
+    return tracks
+
+def open_spotify_playlist(playlist_url, executor=None):
+    """
+    Возвращает (playlist_name, owner_name, total, pages).
+    Первая страница приходит вместе с метаданными плейлиста, остальные смещения
+    известны заранее из total и запрашиваются параллельно. pages — генератор
+    (offset, [треки]) по мере прихода страниц, порядок страниц не гарантирован.
+    executor — общий пул для страниц (пакетный режим); без него создаётся свой.
+    """
+    sp = _spotify_client()
+    with tracing.span("spotify.playlist"):
+        playlist = rate_limit.call("spotify", sp.playlist, playlist_url, fields=SPOTIFY_PLAYLIST_FIELDS,
+                                   additional_types=("track",))
     playlist_name = sanitize_filename(playlist['name'])
     owner_name = sanitize_filename(playlist['owner']['display_name'])
+    first = playlist.get('tracks') or {}
+    total = int(first.get('total') or 0)
+    first_items = first.get('items') or []
+
+    def fetch(offset):
+        with tracing.span("spotify.page", offset=offset):
+            page = rate_limit.call(
+                "spotify", sp.playlist_items,
+                playlist_url, fields=SPOTIFY_ITEMS_FIELDS, limit=SPOTIFY_PAGE_SIZE,
+                offset=offset, additional_types=("track",),
+            )
+        return offset, _tracks_from_items(page.get('items'))
+
+    def pages():
+        yield 0, _tracks_from_items(first_items)
+        offsets = list(range(len(first_items), total, SPOTIFY_PAGE_SIZE)) if first_items else []
+        if not offsets:
+            return
+        if executor is not None:
+            futures = [executor.submit(fetch, offset) for offset in offsets]
+            for fut in concurrent.futures.as_completed(futures):
+                yield fut.result()
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=SPOTIFY_PAGE_THREADS) as own:
+            futures = [own.submit(fetch, offset) for offset in offsets]
+            for fut in concurrent.futures.as_completed(futures):
+                yield fut.result()
+
+    return playlist_name, owner_name, total, pages()
+
+def get_spotify_track(track_url) -> dict | None:
+    """Один трек Spotify в том же виде, что и треки плейлиста."""
+    tr = rate_limit.call("spotify", _spotify_client().track, track_url)
+    tracks = _tracks_from_items([{"track": tr}])
+    return tracks[0] if tracks else None
+
+@tracing.traced("spotify.playlist_info")
+def get_spotify_playlist_info(playlist_url):
+    """Весь плейлист целиком, в порядке плейлиста."""
+    playlist_name, owner_name, _, pages = open_spotify_playlist(playlist_url)
     tracks = []
-    
-    results = sp.playlist_items(playlist_url)
-    while results:
-        for item in results['items']:
-            track = item['track']
-            if track: 
-                tracks.append({
-                    'artist': ', '.join([artist['name'] for artist in track['artists']]),
-                    'title': track['name'],
-                    'album': track['album']['name'],
-                    'duration_ms': track['duration_ms'],
-                    'cover_url': track['album']['images'][0]['url'] if track['album']['images'] else None
-                })
-        if results['next']:
-            results = sp.next(results)
-        else:
-            break
-    
+    for _, page in sorted(pages, key=lambda p: p[0]):
+        tracks.extend(page)
     return playlist_name, owner_name, tracks
 
-def similarity(a, b):
-    """Вычисляет схожесть между двумя строками"""
-    return SequenceMatcher(None, a.lower(), b.lower()).ratio()
+SEARCH_STATS = {"tracks": 0, "queries": 0, "early_exits": 0, "shared": 0}
+search_stats_lock = threading.Lock()
+
+def plan_search_queries(track_info, mode: str = "adaptive") -> list[tuple[str, int]]:
+    """
+    План запросов к YouTube: список (запрос, сколько результатов брать).
+      full / adaptive — 4 запроса по 5 результатов (adaptive останавливается раньше),
+      merged          — 2 запроса по 10 (меньше сетевых раундтрипов, та же выдача).
+    """
+    artist, title = track_info['artist'], track_info['title']
+    if mode == "merged":
+        return [
+            (f"{artist} - {title}", 10),
+            (f"{title} {artist}", 10),
+        ]
+    return [
+        (f"{artist} - {title} official audio", 5),
+        (f"{artist} - {title}", 5),
+        (f"{title} {artist}", 5),
+        (f"{title}", 5),
+    ]
+
+def search_stats_snapshot() -> dict:
+    with search_stats_lock:
+        return dict(SEARCH_STATS)
+
+@tracing.traced("search")
+def find_best_match(track_info, ydl_opts, cookies_file=None, errors=None):
+    """errors — список, куда складываются исключения запросов (чтобы решить, стоит ли повторять)."""
+    # прямая ссылка на YouTube — искать нечего
+    if track_info.get('youtube_url'):
+        concurrency.skip_sample()
+        return {'url': track_info['youtube_url']}
 
-def find_best_match(track_info, ydl_opts, cookies_file=None):
     cache_key = f"{track_info['artist']} - {track_info['title']}"
-    if cache_key in SEARCH_CACHE:
+    with search_cache_lock:
+        hit, cached = cache_key in SEARCH_CACHE, SEARCH_CACHE.get(cache_key)
+    if hit:
         if DEBUG:
             print(f"Используем кэшированный результат для: {cache_key}")
-        return SEARCH_CACHE[cache_key]
-
-    queries = [
-        f"{track_info['artist']} - {track_info['title']} official audio",
-        f"{track_info['artist']} - {track_info['title']}",
-        f"{track_info['title']} {track_info['artist']}",
-        f"{track_info['title']}",
-    ]
+        concurrency.skip_sample()
+        return cached
+
+    (match, search_errors), shared = _search_flight.do(
+        cache_key, lambda: _search_track(track_info, ydl_opts, cookies_file, cache_key))
+    if shared:
+        # результат чужого поиска того же трека: сети этот поток не касался
+        concurrency.skip_sample()
+        with search_stats_lock:
+            SEARCH_STATS["shared"] += 1
+    if errors is not None:
+        errors.extend(search_errors)
+    return match
+
+def _search_track(track_info, ydl_opts, cookies_file, cache_key) -> tuple:
+    """Поиск одного трека: (совпадение или None, исключения запросов)."""
+    errors = []
+    match_cache = get_match_cache()
+    if match_cache is not None:
+        hit, cached = match_cache.get(track_info)
+        if hit:
+            if DEBUG:
+                print(f"Совпадение из постоянного кеша для: {cache_key}")
+            with search_cache_lock:
+                SEARCH_CACHE[cache_key] = cached
+            concurrency.skip_sample()
+            return cached, ()
+
+    mode = str(CLI_SETTINGS.get("search_plan", "adaptive")).lower()
+    plan = plan_search_queries(track_info, mode)
+    early_exit_allowed = mode != "full"
 
     ydl_search_opts = dict(ydl_opts or {})
     ydl_search_opts.setdefault("quiet", True)
@@ -435,106 +705,118 @@ def find_best_match(track_info, ydl_opts, cookies_file=None):
     if cookies_file and os.path.exists(cookies_file):
         ydl_search_opts["cookiefile"] = cookies_file
 
-    all_results = []
-    with youtube_dl.YoutubeDL(ydl_search_opts) as ydl:
-        for query in queries:
-            try:
-                search_results = ydl.extract_info(f"ytsearch5:{query}", download=False)
-                if search_results and 'entries' in search_results:
-                    for entry in search_results['entries'] or []:
-                        if entry and entry not in all_results:
-                            all_results.append(entry)
-            except Exception as e:
-                if DEBUG:
-                    print(f"Ошибка поиска для '{query}': {e}")
-                continue
-
-    if not all_results:
-        if DEBUG:
-            print(f"Не найдено результатов: {track_info['artist']} - {track_info['title']}")
-        return None
-
-    best_match = None
-    best_score = -1.0
     spotify_duration = (track_info.get('duration_ms') or 0) / 1000.0  # сек
-
     if DEBUG:
         print(f"\nПоиск для: {track_info['artist']} - {track_info['title']}")
         print(f"Длительность Spotify: {spotify_duration:.2f} сек")
         print("Найденные варианты:")
 
-    for i, entry in enumerate(all_results):
-        if not entry:
+    # Результаты оцениваются по мере прихода каждого запроса,
+    # при уверенном совпадении остальные запросы не делаем
+    scorer = TrackScorer(track_info)
+    search_failed = False
+    queries_done = 0
+    ydl = ydl_pool.get_ydl("search", ydl_search_opts)
+    for query, n in plan:
+        queries_done += 1
+        try:
+            with tracing.span("search.query", query=query):
+                search_results = rate_limit.call("search", ydl.extract_info, f"ytsearch{n}:{query}",
+                                                 download=False, on_limited=concurrency.report)
+        except Exception as e:
+            search_failed = True
+            concurrency.report(e)
+            errors.append(e)
+            if DEBUG:
+                print(f"Ошибка поиска для '{query}': {e}")
             continue
-
-        title = (entry.get('title') or "").strip()
-        if not title:
+        if not search_results or 'entries' not in search_results:
             continue
-        uploader = entry.get('uploader') or ""
-        raw_dur = entry.get('duration')
-        entry_duration = float(raw_dur) if raw_dur is not None else None
-
-        title_similarity = similarity(title, track_info['title'])
-        artist_in_title = similarity(title, track_info['artist'])
-
-        if entry_duration is not None:
-            duration_diff = abs(entry_duration - spotify_duration)
-            duration_score = 1.0 / (1.0 + duration_diff)
-        else:
-            duration_diff = None
-            duration_score = 0.5
-
-        title_lower = title.lower()
-        kw_bonus = 0.0
-        if any(k in title_lower for k in ['official', 'original', 'audio', 'lyrics']):
-            kw_bonus += 0.05
-        if any(k in title_lower for k in ['cover', 'remix', 'speed up', 'sped up']):
-            kw_bonus -= 0.2
-
-        score = title_similarity * 0.65 + artist_in_title * 0.30 + duration_score * 0.05 + kw_bonus
-
+        scored = scorer.score_batch(search_results['entries'] or [], exhaustive=DEBUG)
         if DEBUG:
-            dur_dbg = f"{int(entry_duration)}" if entry_duration is not None else "—"
-            diff_dbg = f"{duration_diff:.2f}" if duration_diff is not None else "—"
-            print(f"{i+1}. {title} | канал: {uploader} | длит.: {dur_dbg} | Δ={diff_dbg} | score={score:.3f}")
+            for c in scored:
+                uploader = c.entry.get('uploader') or ""
+                dur_dbg = f"{int(c.duration)}" if c.duration is not None else "—"
+                diff_dbg = f"{c.duration_diff:.2f}" if c.duration_diff is not None else "—"
+                print(f"- {c.title} | канал: {uploader} | длит.: {dur_dbg} | Δ={diff_dbg} | score={c.score:.3f}")
+        if early_exit_allowed and scorer.confident:
+            break
 
-        if score > best_score and (duration_diff is None or duration_diff <= 20):
-            best_score = score
-            best_match = entry
+    with search_stats_lock:
+        SEARCH_STATS["tracks"] += 1
+        SEARCH_STATS["queries"] += queries_done
+        if queries_done < len(plan):
+            SEARCH_STATS["early_exits"] += 1
 
-    SEARCH_CACHE[cache_key] = best_match
-    return best_match
+    if not scorer.seen_count:
+        if DEBUG:
+            print(f"Не найдено результатов: {track_info['artist']} - {track_info['title']}")
+        # Отрицательную запись пишем, только если YouTube честно ответил «ничего» (не сетевой сбой)
+        if match_cache is not None and not search_failed:
+            match_cache.put(track_info, None)
+        return None, tuple(errors)
+
+    best_match, best_score = scorer.best_entry, scorer.best_score
+    # «не найдено» запоминаем, только если ответили все запросы: иначе повтор
+    # попал бы в кеш и не отправил бы ни одного запроса
+    if best_match is not None or not search_failed:
+        with search_cache_lock:
+            SEARCH_CACHE[cache_key] = best_match
+        if match_cache is not None:
+            match_cache.put(track_info, best_match, best_score if best_match is not None else None)
+    return best_match, tuple(errors)
+
+RAW_SUFFIX = ".src"   # <stem>.src.<ext> — скачанная дорожка до перекодирования
+
+def _downloaded_path(info: dict, output_dir: str, raw_stem: str) -> str | None:
+    for d in (info or {}).get("requested_downloads") or []:
+        if d.get("filepath") and os.path.exists(d["filepath"]):
+            return d["filepath"]
+    if (info or {}).get("filepath") and os.path.exists(info["filepath"]):
+        return info["filepath"]
+    prefix = raw_stem + "."
+    try:
+        for name in os.listdir(output_dir):
+            if name.startswith(prefix) and not name.endswith(".part"):
+                return os.path.join(output_dir, name)
+    except OSError:
+        pass
+    return None
 
-def download_audio(track_info, output_dir, cookies_file=None):
+@tracing.traced("download")
+def download_audio(track_info, output_dir, cookies_file=None, file_stem=None, errors=None, match=None):
+    """
+    Скачивает лучшую аудиодорожку как есть, без постпроцессора yt-dlp:
+    перекодирование — отдельный этап со своим пулом (transcode.py).
+    match — видео, уже найденное этапом поиска; без него поиск делается здесь.
+    Успех — {"path": скачанный файл, "acodec": кодек}; иначе "age_restricted" или False
+    (исключение yt-dlp при этом добавляется в errors, если он передан).
+    """
     global COOKIES_NEED_REFRESH
 
-    info_ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': True,
-    }
-    best_match = find_best_match(track_info, info_ydl_opts, cookies_file)
+    best_match = match
+    if best_match is None:
+        info_ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': True,
+        }
+        best_match = find_best_match(track_info, info_ydl_opts, cookies_file, errors=errors)
     if not best_match or 'url' not in best_match:
         print(f"Не удалось найти видео для: {track_info['artist']} - {track_info['title']}")
         return False
 
     video_url = best_match['url']
 
-    codec = str(CLI_SETTINGS.get("audio_format", "mp3")).lower() 
-    pp = {
-        'key': 'FFmpegExtractAudio',
-        'preferredcodec': codec,
-    }
-    if codec == 'mp3':
-        pp['preferredquality'] = str(CLI_SETTINGS.get("audio_bitrate_kbps", 320))
+    # для native/opus/m4a выбирается дорожка, которую потом не придётся перекодировать
+    audio_format = audio_formats.normalize(CLI_SETTINGS.get("audio_format"))
 
+    if file_stem is None:
+        file_stem = track_file_stem(track_info)
+    raw_stem = file_stem + RAW_SUFFIX
+    outtmpl = os.path.join(output_dir, f"{raw_stem}.%(ext)s")
     download_ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': os.path.join(
-            output_dir,
-            f"{sanitize_filename(track_info['artist'])} - {sanitize_filename(track_info['title'])}.%(ext)s"
-        ),
-        'postprocessors': [pp],
+        'format': audio_formats.ydl_format(audio_format),
         'quiet': True,
         'no_warnings': True,
         'socket_timeout': 30,
@@ -548,10 +830,20 @@ def download_audio(track_info, output_dir, cookies_file=None):
         download_ydl_opts['cookiefile'] = cookies_file
 
     try:
-        with youtube_dl.YoutubeDL(download_ydl_opts) as ydl:
-            ydl.download([video_url])
-        return True
+        ydl = ydl_pool.get_ydl("download", download_ydl_opts)
+        ydl_pool.set_outtmpl(ydl, outtmpl)
+        with tracing.span("ytdlp.download"):
+            info = ydl.extract_info(video_url, download=True)
+        path = _downloaded_path(info, output_dir, raw_stem)
+        if not path:
+            print(f"Файл не найден после загрузки: {track_info['title']}")
+            return False
+        return {"path": path, "acodec": (info or {}).get("acodec")}
     except Exception as e:
+        ydl_pool.discard("download")
+        concurrency.report(e)
+        if errors is not None:
+            errors.append(e)
         error_msg = str(e)
         if "Sign in to confirm your age" in error_msg:
             print(f"Обнаружена ошибка возрастного ограничения для: {track_info['title']}")
@@ -561,130 +853,394 @@ def download_audio(track_info, output_dir, cookies_file=None):
             print(f"Ошибка загрузки {track_info['title']}: {error_msg}")
             return False
 
+@tracing.traced("cover")
 def _normalize_cover_jpeg(cover_url: str) -> tuple[bytes, str, str]:
-    """Качаем картинку, центр-кроп до 640x640, сохраняем baseline JPEG < ~400KB.
+    """Обложка 640x640 baseline JPEG < ~400KB через общий кеш обложек (covers.py).
        Возвращаем (bytes, mime, ext). Пустые строки — если не получилось.
     """
-    if not cover_url:
-        return b"", "", ""
-    try:
-        req = urllib.request.Request(cover_url, headers={"User-Agent": "Mozilla/5.0"})
-        with urllib.request.urlopen(req, timeout=20) as resp:
-            raw = resp.read()
-    except Exception:
-        return b"", "", ""
-    try:
-        img = Image.open(BytesIO(raw))
-        try:
-            img = ImageOps.exif_transpose(img)
-        except Exception:
-            pass
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        w, h = img.size
-        side = min(w, h)
-        left = (w - side) // 2
-        top  = (h - side) // 2
-        img = img.crop((left, top, left + side, top + side))
-        if img.size != (COVER_SIZE, COVER_SIZE):
-            img = img.resize((COVER_SIZE, COVER_SIZE), Image.LANCZOS)
-
-        def enc(q):
-            buf = BytesIO()
-            img.save(buf, format="JPEG", quality=q, optimize=True, progressive=False, subsampling="4:2:0")
-            return buf.getvalue()
-
-        q = 88
-        out = enc(q)
-        while len(out) > COVER_MAX_BYTES and q > 60:
-            q -= 6
-            out = enc(q)
-        return out, "image/jpeg", "jpg"
-    except Exception:
-        return b"", "", ""
-    
-def write_tags_unified(file_path: str, track_info: dict):
-    """Записывает теги и обложку для MP3 или FLAC в зависимости от расширения файла."""
-    ext = os.path.splitext(file_path)[1].lower()
-    title  = track_info.get("title", "") or ""
-    artist = track_info.get("artist", "") or ""
-    album  = track_info.get("album", "") or ""
-    cover_url = track_info.get("cover_url") or ""
+    return covers.get_cover(cover_url)
+
+@tracing.traced("tags")
+def write_tags_unified(file_path: str, track_info: dict, cover: tuple | None = None):
+    """Записывает теги и обложку (MP3, FLAC, Opus/Ogg, M4A — по расширению файла). cover — уже полученная обложка."""
+    cover_bytes, cover_mime, _ = cover or _normalize_cover_jpeg(track_info.get("cover_url") or "")
+    tagging.write_tags(file_path, track_info, cover_bytes, cover_mime)
+
+def ffmpeg_tags(track_info: dict, cover: tuple) -> dict:
+    """Теги для transcode.transcode: ffmpeg запишет их сам, без второй записи файла через mutagen."""
+    cover_bytes, cover_mime, _ = cover
+    return {
+        "title": track_info.get("title", "") or "",
+        "artist": track_info.get("artist", "") or "",
+        "album": track_info.get("album", "") or "",
+        "cover": cover_bytes,
+        "cover_mime": cover_mime,
+    }
 
-    cover_bytes, cover_mime, cover_ext = _normalize_cover_jpeg(cover_url)
+def track_file_stem(track: dict) -> str:
+    return f"{sanitize_filename(track['artist'])} - {sanitize_filename(track['title'])}"
 
-    if ext == ".mp3":
-        audio = MP3(file_path, ID3=ID3)
-        try: audio.add_tags()
-        except error: pass
+def track_file_name(track: dict, ext: str) -> str:
+    return f"{track_file_stem(track)}.{ext}"
 
-        try:
-            for key in list(audio.tags.keys()):
-                if key.startswith("APIC"):
-                    del audio.tags[key]
-        except Exception:
-            pass
+def _track_label(track: dict) -> str:
+    return f"{track['artist']} - {track['title']}"
 
-        audio.tags.add(TIT2(encoding=3, text=title))
-        audio.tags.add(TPE1(encoding=3, text=artist))
-        audio.tags.add(TALB(encoding=3, text=album))
+def _final_exts() -> tuple[str, ...]:
+    """Расширения итогового файла для текущего формата (native — любое из «родных»)."""
+    return audio_formats.exts(CLI_SETTINGS.get("audio_format"))
 
-        if cover_bytes:
-            try:
-                audio.tags.add(APIC(encoding=3, mime=cover_mime, type=3, desc="Cover", data=cover_bytes))
-            except Exception:
-                pass
+def _ext_of(path: str) -> str:
+    return os.path.splitext(path)[1].lstrip(".")
 
-        audio.save(v2_version=3)
+def get_track_store(music_dir: str) -> TrackStore | None:
+    """Общее хранилище треков, если выбран режим библиотеки m3u/links (иначе None)."""
+    mode = CLI_SETTINGS.get("library_mode", "folders")
+    if mode not in LIBRARY_MODES or mode == "folders":
+        return None
+    return TrackStore(music_dir, mode)
 
-    elif ext == ".flac":
-        audio = FLAC(file_path)
-        audio["title"]  = title
-        audio["artist"] = artist
-        audio["album"]  = album
+def _store_check(job: dict) -> str | None:
+    """
+    DONE — трек уже есть в хранилище: разложен в папку плейлиста без поиска и загрузки.
+    WAIT — его прямо сейчас качает другое задание: спросим снова через DEDUP_POLL_S,
+           не занимая поток поиска на всё время чужой загрузки (как дубли в _stage_download).
+    None — задание «забрало» трек себе (store_claimed) и качает его в хранилище.
+    """
+    if job.get("store_claimed"):
+        # повтор поиска после сбоя: трек уже наш, claim не реентерабелен
+        return None
+    store, track = job["store"], job["track"]
+    exts = _final_exts()
+
+    def _place():
+        path = store.lookup(track, exts, count=True)
+        if path:
+            job["file_path"] = store.place(path, job["output_dir"], track_file_name(track, _ext_of(path)))
+        return path
+
+    if _place():
+        return DONE
+    if not track.get("id"):
+        return None
+    if not store.claim(track):
+        job["retry_in"] = DEDUP_POLL_S
+        return WAIT
+    job["store_claimed"] = True
+    # владелец мог закончить между lookup и claim — тогда качать заново незачем
+    if _place():
+        store.release(track)
+        job["store_claimed"] = False
+        return DONE
+    return None
 
-        try:
-            audio.clear_pictures()
-        except Exception:
-            pass
+def write_playlist_m3u(store: TrackStore, m3u_path: str, tracks: list[dict]) -> int:
+    """M3U8 плейлиста в порядке Spotify: файлы из хранилища (треки без ID — из корня хранилища)."""
+    exts = _final_exts()
+    entries = []
+    for t in tracks:
+        path = store.lookup(t, exts) or audio_formats.locate(store.root, track_file_stem(t),
+                                                              CLI_SETTINGS.get("audio_format"))
+        if path:
+            entries.append((t, path))
+    return write_m3u(m3u_path, entries)
+
+def _stage_search(job: dict) -> str:
+    """Этап 1: подбор видео на YouTube (результат уходит в SEARCH_CACHE)."""
+    if job.get("store") is not None:
+        res = _store_check(job)
+        if res is not None:
+            concurrency.skip_sample()
+            return res
+    errors = []
+    with tracing.track(job["seq"], _track_label(job["track"])):
+        match = find_best_match(job["track"], job["ydl_opts"], job["cookies_file"], errors=errors)
+    if not match or 'url' not in match:
+        # «ничего не нашлось» из-за сбоя сети — повод повторить, а не ошибка трека
+        return _retry_or_fail(job, errors[-1] if errors else None, "не найдено на YouTube")
+    # загрузка возьмёт видео отсюда: повторный find_best_match попал бы в кеш, и его
+    # skip_sample() выкинул бы из выборки AIMD саму загрузку
+    job["match"] = match
+    return NEXT
+
+def _retry_or_fail(job: dict, exc, error: str) -> str:
+    """Временный сбой — RETRY с экспоненциальной паузой; постоянный или попытки кончились — ошибка трека."""
+    attempts = job.get("attempts", 0)
+    max_attempts = CLI_SETTINGS.get("retries", retry_policy.MAX_ATTEMPTS)
+    if exc is not None and retry_policy.should_retry(exc, attempts, max_attempts):
+        delay = retry_policy.backoff_delay(attempts)
+        job["attempts"] = attempts + 1
+        job["retry_in"] = delay
+        print(f"Повтор {attempts + 1}/{max_attempts} через {delay:.0f} с: "
+              f"{_track_label(job['track'])} ({exc})")
+        return RETRY
+    job["error"] = error
+    return DONE
+
+def _stage_download(job: dict) -> str:
+    """Этап 2: скачивание исходной дорожки через yt-dlp (в хранилище, если оно включено)."""
+    track = job["track"]
+    out_dir, stem = job["output_dir"], None
+    if job.get("store_claimed"):
+        out_dir, stem = job["store"].temp_location(track)
+    elif job.get("outputs") is not None:
+        # дубль в плейлисте (или тот же трек из двух ссылок) пишет в тот же файл: качает
+        # и тегирует одно задание, второе откладывается и потом берёт готовый файл
+        key = os.path.normcase(os.path.abspath(os.path.join(out_dir, track_file_stem(track))))
+        state, path = job["outputs"].claim(key, job)
+        # опрос и готовый дубль — не загрузки: в выборку AIMD и в retries не идут
+        if state == InFlight.BUSY:
+            concurrency.skip_sample()
+            job["retry_in"] = DEDUP_POLL_S
+            return WAIT
+        if state == InFlight.DONE and path and os.path.exists(path):
+            concurrency.skip_sample()
+            job["file_path"], job["deduped"] = path, True
+            return DONE
+        if state == InFlight.OWNER:
+            job["output_key"] = key
+    print(f"Скачивание [{job['idx']}/{job['total']}]: {_track_label(track)}")
+    errors = []
+    with tracing.track(job["seq"], _track_label(track)):
+        result = download_audio(track, out_dir, job["cookies_file"], file_stem=stem, errors=errors,
+                                match=job.get("match"))
+    if result == "age_restricted":
+        job["error"] = "требуются куки"
+        # с монитором трек ждёт новых cookies в конвейере, без него — ошибка трека
+        monitor = job.get("cookie_monitor")
+        return monitor.park(job) if monitor is not None else DONE
+    if not isinstance(result, dict):
+        return _retry_or_fail(job, errors[-1] if errors else None, "ошибка загрузки")
+    job["raw"] = result
+    job["out_dir"], job["stem"] = out_dir, stem or track_file_stem(track)
+    # обложка нужна уже ffmpeg; сеть — забота этого пула, а не пула по числу ядер
+    with tracing.track(job["seq"], _track_label(track)):
+        job["cover"] = _normalize_cover_jpeg(track.get("cover_url") or "")
+    return NEXT
+
+def _stage_transcode(job: dict) -> str:
+    """Этап 3: ffmpeg (перекодирование или перепаковка) — отдельный пул по числу ядер."""
+    raw = job["raw"]
+    try:
+        with tracing.track(job["seq"], _track_label(job["track"])), \
+                tracing.span("ffmpeg", format=CLI_SETTINGS.get("audio_format"), acodec=raw.get("acodec")):
+            job["file_path"], job["tagged"] = transcode.transcode(
+                raw["path"], job["out_dir"], job["stem"], CLI_SETTINGS.get("audio_format"),
+                acodec=raw.get("acodec"),
+                bitrate_kbps=CLI_SETTINGS.get("audio_bitrate_kbps", 320),
+                threads=CLI_SETTINGS.get("ffmpeg_threads", 1),
+                tags=ffmpeg_tags(job["track"], job.get("cover") or (b"", "", "")),
+            )
+    except Exception as e:
+        print(f"Ошибка конвертации {job['track']['title']}: {e}")
+        job["error"] = "ошибка конвертации"
+        return DONE
+    return NEXT
+
+def _stage_tag(job: dict) -> str:
+    """Этап 4: теги + обложка (если их не записал ffmpeg); файл из хранилища затем раскладывается в папку плейлиста."""
+    if not job.get("tagged"):
+        with tracing.track(job["seq"], _track_label(job["track"])):
+            write_tags_unified(job["file_path"], job["track"], job.get("cover"))
+    if job.get("store_claimed"):
+        store, track = job["store"], job["track"]
+        final = store.commit(track, job["file_path"])
+        job["file_path"] = store.place(final, job["output_dir"], track_file_name(track, _ext_of(final)))
+    return DONE
+
+def _info_ydl_opts(cookies_file: str | None) -> dict:
+    opts = {'quiet': True, 'no_warnings': True, 'extract_flat': True}
+    if cookies_file and os.path.exists(cookies_file):
+        opts['cookiefile'] = cookies_file
+    return opts
 
-        if cover_bytes:
-            try:
-                pic = Picture()
-                pic.type = 3  
-                pic.desc = "Cover"
-                pic.mime = cover_mime  
-                pic.data = cover_bytes
-                audio.add_picture(pic)
-            except Exception:
-                pass
+def make_job(idx: int, total: int, track: dict, output_dir: str, cookies_file: str | None,
+             manifest=None, source=None, store=None) -> dict:
+    """
+    Задание конвейера: трек + куда его класть.
+    manifest (SyncManifest), source и store (TrackStore) — по желанию.
+    """
+    return {
+        "idx": idx,
+        "total": total,
+        "track": track,
+        "output_dir": output_dir,
+        "cookies_file": cookies_file,
+        "ydl_opts": _info_ydl_opts(cookies_file),
+        "manifest": manifest,
+        "source": source,
+        "store": store,
+    }
 
-        audio.save()
+def _log_concurrency(msg: str):
+    print(f"Авто-потоки {msg}")
+
+def make_limiters() -> dict:
+    """{"search": AIMDLimit, "download": AIMDLimit} в режиме auto, иначе {}: число потоков фиксировано."""
+    if CLI_SETTINGS.get("concurrency") != "auto":
+        return {}
+    s_lo, s_hi = CLI_SETTINGS.get("search_bounds") or (2, 32)
+    d_lo, d_hi = CLI_SETTINGS.get("download_bounds") or (1, 16)
+    return {
+        # стартуем с фиксированных значений — дальше контроллер подстроит их сам
+        "search": concurrency.AIMDLimit("search", CLI_SETTINGS.get("search_threads", 8), s_lo, s_hi,
+                                        log=_log_concurrency),
+        "download": concurrency.AIMDLimit("download", CLI_SETTINGS.get("threads", 4), d_lo, d_hi,
+                                          log=_log_concurrency),
+    }
 
-def process_track(args):
-    idx, track, total, output_dir, cookies_file = args
-    print(f"Скачивание [{idx}/{total}]: {track['artist']} - {track['title']}")
-    
-    result = download_audio(track, output_dir, cookies_file)
-    if result is True:
-        final_ext = "mp3" if CLI_SETTINGS.get("audio_format", "mp3") == "mp3" else "flac"
-        file_name = f"{sanitize_filename(track['artist'])} - {sanitize_filename(track['title'])}.{final_ext}"
-        file_path = os.path.join(output_dir, file_name)
-        if os.path.exists(file_path):
-            write_tags_unified(file_path, track)
-            return None
+def run_jobs(jobs, on_stage=None, on_done=None, on_deferred=None) -> dict:
+    """
+    Гонит задания (make_job) через конвейер «поиск → загрузка → ffmpeg → теги».
+    У каждого этапа свой пул и ограниченная очередь, так что первые файлы
+    появляются сразу, а сеть и CPU работают одновременно. Задания могут идти
+    из разных плейлистов — бюджет потоков у них общий.
+    jobs может быть генератором (страницы плейлиста по мере загрузки).
+    Треки с возрастным ограничением ждут новых cookies (CookieMonitor); если больше
+    ждать нечего — зовётся on_deferred(число треков): вернул True — cookies обновлены.
+    Возвращает {"failed": [...], "age_restricted": [...], "stats": {...}}.
+    """
+    failed, age_restricted = [], []
+    counts = {"retries": 0, "recovered": 0, "deduped": 0}
+    outputs = InFlight()
+    lock = threading.Lock()
+
+    def _done(job):
+        if job.get("store_claimed"):
+            job["store"].release(job["track"])
+        err = job.get("error")
+        if job.get("output_key"):
+            outputs.finish(job["output_key"], job, None if err else job.get("file_path"))
+        with lock:
+            counts["retries"] += job.get("attempts", 0)
+            counts["deduped"] += 1 if job.get("deduped") else 0
+        if err:
+            line = f"{_track_label(job['track'])} ({err})"
+            with lock:
+                (age_restricted if err == "требуются куки" else failed).append(line)
         else:
-            return f"{track['artist']} - {track['title']} (файл не создан)"
-    elif result == "age_restricted":
-        return f"{track['artist']} - {track['title']} (требуются куки)"
-    else:
-        return f"{track['artist']} - {track['title']} (ошибка загрузки)"
+            if job.get("attempts"):
+                with lock:
+                    counts["recovered"] += 1
+            if job.get("manifest") is not None and job.get("file_path"):
+                job["manifest"].add(job["track"], job["file_path"])
+        if on_done:
+            on_done(job)
+
+    limiters = make_limiters()
+    def _idle(held):
+        # остальная работа сделана — ждут только треки, которым нужны cookies
+        if monitor.poll(force=True) or on_deferred is None:
+            return
+        try:
+            refreshed = on_deferred(held)
+        except Exception:
+            refreshed = False
+        if refreshed:
+            monitor.poll(force=True)
+
+    pipe = Pipeline(on_done=_done, on_stage=on_stage, on_worker_exit=ydl_pool.release_thread,
+                    on_idle=_idle)
+    monitor = CookieMonitor(pipe)
+    pipe.add_stage("search", _stage_search, workers=CLI_SETTINGS.get("search_threads", 8),
+                   limiter=limiters.get("search"))
+    pipe.add_stage("download", _stage_download, workers=CLI_SETTINGS.get("threads", 4),
+                   limiter=limiters.get("download"))
+    pipe.add_stage("transcode", _stage_transcode, workers=CLI_SETTINGS.get("transcode_threads", CPU_COUNT))
+    pipe.add_stage("tag", _stage_tag, workers=TAG_THREADS)
+
+    def _numbered():
+        # сквозной номер задания (дорожка трека в трассе)
+        for seq, job in enumerate(jobs, 1):
+            job["seq"] = seq
+            job["outputs"] = outputs
+            job["cookie_monitor"] = monitor
+            yield job
+
+    before = search_stats_snapshot()
+    covers_before = covers.stats_snapshot()
+    transcode_before = transcode.stats_snapshot()
+    limits_before = rate_limit.stats_snapshot()
+    monitor.start()
+    try:
+        pipe.run(_numbered())
+    finally:
+        monitor.stop()
+    after = search_stats_snapshot()
+    covers_after = covers.stats_snapshot()
+    transcode_after = transcode.stats_snapshot()
+    limits_after = rate_limit.stats_snapshot()
+
+    search = pipe.stage("search")
+    search_span = (search.last_at or pipe.started_at) - pipe.started_at
+    searched = after["tracks"] - before["tracks"]
+    stats = {
+        "search_rate": search.processed / max(search_span, 1e-6),
+        "queries_per_track": (after["queries"] - before["queries"]) / searched if searched else 0.0,
+        "early_exits": after["early_exits"] - before["early_exits"],
+        "covers": {k: covers_after[k] - covers_before[k] for k in covers_after},
+        "transcode": {k: transcode_after[k] - transcode_before[k] for k in transcode_after},
+        "concurrency": {name: lim.snapshot() for name, lim in limiters.items()},
+        "rate_limit": {name: {k: v - limits_before.get(name, {}).get(k, 0) for k, v in cur.items()}
+                       for name, cur in limits_after.items()},
+        "retries": counts["retries"],
+        "recovered": counts["recovered"],
+        # дубли треков в прогоне: поисков не сделано / загрузок не сделано
+        "shared_searches": after["shared"] - before["shared"],
+        "deduped": counts["deduped"],
+        "cookies_resumed": monitor.resumed,
+        "first_file_s": (pipe.first_done_at - pipe.started_at) if pipe.first_done_at else None,
+        "stages": pipe.stage_stats(),
+    }
+    return {"failed": failed, "age_restricted": age_restricted, "stats": stats}
+
+def process_track(job: dict) -> bool:
+    """
+    Один трек (make_job) целиком в текущем потоке: те же этапы, что в run_jobs, по очереди.
+    Временные сбои повторяются после паузы job["retry_in"]; трек с возрастным ограничением —
+    ошибка (ждать новых cookies некому). True — файл готов (job["file_path"]).
+    """
+    job.setdefault("seq", job.get("idx", 1))
+    try:
+        for stage in (_stage_search, _stage_download, _stage_transcode, _stage_tag):
+            res = stage(job)
+            while res in (RETRY, WAIT):
+                time.sleep(job.pop("retry_in", 1.0))
+                res = stage(job)
+            if res != NEXT:
+                break
+    finally:
+        if job.get("store_claimed"):
+            job["store"].release(job["track"])
+            job["store_claimed"] = False
+    return not job.get("error") and bool(job.get("file_path"))
+
+def run_playlist_pipeline(tracks, output_dir: str, cookies_file: str | None,
+                          on_stage=None, on_done=None, manifest=None, total: int | None = None,
+                          store=None, on_deferred=None) -> dict:
+    """
+    Один плейлист через run_jobs. tracks может быть генератором.
+    Если передан manifest (SyncManifest) — скачанные треки записываются в него,
+    store (TrackStore) — треки берутся из общего хранилища и попадают в него.
+    """
+    if total is None:
+        total = len(tracks)
+    jobs = (make_job(idx, total, track, output_dir, cookies_file, manifest, store=store)
+            for idx, track in enumerate(tracks, 1))
+    return run_jobs(jobs, on_stage=on_stage, on_done=on_done, on_deferred=on_deferred)
 
 def main():
+    # С аргументами командной строки — пакетный режим без меню (cron, планировщики)
+    if len(sys.argv) > 1:
+        import batch_cli
+        sys.exit(batch_cli.run(sys.argv[1:], sys.modules[__name__]))
+
     global BASE_MUSIC_DIR
     _load_cli_settings_from_config()
     global DEBUG
     DEBUG = CLI_SETTINGS["debug"]
+    tracing.enable(CLI_SETTINGS["trace"])
+    rate_limit.configure(CLI_SETTINGS["rate_limits"])
 
     BASE_MUSIC_DIR = ensure_music_dir(console)
 
@@ -693,7 +1249,7 @@ def main():
         cookies_file = find_cookie_file()
         if cookies_file:
             console.print(f"[muted]Найден cookies.txt:[/muted] {cookies_file}")
-            if not check_cookies_validity(cookies_file):
+            if not cookies_status(cookies_file)[1]:
                 console.print("[warn]cookies.txt недействителен или устарел[/warn]")
         else:
             console.print("[muted]cookies.txt не найден[/muted]")
@@ -720,6 +1276,7 @@ def main():
             ok = automated_cookies_refresh()
             if ok:
                 cookies_file = find_cookie_file() or cookie_default_path()
+                ydl_pool.invalidate()
         elif choice == 4:
             cli_check_cookies()
             Prompt.ask("\n[dim]Enter для возврата[/dim]", default="", show_default=False)
@@ -736,6 +1293,11 @@ def main():
 
 def show_main_menu() -> int:
     subtitle = f"[dim]Папка музыки:[/dim] {BASE_MUSIC_DIR or '(не задано)'}"
+    match_cache = get_match_cache()
+    if match_cache is not None:
+        st = match_cache.stats()
+        subtitle += (f"\n[dim]Кеш совпадений:[/dim] {st['size']} записей, "
+                     f"попаданий {st['hits']} / промахов {st['misses']}")
     options = [
         "Скачать плейлист Spotify по URL",
         "Скачать ОДИН трек (Spotify / YouTube)",
@@ -759,60 +1321,160 @@ def cli_download_playlist(cookies_file: str | None):
     if playlist_url is None or not playlist_url:
         return
 
-    # Страница №2 — получаем инфу
+    # Страница №2 — получаем инфу (первая страница треков приходит сразу, остальные — потоком)
     ui_page("Скачать плейлист", "[muted]Получаю информацию о плейлисте...[/muted]")
     try:
-        playlist_name, owner_name, tracks = get_spotify_playlist_info(playlist_url)
+        playlist_name, owner_name, total, pages = open_spotify_playlist(playlist_url)
     except Exception as e:
         ui_page("Скачать плейлист", f"[red]Ошибка Spotify API:[/red] {e}\n\n[dim]Нажми Enter для возврата[/dim]")
         Prompt.ask("", default="", show_default=False)
         return
 
-    if not tracks:
+    if not total:
         ui_page("Скачать плейлист", "[yellow]В плейлисте не нашлось треков[/yellow]\n\n[dim]Enter для возврата[/dim]")
         Prompt.ask("", default="", show_default=False)
         return
 
-    subtitle = f"[ok]Найдено треков:[/ok] {len(tracks)}\n[dim]{playlist_name} — {owner_name}[/dim]"
+    subtitle = f"[ok]Найдено треков:[/ok] {total}\n[dim]{playlist_name} — {owner_name}[/dim]"
     ui_page("Скачать плейлист", subtitle)
 
-    # Создаём подпапку в BASE_MUSIC_DIR
+    # Создаём подпапку в BASE_MUSIC_DIR (или синхронизируем уже существующую).
+    # В режиме библиотеки m3u папки нет: файлы лежат в общем хранилище, плейлист — .m3u8
+    store = get_track_store(BASE_MUSIC_DIR)
     base_dir_name = f"{playlist_name} ({owner_name})"
     output_dir = os.path.join(BASE_MUSIC_DIR, base_dir_name)
-    counter = 1
-    while os.path.exists(output_dir):
-        output_dir = os.path.join(BASE_MUSIC_DIR, f"{base_dir_name}_{counter}")
-        counter += 1
+    m3u_mode = store is not None and store.mode == "m3u"
+    sync = False
+    if m3u_mode:
+        output_dir = store.root
+    elif os.path.isdir(output_dir):
+        sync = Confirm.ask(
+            "Папка плейлиста уже есть. Синхронизировать её (скачать только новые треки)?\n"
+            "[dim]Нет — создать новую копию рядом[/dim]",
+            default=True,
+        )
+    if not sync and not m3u_mode:
+        counter = 1
+        while os.path.exists(output_dir):
+            output_dir = os.path.join(BASE_MUSIC_DIR, f"{base_dir_name}_{counter}")
+            counter += 1
     os.makedirs(output_dir, exist_ok=True)
 
-    # 1) Поиск кандидатов
-    info_ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': True}
-    if cookies_file and os.path.exists(cookies_file):
-        info_ydl_opts['cookiefile'] = cookies_file
+    manifest = None
+    if not m3u_mode:
+        manifest = SyncManifest(output_dir)
+        manifest.playlist_url = playlist_url
 
-    ui_page("Скачать плейлист", "[title]Поиск треков на YouTube[/title]")
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("{task.completed}/{task.total}"),
-        TimeElapsedColumn(),
-        console=console,
-    ) as progress:
-        t1 = progress.add_task("Поиск...", total=len(tracks))
-        for track in tracks:
-            find_best_match(track, info_ydl_opts, cookies_file)
-            progress.update(t1, advance=1)
-    
-    clear_screen()
-    # 2) Загрузка
-    ui_page("Скачать плейлист", "[title]Загрузка аудио[/title]")
-    failed_tracks = []
-    age_restricted_tracks = []
+    # Страницы плейлиста подаются в конвейер по мере прихода: поиск стартует,
+    # не дожидаясь конца пагинации. В режиме синхронизации уже скачанное пропускаем.
+    tracks = []
+    skipped = [0]
+    fetch_error = [None]
 
-    def _worker(args):
-        return process_track(args)
+    def _stream():
+        try:
+            for _, page in pages:
+                for t in page:
+                    tracks.append(t)
+                    if sync:
+                        manifest.adopt_existing([t], track_file_name)
+                        if manifest.has(t):
+                            skipped[0] += 1
+                            continue
+                    yield t
+        except Exception as e:
+            fetch_error[0] = e
+
+    # Поиск → загрузка → теги идут конвейером: трек уходит качаться сразу после поиска
+    ui_page("Скачать плейлист", "[title]Поиск и загрузка[/title]")
+    if tracing.ENABLED:
+        tracing.reset()
+    result = _run_pipeline_with_progress(_stream(), output_dir, cookies_file, manifest, total=total, store=store)
+    failed_tracks = result["failed"]
+    age_restricted_tracks = result["age_restricted"]
+    stats = result["stats"]
+
+    sync_note = ""
+    if fetch_error[0] is not None:
+        sync_note += f"\n[warn]Плейлист получен не полностью:[/warn] {fetch_error[0]}"
+    if sync:
+        sync_note += (f"\n[dim]Синхронизация:[/dim] новых {len(tracks) - skipped[0]}, "
+                      f"уже скачано {skipped[0]}")
+        # Без полного списка треков нельзя судить, что из плейлиста удалено
+        removed = manifest.removed({track_key(t) for t in tracks}) if fetch_error[0] is None else []
+        if removed:
+            ui_page("Скачать плейлист",
+                    f"[warn]Треков больше нет в плейлисте: {len(removed)}[/warn]\n"
+                    + "\n".join(f" • {v['artist']} - {v['title']}" for _, v in removed[:20])
+                    + ("\n ..." if len(removed) > 20 else ""))
+            if Confirm.ask("Удалить их файлы из папки?", default=False):
+                deleted = manifest.prune(k for k, _ in removed)
+                sync_note += f", удалено {deleted}"
+            else:
+                sync_note += f", [warn]нет в плейлисте {len(removed)}[/warn] (оставлены)"
+
+    if manifest is not None:
+        manifest.save()
+    if m3u_mode:
+        m3u_path = os.path.join(BASE_MUSIC_DIR, f"{base_dir_name}.m3u8")
+        written = write_playlist_m3u(store, m3u_path, tracks)
+        sync_note += f"\n[dim]Плейлист M3U:[/dim] {m3u_path} ({written} треков)"
+    if store is not None:
+        st = store.stats_snapshot()
+        sync_note += (f"\n[dim]Библиотека:[/dim] из хранилища {st['hits']}, добавлено {st['stored']}"
+                      f" [dim](ссылок {st['links'] + st['reflinks']}, копий {st['copies']})[/dim]")
 
+    if failed_tracks or age_restricted_tracks:
+        msg = "[warn]Не удалось скачать:[/warn]\n" + "\n".join(f" • {t}" for t in (failed_tracks + age_restricted_tracks))
+    else:
+        msg = "[ok]Готово! Все треки скачаны.[/ok]"
+    msg += sync_note
+    msg += f"\n[dim]Скорость поиска:[/dim] {stats['search_rate']:.1f} поисков/с"
+    msg += (f"\n[dim]Запросов к YouTube на трек:[/dim] {stats['queries_per_track']:.2f}"
+            f" [dim](ранний выход: {stats['early_exits']})[/dim]")
+    cv = stats["covers"]
+    msg += (f"\n[dim]Обложки:[/dim] скачано {cv['fetches']}, из кеша "
+            f"{cv['memory_hits'] + cv['disk_hits'] + cv['shared_waits']} "
+            f"[dim](сэкономлено {cv['bytes_saved'] // 1024} KB, {cv['cpu_saved_s']:.1f} с CPU)[/dim]")
+    if cv["connections"] or cv["not_modified"]:
+        msg += (f"\n[dim]Соединения для обложек:[/dim] открыто {cv['connections']}, "
+                f"переиспользовано {cv['connections_reused']} [dim](не изменились, 304: {cv['not_modified']})[/dim]")
+    sc = spotify_client.stats_snapshot()
+    msg += (f"\n[dim]Spotify:[/dim] токен из кеша {sc['tokens_reused']}, запрошен {sc['token_requests']}; "
+            f"соединений открыто {sc['connections']}, переиспользовано {sc['connections_reused']}")
+    for name, cc in stats["concurrency"].items():
+        msg += (f"\n[dim]Авто-потоки ({name}):[/dim] итог {cc['limit']} "
+                f"[dim](границы {cc['lower']}–{cc['upper']}, изменений {len(cc['decisions'])})[/dim]")
+    # wait_s — суммарно по всем потокам, включая паузы после 429
+    waits = {name: rl for name, rl in stats["rate_limit"].items() if rl["wait_s"] >= 0.1 or rl["limited"]}
+    if waits:
+        msg += "\n[dim]Ожидание лимитов запросов:[/dim] " + ", ".join(
+            f"{name} {rl['wait_s']:.1f} с" + (f" (429: {rl['limited']})" if rl["limited"] else "")
+            for name, rl in waits.items())
+    if stats["retries"]:
+        msg += (f"\n[dim]Повторы после временных сбоев:[/dim] {stats['retries']} "
+                f"[dim](спасено треков: {stats['recovered']})[/dim]")
+    if stats["shared_searches"] or stats["deduped"]:
+        msg += (f"\n[dim]Дубли треков:[/dim] поисков не понадобилось {stats['shared_searches']}, "
+                f"загрузок — {stats['deduped']}")
+    tc = stats["transcode"]
+    msg += (f"\n[dim]ffmpeg:[/dim] перекодировано {tc['transcoded']}, "
+            f"без перекодирования {tc['copied'] + tc['renamed']}, "
+            f"теги записаны сразу {tc['tagged']}")
+    if stats["first_file_s"] is not None:
+        msg += f"\n[dim]Первый файл через:[/dim] {stats['first_file_s']:.1f} с"
+    if tracing.ENABLED:
+        trace_path = tracing.export()
+        if trace_path:
+            msg += f"\n[dim]Трасса (chrome://tracing, ui.perfetto.dev):[/dim] {trace_path}"
+    ui_page("Скачать плейлист", f"{msg}\n\n[dim]Папка:[/dim] {output_dir}\n\n[dim]Enter для возврата[/dim]")
+    Prompt.ask("", default="", show_default=False)
+
+def _run_pipeline_with_progress(tracks, output_dir: str, cookies_file: str | None, manifest=None,
+                                total: int | None = None, store=None) -> dict:
+    """tracks может быть генератором — тогда total задаёт начальный размер полосы прогресса."""
+    if total is None:
+        total = len(tracks)
     with Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
@@ -821,54 +1483,40 @@ def cli_download_playlist(cookies_file: str | None):
         TimeElapsedColumn(),
         console=console,
     ) as progress:
-        t2 = progress.add_task("Скачивание...", total=len(tracks))
-        with concurrent.futures.ThreadPoolExecutor(max_workers=CLI_SETTINGS["threads"]) as executor:
-            args_list = [(idx, track, len(tracks), output_dir, cookies_file) for idx, track in enumerate(tracks, 1)]
-            for res in executor.map(_worker, args_list):
-                if res:
-                    if "(требуются куки)" in res:
-                        age_restricted_tracks.append(res)
-                    else:
-                        failed_tracks.append(res)
-                progress.update(t2, advance=1)
-
-    if age_restricted_tracks:
-        ui_page("Скачать плейлист", f"[warn]Треки с возрастным ограничением: {len(age_restricted_tracks)}[/warn]")
-        if Confirm.ask("Обновить cookies и попробовать ещё раз?"):
-            if refresh_cookies():
-                cookies_file = 'cookies.txt'
-                retry_track_names = [t.split(' (требуются куки)')[0] for t in age_restricted_tracks]
-                retry_tracks = [t for t in tracks if f"{t['artist']} - {t['title']}" in retry_track_names]
-
-                age_restricted_tracks = []
-
-                clear_screen()
-                ui_page("Скачать плейлист", "[title]Повторная загрузка[/title]")
-                with Progress(
-                    SpinnerColumn(),
-                    TextColumn("[progress.description]{task.description}"),
-                    BarColumn(),
-                    TextColumn("{task.completed}/{task.total}"),
-                    TimeElapsedColumn(),
-                    console=console,
-                ) as progress:
-                    t3 = progress.add_task("Скачивание...", total=len(retry_tracks))
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=CLI_SETTINGS["threads"]) as executor:
-                        args_list = [(idx, track, len(retry_tracks), output_dir, cookies_file) for idx, track in enumerate(retry_tracks, 1)]
-                        for res in executor.map(_worker, args_list):
-                            if res:
-                                if "(требуются куки)" in res:
-                                    age_restricted_tracks.append(res)
-                                else:
-                                    failed_tracks.append(res)
-                            progress.update(t3, advance=1)
+        t_search = progress.add_task("Поиск...", total=total)
+        t_done = progress.add_task("Скачивание...", total=total)
+        started = time.perf_counter()
+        searched = [0]
+
+        def _counted():
+            # когда поток треков закончился, знаем точное число заданий
+            fed = 0
+            for t in tracks:
+                fed += 1
+                yield t
+            progress.update(t_search, total=fed)
+            progress.update(t_done, total=fed)
+
+        def _on_stage(stage_name, job):
+            if stage_name == "search":
+                searched[0] += 1
+                rate = searched[0] / max(time.perf_counter() - started, 1e-6)
+                progress.update(t_search, advance=1, description=f"Поиск... {rate:.1f}/с")
+
+        def _on_done(job):
+            progress.update(t_done, advance=1)
+
+        def _on_deferred(held):
+            # прогон ещё идёт: обновлённые cookies подхватит он же, треки докачаются в тот же пул
+            progress.stop()
+            try:
+                console.print(f"\n[warn]Треки с возрастным ограничением ждут cookies: {held}[/warn]")
+                return Confirm.ask("Обновить cookies и докачать их сейчас?") and refresh_cookies()
+            finally:
+                progress.start()
 
-    if failed_tracks or age_restricted_tracks:
-        msg = "[warn]Не удалось скачать:[/warn]\n" + "\n".join(f" • {t}" for t in (failed_tracks + age_restricted_tracks))
-    else:
-        msg = "[ok]Готово! Все треки скачаны.[/ok]"
-    ui_page("Скачать плейлист", f"{msg}\n\n[dim]Папка:[/dim] {output_dir}\n\n[dim]Enter для возврата[/dim]")
-    Prompt.ask("", default="", show_default=False)
+        return run_playlist_pipeline(_counted(), output_dir, cookies_file, on_stage=_on_stage, on_done=_on_done,
+                                     manifest=manifest, total=total, store=store, on_deferred=_on_deferred)
 
 
 # ==== NEW (CLI) ====
@@ -878,7 +1526,7 @@ def cli_check_cookies():
         console.print("[warn]cookies.txt не найден[/warn]")
         console.print("[muted]Искал в:[/muted]\n" + "\n".join(f" • {p}" for p in cookie_candidates()))
         return
-    ok = check_cookies_validity(path)
+    ok = cookies_status(path, force=True)[1]
     console.print(f"[ok]cookies.txt валиден[/ok] [dim]({path})[/dim]" if ok else f"[warn]cookies.txt недействителен или устарел[/warn] [dim]({path})[/dim]")
 
 
@@ -891,34 +1539,72 @@ def cli_settings():
         table.add_column("Параметр", style="ok")
         table.add_column("Значение", style="muted")
         table.add_row("Потоки загрузки", str(CLI_SETTINGS["threads"]))
+        table.add_row("Потоки поиска", str(CLI_SETTINGS["search_threads"]))
+        if CLI_SETTINGS["concurrency"] == "auto":
+            sb, db = CLI_SETTINGS["search_bounds"], CLI_SETTINGS["download_bounds"]
+            table.add_row("Режим потоков", f"auto (поиск {sb[0]}–{sb[1]}, загрузка {db[0]}–{db[1]})")
+        else:
+            table.add_row("Режим потоков", "fixed")
+        table.add_row("Лимиты запросов (в секунду)", ", ".join(
+            f"{k} {v:g}" if v else f"{k} —" for k, v in CLI_SETTINGS["rate_limits"].items()))
+        table.add_row("Потоки конвертации", str(CLI_SETTINGS["transcode_threads"]))
+        table.add_row("Потоков на один ffmpeg", str(CLI_SETTINGS["ffmpeg_threads"]))
+        table.add_row("Стратегия поиска", CLI_SETTINGS["search_plan"])
         table.add_row("Формат аудио", CLI_SETTINGS["audio_format"])
         table.add_row("Качество аудио (kbps)", str(CLI_SETTINGS["audio_bitrate_kbps"]))
         table.add_row("Режим отладки (DEBUG)", "Вкл" if CLI_SETTINGS["debug"] else "Выкл")
+        table.add_row("Трассировка этапов", "Вкл" if CLI_SETTINGS["trace"] else "Выкл")
+        table.add_row("Библиотека", CLI_SETTINGS["library_mode"])
         console.print(table)
 
         console.print(
             "[muted]Пояснения:[/muted]\n"
             "- [bold]Потоки[/bold]: больше — быстрее, но выше шанс ошибок.\n"
-            "- [bold]Формат[/bold]: mp3 (с потерями) / flac (без потерь).\n"
+            "- [bold]Режим потоков[/bold]: auto — число поисков и загрузок подбирается на ходу "
+            "(растёт, пока растёт скорость, и падает при ошибках и троттлинге YouTube); "
+            "значения выше — стартовые.\n"
+            "- [bold]Лимиты запросов[/bold]: сколько запросов в секунду отправлять в поиск YouTube, "
+            "Spotify и за обложками (0 — без лимита). На ответ 429 программа сама делает паузу.\n"
+            "- [bold]Потоки поиска[/bold]: параллельные поиски на YouTube (отдельно от загрузки).\n"
+            "- [bold]Потоки конвертации[/bold]: одновременные процессы ffmpeg — по числу ядер, "
+            "от числа загрузок не зависят. [bold]Потоков на один ffmpeg[/bold]: 1 — лучше всего, "
+            "когда конвертаций много параллельно.\n"
+            "- [bold]Стратегия поиска[/bold]: adaptive — до 4 запросов с ранним выходом, "
+            "merged — 2 запроса по 10 результатов, full — всегда все 4 запроса.\n"
+            "- [bold]Формат[/bold]: mp3 / flac — перекодирование через ffmpeg; native — дорожка YouTube "
+            "как есть (обычно .opus), opus / m4a — без перекодирования, если на YouTube есть такая дорожка. "
+            "Без перекодирования быстрее и без лишней потери качества.\n"
             "- [bold]Качество[/bold]: влияет только на MP3 (320 лучше, 160 экономит место).\n"
-            "- [bold]DEBUG[/bold]: подробные логи.",
+            "- [bold]DEBUG[/bold]: подробные логи.\n"
+            "- [bold]Трассировка[/bold]: после скачивания плейлиста сохраняет трассу этапов "
+            "(открыть в chrome://tracing или ui.perfetto.dev).\n"
+            "- [bold]Библиотека[/bold]: folders — отдельная копия трека в папке каждого плейлиста; "
+            "links — один файл на трек в _Library, в папках плейлистов жёсткие ссылки; "
+            "m3u — один файл на трек в _Library, плейлисты — файлы .m3u8.",
         )
 
         m = Table(show_header=True, header_style="title")
         m.add_column("#", justify="right", style="muted")
         m.add_column("Действие", style="ok")
         m.add_row("1", "Изменить число потоков")
-        m.add_row("2", "Выбрать ФОРМАТ аудио (1=mp3, 2=flac)")
-        m.add_row("3", "Выбрать КАЧЕСТВО для MP3 (1=320, 2=160)")
-        m.add_row("4", "Переключить DEBUG")
-        m.add_row("5", "Назад")
+        m.add_row("2", "Изменить число потоков поиска")
+        m.add_row("3", "Выбрать СТРАТЕГИЮ поиска (1=adaptive, 2=merged, 3=full)")
+        m.add_row("4", "Выбрать ФОРМАТ аудио (1=mp3, 2=flac, 3=native, 4=opus, 5=m4a)")
+        m.add_row("5", "Выбрать КАЧЕСТВО для MP3 (1=320, 2=160)")
+        m.add_row("6", "Переключить DEBUG")
+        m.add_row("7", "Переключить трассировку")
+        m.add_row("8", "Выбрать БИБЛИОТЕКУ (1=folders, 2=links, 3=m3u)")
+        m.add_row("9", "Изменить число потоков КОНВЕРТАЦИИ (ffmpeg)")
+        m.add_row("10", "Изменить число потоков на один ffmpeg")
+        m.add_row("11", "Выбрать РЕЖИМ потоков (1=fixed, 2=auto) и границы")
+        m.add_row("12", "Изменить ЛИМИТЫ запросов (поиск, Spotify, обложки)")
+        m.add_row("13", "Назад")
         console.print(m)
 
-        choice = IntPrompt.ask("Выбери пункт", choices=["1","2","3","4","5"])
+        choice = IntPrompt.ask("Выбери пункт", choices=[str(i) for i in range(1, 14)])
 
         if choice == 1:
-            cpu = os.cpu_count() or 4
-            max_threads = max(1, min(16, cpu * 2))
+            max_threads = MAX_DOWNLOAD_THREADS
             console.print(f"[muted]Допустимо от 1 до {max_threads}[/muted]")
             while True:
                 new_threads = IntPrompt.ask("Сколько потоков использовать?", default=CLI_SETTINGS["threads"])
@@ -930,37 +1616,136 @@ def cli_settings():
                 console.print(f"[warn]Укажи число от 1 до {max_threads}[/warn]")
 
         elif choice == 2:
-            console.print("[muted]1 = mp3 (с потерями), 2 = flac (без потерь)[/muted]")
-            sel = IntPrompt.ask("Формат", choices=["1","2"],
-                                default="1" if CLI_SETTINGS["audio_format"] == "mp3" else "2")
-            CLI_SETTINGS["audio_format"] = "mp3" if sel == 1 else "flac"
+            max_search = 32
+            console.print(f"[muted]Допустимо от 1 до {max_search}[/muted]")
+            while True:
+                new_threads = IntPrompt.ask("Сколько параллельных поисков?", default=CLI_SETTINGS["search_threads"])
+                if 1 <= new_threads <= max_search:
+                    CLI_SETTINGS["search_threads"] = new_threads
+                    _save_cli_settings_to_config()
+                    console.print(f"[ok]Сохранено: search_threads={new_threads}[/ok]")
+                    break
+                console.print(f"[warn]Укажи число от 1 до {max_search}[/warn]")
+
+        elif choice == 3:
+            plans = ["adaptive", "merged", "full"]
+            current = CLI_SETTINGS["search_plan"] if CLI_SETTINGS["search_plan"] in plans else "adaptive"
+            sel = IntPrompt.ask("Стратегия", choices=["1","2","3"], default=str(plans.index(current) + 1))
+            CLI_SETTINGS["search_plan"] = plans[int(sel) - 1]
+            _save_cli_settings_to_config()
+            console.print(f"[ok]Сохранено: стратегия поиска = {CLI_SETTINGS['search_plan']}[/ok]")
+
+        elif choice == 4:
+            formats = ["mp3", "flac", "native", "opus", "m4a"]
+            console.print("[muted]1 = mp3, 2 = flac (перекодирование); "
+                          "3 = native, 4 = opus, 5 = m4a (без перекодирования)[/muted]")
+            current = audio_formats.normalize(CLI_SETTINGS["audio_format"])
+            sel = IntPrompt.ask("Формат", choices=["1","2","3","4","5"], default=str(formats.index(current) + 1))
+            CLI_SETTINGS["audio_format"] = formats[int(sel) - 1]
             _save_cli_settings_to_config()
             console.print(f"[ok]Сохранено: формат = {CLI_SETTINGS['audio_format']}[/ok]")
 
-        elif choice == 3:
+        elif choice == 5:
             if CLI_SETTINGS["audio_format"] != "mp3":
-                console.print("[warn]Качество влияет только на MP3. Для FLAC игнорируется.[/warn]")
+                console.print("[warn]Качество влияет только на MP3. Для остальных форматов игнорируется.[/warn]")
             sel = IntPrompt.ask("Качество MP3", choices=["1","2"],
                                 default="1" if CLI_SETTINGS["audio_bitrate_kbps"] == 320 else "2")
             CLI_SETTINGS["audio_bitrate_kbps"] = 320 if sel == 1 else 160
             _save_cli_settings_to_config()
             console.print(f"[ok]Сохранено: {CLI_SETTINGS['audio_bitrate_kbps']} kbps[/ok]")
 
-        elif choice == 4:
+        elif choice == 6:
             CLI_SETTINGS["debug"] = not CLI_SETTINGS["debug"]
             global DEBUG
             DEBUG = CLI_SETTINGS["debug"]
             _save_cli_settings_to_config()
             console.print(f"[ok]DEBUG {'включен' if DEBUG else 'выключен'}[/ok]")
 
-        elif choice == 5:
+        elif choice == 7:
+            CLI_SETTINGS["trace"] = not CLI_SETTINGS["trace"]
+            tracing.enable(CLI_SETTINGS["trace"])
+            _save_cli_settings_to_config()
+            console.print(f"[ok]Трассировка {'включена' if CLI_SETTINGS['trace'] else 'выключена'}[/ok]")
+
+        elif choice == 8:
+            modes = ["folders", "links", "m3u"]
+            current = CLI_SETTINGS["library_mode"] if CLI_SETTINGS["library_mode"] in modes else "folders"
+            sel = IntPrompt.ask("Библиотека", choices=["1","2","3"], default=str(modes.index(current) + 1))
+            CLI_SETTINGS["library_mode"] = modes[int(sel) - 1]
+            _save_cli_settings_to_config()
+            console.print(f"[ok]Сохранено: библиотека = {CLI_SETTINGS['library_mode']}[/ok]")
+
+        elif choice == 9:
+            max_workers = max(1, CPU_COUNT * 2)
+            console.print(f"[muted]Допустимо от 1 до {max_workers} (ядер: {CPU_COUNT})[/muted]")
+            while True:
+                n = IntPrompt.ask("Сколько одновременных ffmpeg?", default=CLI_SETTINGS["transcode_threads"])
+                if 1 <= n <= max_workers:
+                    CLI_SETTINGS["transcode_threads"] = n
+                    _save_cli_settings_to_config()
+                    console.print(f"[ok]Сохранено: transcode_threads={n}[/ok]")
+                    break
+                console.print(f"[warn]Укажи число от 1 до {max_workers}[/warn]")
+
+        elif choice == 10:
+            console.print(f"[muted]0 = авто (все ядра), иначе от 1 до {CPU_COUNT}[/muted]")
+            while True:
+                n = IntPrompt.ask("Потоков на один ffmpeg", default=CLI_SETTINGS["ffmpeg_threads"])
+                if 0 <= n <= CPU_COUNT:
+                    CLI_SETTINGS["ffmpeg_threads"] = n
+                    _save_cli_settings_to_config()
+                    console.print(f"[ok]Сохранено: ffmpeg_threads={n}[/ok]")
+                    break
+                console.print(f"[warn]Укажи число от 0 до {CPU_COUNT}[/warn]")
+
+        elif choice == 11:
+            sel = IntPrompt.ask("Режим", choices=["1","2"],
+                                default="2" if CLI_SETTINGS["concurrency"] == "auto" else "1")
+            CLI_SETTINGS["concurrency"] = "auto" if sel == 2 else "fixed"
+            if CLI_SETTINGS["concurrency"] == "auto":
+                for key, label, top in (("search_bounds", "поиска", 32),
+                                        ("download_bounds", "загрузки", MAX_DOWNLOAD_THREADS)):
+                    lo, hi = CLI_SETTINGS[key]
+                    while True:
+                        lo = IntPrompt.ask(f"Минимум потоков {label}", default=lo)
+                        hi = IntPrompt.ask(f"Максимум потоков {label}", default=hi)
+                        if 1 <= lo <= hi <= top:
+                            CLI_SETTINGS[key] = [lo, hi]
+                            break
+                        console.print(f"[warn]Нужно 1 ≤ минимум ≤ максимум ≤ {top}[/warn]")
+            _save_cli_settings_to_config()
+            console.print(f"[ok]Сохранено: режим потоков = {CLI_SETTINGS['concurrency']}[/ok]")
+
+        elif choice == 12:
+            labels = {"search": "Поиск YouTube", "spotify": "Spotify API", "cover": "Обложки"}
+            console.print("[muted]Запросов в секунду, 0 — без ограничения[/muted]")
+            for key, label in labels.items():
+                while True:
+                    raw = Prompt.ask(label, default=f"{CLI_SETTINGS['rate_limits'].get(key, 0):g}")
+                    try:
+                        value = float(raw.replace(",", "."))
+                    except ValueError:
+                        value = -1
+                    if value >= 0:
+                        CLI_SETTINGS["rate_limits"][key] = value
+                        break
+                    console.print("[warn]Укажи число ≥ 0[/warn]")
+            rate_limit.configure(CLI_SETTINGS["rate_limits"])
+            _save_cli_settings_to_config()
+            console.print("[ok]Сохранено: лимиты запросов[/ok]")
+
+        elif choice == 13:
             break
 
         Prompt.ask("\n[muted]Enter — вернуться в меню настроек[/muted]", default="", show_default=False)
 
 
 def cli_clear_cache():
-    SEARCH_CACHE.clear()
+    with search_cache_lock:
+        SEARCH_CACHE.clear()
+    match_cache = get_match_cache()
+    if match_cache is not None:
+        match_cache.clear()
     console.print("[ok]Кеш поиска очищен[/ok]")
 
 def ui_page(title: str, subtitle: str | None = None):
@@ -0,0 +1,136 @@
+import os
+import base64
+
+import tracing
+
+# Теги и обложка для всех форматов, которые умеет сохранять приложение:
+# MP3 (ID3v2.3), FLAC, Ogg Opus/Vorbis (Vorbis comments + METADATA_BLOCK_PICTURE), MP4/M4A.
+# Общий код для плейлистов (spotify_downloader) и одиночных треков (single_track_cli).
+# mutagen импортируется внутри писателей — только нужный формат и только при первой записи.
+
+
+def _flac_picture(data: bytes, mime: str):
+    from mutagen.flac import Picture
+    pic = Picture()
+    pic.type = 3
+    pic.desc = "Cover"
+    pic.mime = mime
+    pic.data = data
+    return pic
+
+
+def _tag_mp3(path, title, artist, album, cover, mime):
+    from mutagen.mp3 import MP3
+    from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC, error
+    audio = MP3(path, ID3=ID3)
+    try: audio.add_tags()
+    except error: pass
+
+    try:
+        for key in list(audio.tags.keys()):
+            if key.startswith("APIC"):
+                del audio.tags[key]
+    except Exception:
+        pass
+
+    audio.tags.add(TIT2(encoding=3, text=title))
+    audio.tags.add(TPE1(encoding=3, text=artist))
+    audio.tags.add(TALB(encoding=3, text=album))
+
+    if cover:
+        try:
+            audio.tags.add(APIC(encoding=3, mime=mime, type=3, desc="Cover", data=cover))
+        except Exception:
+            pass
+
+    with tracing.span("tags.save"):
+        audio.save(v2_version=3)
+
+
+def _tag_flac(path, title, artist, album, cover, mime):
+    from mutagen.flac import FLAC
+    audio = FLAC(path)
+    audio["title"]  = title
+    audio["artist"] = artist
+    audio["album"]  = album
+
+    try:
+        audio.clear_pictures()
+    except Exception:
+        pass
+
+    if cover:
+        try:
+            audio.add_picture(_flac_picture(cover, mime))
+        except Exception:
+            pass
+
+    with tracing.span("tags.save"):
+        audio.save()
+
+
+def _tag_ogg(path, title, artist, album, cover, mime):
+    from mutagen.oggopus import OggOpus
+    from mutagen.oggvorbis import OggVorbis
+    # .opus — всегда Opus; .ogg может быть и Vorbis
+    try:
+        audio = OggOpus(path)
+    except Exception:
+        audio = OggVorbis(path)
+    audio["title"]  = [title]
+    audio["artist"] = [artist]
+    audio["album"]  = [album]
+    audio.pop("metadata_block_picture", None)
+    if cover:
+        try:
+            encoded = base64.b64encode(_flac_picture(cover, mime).write()).decode("ascii")
+            audio["metadata_block_picture"] = [encoded]
+        except Exception:
+            pass
+    with tracing.span("tags.save"):
+        audio.save()
+
+
+def _tag_mp4(path, title, artist, album, cover, mime):
+    from mutagen.mp4 import MP4, MP4Cover
+    audio = MP4(path)
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags["\xa9nam"] = [title]
+    audio.tags["\xa9ART"] = [artist]
+    audio.tags["\xa9alb"] = [album]
+    audio.tags.pop("covr", None)
+    if cover:
+        fmt = MP4Cover.FORMAT_PNG if mime == "image/png" else MP4Cover.FORMAT_JPEG
+        audio.tags["covr"] = [MP4Cover(cover, imageformat=fmt)]
+    with tracing.span("tags.save"):
+        audio.save()
+
+
+_WRITERS = {
+    ".mp3": _tag_mp3,
+    ".flac": _tag_flac,
+    ".opus": _tag_ogg,
+    ".ogg": _tag_ogg,
+    ".m4a": _tag_mp4,
+    ".mp4": _tag_mp4,
+}
+
+
+def write_tags(file_path: str, track_info: dict, cover: bytes = b"", cover_mime: str = "image/jpeg") -> bool:
+    """
+    Записывает title/artist/album и обложку по расширению файла.
+    Возвращает False, если формат не поддерживается.
+    """
+    writer = _WRITERS.get(os.path.splitext(file_path)[1].lower())
+    if writer is None:
+        return False
+    writer(
+        file_path,
+        track_info.get("title", "") or "",
+        track_info.get("artist", "") or "",
+        track_info.get("album", "") or "",
+        cover or b"",
+        cover_mime or "image/jpeg",
+    )
+    return True
@@ -0,0 +1,154 @@
+"""
+Общие подмены для тестов конвейера: локальный «Spotify» и YoutubeDL из benchmarks/fakes.py.
+Сеть не нужна; конфиг, кеши и скачанные файлы — во временной папке (APPDATA).
+"""
+import os
+import re
+import sys
+import threading
+import tempfile
+import contextlib
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# до импорта приложения: кеш совпадений и обложек ищут папку конфига в APPDATA
+os.environ["APPDATA"] = tempfile.mkdtemp(prefix="spotydown-tests-")
+
+from fakes import FakeSpotify, FakeYoutubeDLFactory, Latency  # noqa: E402
+
+FAIL = "fail"     # запрос падает с временной ошибкой (503)
+JUNK = "junk"     # запрос отвечает кандидатами, ни один из которых не подходит
+
+
+class ScriptedYoutubeDL:
+    """
+    Фабрика YoutubeDL поверх FakeYoutubeDLFactory с управляемыми сбоями:
+      on_search(query, n) — n-й (с 1) запрос с этим текстом: FAIL, JUNK или None (как обычно);
+      on_download(url)    — зовётся перед загрузкой (например, чтобы её задержать).
+    """
+
+    def __init__(self, factory: FakeYoutubeDLFactory):
+        self.factory = factory
+        self.on_search = None
+        self.on_download = None
+        self.searches = defaultdict(int)
+        self.downloads = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __call__(self, params: dict):
+        return _ScriptedYDL(self, self.factory(params))
+
+    @property
+    def search_calls(self) -> int:
+        with self._lock:
+            return sum(self.searches.values())
+
+
+class _ScriptedYDL:
+    def __init__(self, script: ScriptedYoutubeDL, ydl):
+        self.script = script
+        self.ydl = ydl
+
+    def __getattr__(self, name):
+        return getattr(self.ydl, name)
+
+    def extract_info(self, url: str, download: bool = False):
+        s = self.script
+        if download:
+            with s._lock:
+                s.downloads[url] += 1
+            if s.on_download is not None:
+                s.on_download(url)
+            return self.ydl.extract_info(url, download=True)
+        query = re.sub(r"^ytsearch\d*:", "", url)
+        with s._lock:
+            s.searches[query] += 1
+            n = s.searches[query]
+        action = s.on_search(query, n) if s.on_search is not None else None
+        if action == FAIL:
+            raise Exception("HTTP Error 503: Service Unavailable")
+        info = self.ydl.extract_info(url, download=False)
+        if action == JUNK:
+            # чужое название и 5-секундная длительность: кандидаты есть, но ни один не проходит
+            info["entries"] = [dict(e, duration=5) for e in info["entries"] if e["uploader"] == "Random Channel"]
+        return info
+
+
+@pytest.fixture(scope="session")
+def fake_spotify():
+    fake = FakeSpotify(api=Latency(), covers=Latency()).start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def app(fake_spotify, tmp_path, monkeypatch):
+    """
+    spotify_downloader с подменами: без лимитов частоты, MP3, чистые кеши и настройки,
+    повтор после сбоя — через 50 мс вместо секунд.
+    app.sd — модуль, app.ydl — ScriptedYoutubeDL, app.fake — FakeSpotify, app.tmp — папка теста.
+    """
+    import covers
+    import rate_limit
+    import retry_policy
+    import ydl_pool
+    import spotify_downloader as sd
+
+    settings = dict(sd.CLI_SETTINGS)
+    rate_limit.configure({name: 0 for name in rate_limit.DEFAULT_RATES})
+    sd.CLI_SETTINGS["audio_format"] = "mp3"   # подменный YoutubeDL отдаёт MP3
+    monkeypatch.setattr(retry_policy, "backoff_delay", lambda attempt, *a, **kw: 0.05)
+    sd.SEARCH_CACHE.clear()
+    mc = sd.get_match_cache()
+    if mc is not None:
+        mc.clear()
+    covers.clear()
+
+    factory = FakeYoutubeDLFactory(fake_spotify, search=Latency(2), download=Latency(5), audio_seconds=1.0)
+    script = ScriptedYoutubeDL(factory)
+    ydl_pool.set_factory(script)
+    try:
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            yield SimpleNamespace(sd=sd, ydl=script, fake=fake_spotify, tmp=tmp_path)
+    finally:
+        ydl_pool.set_factory(None)
+        sd.CLI_SETTINGS.clear()
+        sd.CLI_SETTINGS.update(settings)
+
+
+def make_tracks(fake: FakeSpotify, indexes) -> list[dict]:
+    """Треки каталога в том виде, в каком их отдаёт get_spotify_playlist_info."""
+    cat = fake.catalog(50)
+    return [{
+        "id": t["id"],
+        "artist": t["artist"],
+        "title": t["title"],
+        "album": t["album"],
+        "duration_ms": t["duration_s"] * 1000,
+        "cover_url": f"{fake.base_url}/img/{t['album_idx']}.jpg",
+    } for t in (cat.tracks[i] for i in indexes)]
+
+
+def run_pipeline(sd, tracks, out_dir, timeout: float = 30.0, **kwargs) -> dict:
+    """run_playlist_pipeline в отдельном потоке: зависший прогон — провал теста, а не вечный pytest."""
+    box = {}
+
+    def target():
+        try:
+            box["result"] = sd.run_playlist_pipeline(tracks, str(out_dir), None, **kwargs)
+        except BaseException as e:  # noqa: BLE001 — пробрасываем в тест
+            box["error"] = e
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), f"конвейер завис (> {timeout:.0f} с)"
+    if "error" in box:
+        raise box["error"]
+    return box["result"]
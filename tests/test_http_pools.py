@@ -0,0 +1,28 @@
+"""Счётчики соединений пулов urllib3 — нарастающим итогом, даже когда PoolManager вытесняет пулы."""
+import covers
+
+
+def test_cover_connection_counts_survive_pool_eviction(fake_spotify, monkeypatch):
+    # один пул на PoolManager, два «хоста»: каждый запрос к другому вытесняет пул предыдущего
+    monkeypatch.setattr(covers, "POOL_HOSTS", 1)
+    monkeypatch.setattr(covers, "_http", None)
+    monkeypatch.setattr(covers, "_connections", covers.ConnectionStats())
+    port = fake_spotify.server.server_address[1]
+    urls = [f"http://{host}:{port}/img/1.jpg" for host in ("127.0.0.1", "localhost")]
+
+    seen = []
+    for i in range(6):
+        covers.fetch_raw(urls[i % 2])
+        seen.append(covers.stats_snapshot())
+
+    opened = [s["connections"] for s in seen]
+    assert opened == sorted(opened), "счётчик открытых соединений уменьшился"
+    assert opened[-1] == 6          # каждое вытеснение закрывает соединение
+    assert seen[-1]["connections_reused"] == 0
+
+    # тот же хост подряд — соединение переиспользуется
+    for _ in range(3):
+        covers.fetch_raw(urls[0])
+    last = covers.stats_snapshot()
+    assert last["connections"] == 7
+    assert last["connections_reused"] == 2
@@ -0,0 +1,127 @@
+"""Сквозные тесты конвейера «поиск → загрузка → ffmpeg → теги» на подменах (conftest.py)."""
+import time
+import threading
+
+from conftest import FAIL, JUNK, make_tracks, run_pipeline
+from track_store import TrackStore
+
+
+def _video_id(track: dict) -> str:
+    return f"ok{track['id']}"
+
+
+def test_store_duplicate_does_not_hold_search_worker(app):
+    # тот же трек дважды, поиск в один поток: пока первое задание качает, дубль
+    # должен отпустить поток поиска — загрузка первого ждёт, пока найдутся остальные
+    sd = app.sd
+    tracks = make_tracks(app.fake, range(4))
+    tracks.insert(1, dict(tracks[0]))
+    first = _video_id(tracks[0])
+    held = []
+
+    def others_searched() -> bool:
+        with sd.search_cache_lock:
+            return all(sd.SEARCH_CACHE.get(f"{t['artist']} - {t['title']}") for t in tracks[2:])
+
+    def on_download(url):
+        if not url.endswith(first):
+            return
+        deadline = time.monotonic() + 5
+        while not others_searched():
+            if time.monotonic() > deadline:
+                held.append(url)
+                return
+            time.sleep(0.01)
+
+    app.ydl.on_download = on_download
+    sd.CLI_SETTINGS["search_threads"] = 1
+    store = TrackStore(str(app.tmp / "music"), "links")
+
+    res = run_pipeline(sd, tracks, app.tmp / "music" / "playlist", store=store)
+
+    assert not res["failed"]
+    assert not held, "дубль держит единственный поток поиска, пока первое задание качает"
+    assert sum(app.ydl.downloads.values()) == 4   # дубль взят из хранилища
+
+
+def test_playlist_duplicate_polls_are_not_retries(app):
+    sd = app.sd
+    track = make_tracks(app.fake, [7])[0]
+    release = threading.Event()
+    app.ydl.on_download = lambda url: release.wait(0.5)
+    sd.CLI_SETTINGS["concurrency"] = "auto"
+
+    res = run_pipeline(sd, [track, dict(track)], app.tmp / "playlist")
+
+    assert not res["failed"]
+    assert sum(app.ydl.downloads.values()) == 1
+    assert res["stats"]["deduped"] == 1
+    assert res["stats"]["stages"]["download"]["retries"] == 0
+
+
+def test_store_search_retry_keeps_own_claim(app):
+    # m3u-хранилище: первый запрос каждого текста падает — все треки уходят на повтор
+    # с уже «забранным» треком и не должны ждать собственный claim
+    sd = app.sd
+    tracks = make_tracks(app.fake, range(10, 13))
+    app.ydl.on_search = lambda query, n: FAIL if n == 1 else None
+    store = TrackStore(str(app.tmp / "music"), "m3u")
+
+    res = run_pipeline(sd, tracks, app.tmp / "music" / "playlist", store=store)
+
+    assert not res["failed"]
+    assert res["stats"]["retries"] >= len(tracks)
+    for t in tracks:
+        assert store.lookup(t, ("mp3",)), t["title"]
+
+
+def test_partial_search_failure_is_not_cached_as_miss(app):
+    # первая попытка: первый запрос падает, остальные — мусор; «не найдено» не должно
+    # попасть в кеш поиска, иначе повтор не отправит ни одного запроса
+    sd = app.sd
+    track = make_tracks(app.fake, [5])[0]
+    plan = [q for q, _ in sd.plan_search_queries(track)]
+
+    def on_search(query, n):
+        if n > 1:
+            return None
+        return FAIL if query == plan[0] else JUNK
+
+    app.ydl.on_search = on_search
+
+    res = run_pipeline(sd, [track], app.tmp / "playlist")
+
+    assert not res["failed"]
+    assert app.ydl.searches[plan[0]] >= 2, "повтор взял «не найдено» из кеша"
+
+
+def test_auto_download_limit_samples_downloads_and_grows(app, monkeypatch):
+    # в auto загрузки должны попадать в выборку AIMD: если каждую помечать как
+    # попадание в кеш, в окне остаются одни ошибки и лимит может только падать
+    import concurrency
+
+    sd = app.sd
+    monkeypatch.setattr(concurrency, "WINDOW_S", 0.25)
+    app.ydl.factory.download_latency.base = 0.05
+    sd.CLI_SETTINGS.update(concurrency="auto", threads=2, download_bounds=(1, 16))
+    tracks = make_tracks(app.fake, range(50))
+
+    res = run_pipeline(sd, tracks, app.tmp / "playlist")
+
+    assert not res["failed"]
+    download = res["stats"]["concurrency"]["download"]
+    assert download["skipped"] == 0
+    assert download["samples"] >= len(tracks)
+    grew = [d for d in download["decisions"] if d["reason"] == "рост"]
+    assert grew, f"лимит загрузок не рос: {download}"
+    assert download["limit"] > 2
+
+
+def test_process_track_runs_all_stages_with_retry(app):
+    sd = app.sd
+    track = make_tracks(app.fake, [20])[0]
+    app.ydl.on_search = lambda query, n: FAIL if n == 1 else None
+    job = sd.make_job(1, 1, track, str(app.tmp), None)
+
+    assert sd.process_track(job)
+    assert job["file_path"].startswith(str(app.tmp)) and job.get("attempts") == 1
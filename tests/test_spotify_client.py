@@ -0,0 +1,43 @@
+"""Общий клиент Spotify: токен запрашивается один раз и считается по токенам, а не по вызовам API."""
+import pytest
+
+import spotify_client
+
+
+@pytest.fixture
+def client_env(fake_spotify, tmp_path, monkeypatch):
+    from spotipy.oauth2 import SpotifyClientCredentials
+
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    monkeypatch.setattr(SpotifyClientCredentials, "OAUTH_TOKEN_URL", f"{fake_spotify.base_url}/api/token")
+    monkeypatch.setattr(spotify_client, "STATS", dict.fromkeys(spotify_client.STATS, 0))
+    spotify_client.set_factory(None)
+    yield fake_spotify
+    spotify_client.set_factory(None)
+
+
+def _client(fake):
+    sp = spotify_client.get_client("bench-id", "bench-secret")
+    sp.prefix = fake.base_url + "/v1/"
+    return sp
+
+
+def test_token_counted_once_per_token(client_env):
+    fake = client_env
+    fake.catalog(10)
+    for _ in range(5):
+        _client(fake).playlist("bench10")
+
+    stats = spotify_client.stats_snapshot()
+    assert stats["token_requests"] == 1
+    assert stats["tokens_reused"] == 0
+    assert stats["clients"] == 1 and stats["clients_reused"] == 4
+
+    # «новый запуск»: клиента в памяти нет, действующий токен лежит в файле
+    spotify_client.set_factory(None)
+    for _ in range(5):
+        _client(fake).playlist("bench10")
+
+    stats = spotify_client.stats_snapshot()
+    assert stats["token_requests"] == 1
+    assert stats["tokens_reused"] == 1
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import functools
+import threading
+from typing import Optional
+
+from app_config import _config_dir
+
+# Лёгкая трассировка этапов: span'ы пишутся в память и выгружаются в формате
+# Chrome Trace Event (открывается в chrome://tracing и ui.perfetto.dev).
+# Пока трассировка выключена, span() возвращает общий пустой объект, а traced()
+# сразу зовёт функцию — цена одна проверка флага на вызов.
+#
+# В трассе два «процесса»: pid 1 — потоки приложения (кто чем был занят),
+# pid 2 — треки плейлиста (что происходило с каждым треком по времени).
+
+TRACES_DIR = "traces"
+MAX_EVENTS = 500_000
+
+PID_THREADS = 1
+PID_TRACKS = 2
+
+ENABLED = False
+
+_lock = threading.Lock()
+_local = threading.local()
+_events: list[dict] = []
+_thread_names: dict[int, str] = {}
+_track_names: dict[int, str] = {}
+_dropped = 0
+_t0 = time.perf_counter()
+
+
+def enable(on: bool = True):
+    global ENABLED
+    ENABLED = bool(on)
+
+
+def reset():
+    """Очищает накопленные события (начало нового прогона)."""
+    global _dropped, _t0
+    with _lock:
+        _events.clear()
+        _thread_names.clear()
+        _track_names.clear()
+        _dropped = 0
+        _t0 = time.perf_counter()
+
+
+def _us(t: float) -> float:
+    return round((t - _t0) * 1e6, 1)
+
+
+def _tid() -> int:
+    ident = threading.get_ident()
+    if ident not in _thread_names:
+        with _lock:
+            _thread_names.setdefault(ident, threading.current_thread().name)
+    return ident
+
+
+def record(name: str, started: float, finished: float, args: Optional[dict] = None):
+    """Записывает готовый span по отметкам time.perf_counter()."""
+    global _dropped
+    if not ENABLED:
+        return
+    tid = _tid()
+    track = getattr(_local, "track", None)
+    ev = {"name": name, "ph": "X", "pid": PID_THREADS, "tid": tid,
+          "ts": _us(started), "dur": round((finished - started) * 1e6, 1)}
+    if args:
+        ev["args"] = args
+    evs = [ev]
+    if track is not None:
+        ev["args"] = dict(ev.get("args") or {}, track=track[1])
+        evs.append(dict(ev, pid=PID_TRACKS, tid=track[0]))
+    with _lock:
+        if len(_events) + len(evs) > MAX_EVENTS:
+            _dropped += len(evs)
+            return
+        _events.extend(evs)
+
+
+def counter(name: str, values: dict):
+    """Счётчик во времени (ph "C") — в трассе рисуется графиком, например лимит параллельности."""
+    global _dropped
+    if not ENABLED:
+        return
+    ev = {"name": name, "ph": "C", "pid": PID_THREADS, "ts": _us(time.perf_counter()), "args": dict(values)}
+    with _lock:
+        if len(_events) >= MAX_EVENTS:
+            _dropped += 1
+            return
+        _events.append(ev)
+
+
+class _Span:
+    __slots__ = ("name", "args", "started")
+
+    def __init__(self, name: str, args: Optional[dict]):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args = dict(self.args or {}, error=exc_type.__name__)
+        record(self.name, self.started, time.perf_counter(), self.args)
+        return False
+
+
+class _Noop:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _Noop()
+
+
+def span(name: str, **args):
+    """with span("search.query", query=q): ..."""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, args or None)
+
+
+class _Track:
+    __slots__ = ("value", "prev")
+
+    def __init__(self, idx: int, label: str):
+        self.value = (idx, label)
+
+    def __enter__(self):
+        self.prev = getattr(_local, "track", None)
+        _local.track = self.value
+        with _lock:
+            _track_names.setdefault(self.value[0], f"{self.value[0]}. {self.value[1]}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.track = self.prev
+        return False
+
+
+def track(idx: int, label: str):
+    """Все span'ы внутри блока относятся к треку idx (дублируются на его дорожку в pid 2)."""
+    if not ENABLED:
+        return _NOOP
+    return _Track(idx, label)
+
+
+def traced(name: Optional[str] = None):
+    """Декоратор: вызов функции — один span (по умолчанию с именем функции)."""
+    def deco(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Span(label, None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def event_count() -> int:
+    with _lock:
+        return len(_events)
+
+
+def export(path: Optional[str] = None) -> Optional[str]:
+    """Сохраняет трассу в JSON (по умолчанию в папку traces конфига). Возвращает путь или None."""
+    with _lock:
+        if not _events:
+            return None
+        meta = [
+            {"name": "process_name", "ph": "M", "pid": PID_THREADS, "args": {"name": "Потоки"}},
+            {"name": "process_name", "ph": "M", "pid": PID_TRACKS, "args": {"name": "Треки"}},
+        ]
+        meta += [{"name": "thread_name", "ph": "M", "pid": PID_THREADS, "tid": tid, "args": {"name": n}}
+                 for tid, n in _thread_names.items()]
+        meta += [{"name": "thread_name", "ph": "M", "pid": PID_TRACKS, "tid": idx, "args": {"name": n}}
+                 for idx, n in _track_names.items()]
+        meta += [{"name": "thread_sort_index", "ph": "M", "pid": PID_TRACKS, "tid": idx, "args": {"sort_index": idx}}
+                 for idx in _track_names]
+        data = {
+            "traceEvents": meta + list(_events),
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_events": _dropped},
+        }
+    if path is None:
+        folder = os.path.join(_config_dir(), TRACES_DIR)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, time.strftime("trace-%Y%m%d-%H%M%S.json"))
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    except OSError:
+        return None
+    return path
@@ -0,0 +1,151 @@
+import os
+import shutil
+import threading
+from typing import Iterable, Optional, Union
+
+# Общее хранилище треков: один файл на Spotify ID, сколько бы плейлистов его ни содержали.
+# Плейлист — это либо M3U со ссылками на файлы хранилища, либо папка с жёсткими ссылками
+# (reflink/копия, если ФС не умеет). Трек, который уже есть в хранилище, не ищется
+# и не скачивается повторно.
+#
+#   <папка музыки>/_Library/<первые 2 символа ID>/<ID>.<ext>
+
+STORE_DIR_NAME = "_Library"
+MODES = ("folders", "m3u", "links")   # folders — по-старому, отдельная копия в каждой папке
+
+FICLONE = 0x40049409   # ioctl reflink (Linux: btrfs, xfs)
+
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+
+class TrackStore:
+    def __init__(self, music_dir: str, mode: str = "links"):
+        self.root = os.path.join(music_dir, STORE_DIR_NAME)
+        self.mode = mode if mode in MODES else "links"
+        self._lock = threading.Lock()
+        self._inflight: set[str] = set()
+        self.stats = {"hits": 0, "stored": 0, "links": 0, "reflinks": 0, "copies": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def path_for(self, track: dict, ext: str) -> Optional[str]:
+        tid = track.get("id")
+        if not tid:
+            return None
+        return os.path.join(self.root, tid[:2], f"{tid}.{ext}")
+
+    def lookup(self, track: dict, exts: Union[str, Iterable[str]], count: bool = False) -> Optional[str]:
+        """
+        Готовый (скачанный и с тегами) файл трека в хранилище или None.
+        exts — расширение или несколько (формат native); count — учесть в stats.
+        """
+        for ext in ((exts,) if isinstance(exts, str) else exts):
+            path = self.path_for(track, ext)
+            if path and os.path.exists(path):
+                if count:
+                    self._count("hits")
+                return path
+        return None
+
+    def temp_location(self, track: dict) -> tuple[str, str]:
+        """(папка, имя без расширения) для загрузки: до commit() файл не виден как готовый."""
+        tid = track["id"]
+        folder = os.path.join(self.root, tid[:2])
+        os.makedirs(folder, exist_ok=True)
+        return folder, f"{tid}.part"
+
+    def commit(self, track: dict, tmp_path: str) -> str:
+        ext = os.path.splitext(tmp_path)[1].lstrip(".")
+        final = self.path_for(track, ext)
+        os.replace(tmp_path, final)
+        self._count("stored")
+        return final
+
+    # --- один трек качает одно задание, остальные спрашивают позже (Pipeline WAIT) ---
+
+    def claim(self, track: dict) -> bool:
+        """True — этот вызов отвечает за загрузку трека; False — его уже качает другой."""
+        tid = track.get("id")
+        if not tid:
+            return False
+        with self._lock:
+            if tid in self._inflight:
+                return False
+            self._inflight.add(tid)
+            return True
+
+    def release(self, track: dict):
+        with self._lock:
+            self._inflight.discard(track.get("id"))
+
+    # --- раскладка по плейлистам ---
+
+    def place(self, store_path: str, folder: str, name: str) -> str:
+        """
+        Делает файл хранилища видимым в папке плейлиста и возвращает путь к нему.
+        m3u — файл остаётся только в хранилище; links — жёсткая ссылка → reflink → копия.
+        """
+        if self.mode == "m3u":
+            return store_path
+        dest = os.path.join(folder, name)
+        try:
+            if os.path.exists(dest):
+                if os.path.samefile(dest, store_path):
+                    return dest
+                os.remove(dest)
+        except OSError:
+            pass
+        os.makedirs(folder, exist_ok=True)
+        try:
+            os.link(store_path, dest)
+            self._count("links")
+        except OSError:
+            if _reflink(store_path, dest):
+                self._count("reflinks")
+            else:
+                shutil.copy2(store_path, dest)
+                self._count("copies")
+        return dest
+
+    def stats_snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+def write_m3u(m3u_path: str, entries: Iterable[tuple[dict, str]]) -> int:
+    """Пишет M3U8 с относительными путями: entries — (трек, путь к файлу). Возвращает число строк."""
+    base = os.path.dirname(os.path.abspath(m3u_path))
+    lines = ["#EXTM3U"]
+    count = 0
+    for track, path in entries:
+        seconds = int((track.get("duration_ms") or 0) / 1000)
+        lines.append(f"#EXTINF:{seconds},{track.get('artist', '')} - {track.get('title', '')}")
+        try:
+            rel = os.path.relpath(path, base)
+        except ValueError:   # другой диск в Windows
+            rel = path
+        lines.append(rel)
+        count += 1
+    tmp = m3u_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, m3u_path)
+    return count
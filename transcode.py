@@ -0,0 +1,181 @@
+import os
+import shutil
+import subprocess
+import threading
+from typing import Optional
+
+import audio_formats
+
+# Перекодирование/перепаковка скачанной дорожки отдельным ffmpeg-процессом.
+# Раньше это делал постпроцессор yt-dlp прямо в потоке загрузки, и число потоков загрузки
+# заодно задавало число одновременных ffmpeg. Теперь сеть и CPU — разные пулы:
+# загрузка отдаёт «сырой» файл, а сюда он приходит уже в пуле размером с число ядер.
+# Каждому ffmpeg явно задаётся -threads, чтобы N процессов не делили ядра N×auto потоками.
+# Для MP3 и FLAC ffmpeg сразу пишет и теги с обложкой (обложка идёт вторым входом через stdin):
+# иначе mutagen потом вставлял бы ID3 с обложкой в начало файла и переписывал его целиком.
+# В заголовке оставляется запас (HEADER_PADDING), чтобы последующая правка тегов шла на месте.
+
+STATS = {"transcoded": 0, "copied": 0, "renamed": 0, "tagged": 0}
+
+TAGGED_EXTS = ("mp3", "flac")
+HEADER_PADDING = 4096
+_lock = threading.Lock()
+
+# acodec из yt-dlp → (кодек, расширение, в котором дорожку можно хранить без перекодирования)
+_NATIVE = {
+    "opus": ("opus", "opus"),
+    "aac": ("aac", "m4a"),
+    "vorbis": ("vorbis", "ogg"),
+    "mp3": ("mp3", "mp3"),
+    "flac": ("flac", "flac"),
+}
+
+_ENCODERS = {
+    "mp3": ["-c:a", "libmp3lame"],
+    "flac": ["-c:a", "flac"],
+    "opus": ["-c:a", "libopus", "-b:a", "160k"],
+    "m4a": ["-c:a", "aac", "-b:a", "192k"],
+}
+
+
+def _count(name: str):
+    with _lock:
+        STATS[name] += 1
+
+
+def stats_snapshot() -> dict:
+    with _lock:
+        return dict(STATS)
+
+
+def ffmpeg_binary() -> str:
+    return shutil.which("ffmpeg") or "ffmpeg"
+
+
+def codec_family(acodec: Optional[str], ext: Optional[str] = None) -> Optional[str]:
+    """opus / aac / vorbis / mp3 / flac по acodec yt-dlp ("mp4a.40.2" → aac) или расширению."""
+    c = (acodec or "").lower()
+    if c.startswith("mp4a") or c == "aac":
+        return "aac"
+    for name in ("opus", "vorbis", "mp3", "flac"):
+        if c.startswith(name):
+            return name
+    return {"opus": "opus", "m4a": "aac", "ogg": "vorbis", "mp3": "mp3", "flac": "flac"}.get((ext or "").lower())
+
+
+def plan(fmt: str, family: Optional[str], bitrate_kbps: int = 320) -> tuple[str, list[str]]:
+    """(расширение результата, аргументы кодека ffmpeg) — ["-c:a", "copy"], если перекодировать не нужно."""
+    fmt = audio_formats.normalize(fmt)
+    native = _NATIVE.get(family or "")
+    if fmt == "native":
+        if native:
+            return native[1], ["-c:a", "copy"]
+        return "opus", list(_ENCODERS["opus"])
+    target_family = {"mp3": "mp3", "flac": "flac", "opus": "opus", "m4a": "aac"}[fmt]
+    if family == target_family and fmt != "mp3":
+        return fmt, ["-c:a", "copy"]
+    args = list(_ENCODERS[fmt])
+    if fmt == "mp3":
+        args += ["-b:a", f"{int(bitrate_kbps)}k"]
+    return fmt, args
+
+
+def can_tag(ext: str, tags: Optional[dict]) -> bool:
+    """Запишет ли ffmpeg теги сам: MP3/FLAC и обложка (если есть) — JPEG, как её отдаёт covers.py."""
+    if not tags or ext not in TAGGED_EXTS:
+        return False
+    return not tags.get("cover") or (tags.get("cover_mime") or "image/jpeg") == "image/jpeg"
+
+
+def _tag_args(ext: str, tags: dict) -> tuple[list[str], list[str]]:
+    """(аргументы входа и разметки потоков, аргументы метаданных вывода) — как пишет tagging.py."""
+    if tags.get("cover"):
+        inputs = ["-f", "jpeg_pipe", "-i", "pipe:0", "-map", "0:a:0", "-map", "1:v:0", "-c:v", "copy",
+                  "-disposition:v:0", "attached_pic",
+                  "-metadata:s:v:0", "title=Cover", "-metadata:s:v:0", "comment=Cover (front)"]
+    else:
+        inputs = ["-vn"]
+    meta = ["-map_metadata", "-1"]
+    for key in ("title", "artist", "album"):
+        meta += ["-metadata", f"{key}={tags.get(key) or ''}"]
+    meta += ["-metadata_header_padding", str(HEADER_PADDING)]
+    if ext == "mp3":
+        meta += ["-id3v2_version", "3"]
+    return inputs, meta
+
+
+def _run_ffmpeg(src: str, dst: str, codec_args: list[str], threads: int, tags: Optional[dict] = None):
+    ext = os.path.splitext(dst)[1].lstrip(".").lower()
+    if tags:
+        inputs, meta = _tag_args(ext, tags)
+    else:
+        inputs, meta = ["-vn"], ["-map_metadata", "-1"]
+    # -threads перед -i задаёт потоки декодера, перед выходом — энкодера (и фильтров)
+    threads_args = ["-threads", str(max(0, int(threads)))]
+    cmd = ([ffmpeg_binary(), "-y", "-nostdin", "-v", "error"] + threads_args + ["-i", src]
+           + inputs + meta + codec_args + threads_args + [dst])
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    cover = (tags or {}).get("cover") or None
+    proc = subprocess.run(cmd, input=cover, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **kwargs)
+    if proc.returncode != 0:
+        err = proc.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(f"ffmpeg: {err[-1] if err else proc.returncode}")
+
+
+def transcode(src: str, out_dir: str, stem: str, fmt: str, acodec: Optional[str] = None,
+              bitrate_kbps: int = 320, threads: int = 1, tags: Optional[dict] = None) -> tuple[str, bool]:
+    """
+    Приводит скачанный файл src к формату fmt: <out_dir>/<stem>.<ext>.
+    Дорожка уже в нужном контейнере — просто переименование; нужный кодек в другом
+    контейнере — перепаковка (-c:a copy); иначе — перекодирование. src удаляется
+    (если ffmpeg упал — тоже).
+    tags — {"title", "artist", "album", "cover", "cover_mime"}: если ffmpeg всё равно
+    запускается и формат позволяет (can_tag), теги и обложка пишутся им же.
+    Возвращает (путь, записаны ли теги) — если нет, их пишет tagging.write_tags.
+    """
+    src_ext = os.path.splitext(src)[1].lstrip(".").lower()
+    family = codec_family(acodec, src_ext)
+    ext, codec_args = plan(fmt, family, bitrate_kbps)
+    dst = os.path.join(out_dir, f"{stem}.{ext}")
+
+    if codec_args == ["-c:a", "copy"] and src_ext == ext:
+        os.replace(src, dst)
+        _count("renamed")
+        return dst, False
+    if audio_formats.normalize(fmt) == "mp3" and family == "mp3" and src_ext == "mp3":
+        # уже MP3 (YouTube такого не отдаёт, но прямые файлы бывают) — не пережимаем
+        os.replace(src, dst)
+        _count("renamed")
+        return dst, False
+
+    tmp = os.path.join(out_dir, f"{stem}.tmp.{ext}")
+    tagged = can_tag(ext, tags)
+    try:
+        try:
+            _run_ffmpeg(src, tmp, codec_args, threads, tags if tagged else None)
+        except Exception:
+            if not tagged:
+                raise
+            # старый ffmpeg без jpeg_pipe и т.п. — без тегов, их допишет mutagen
+            tagged = False
+            _run_ffmpeg(src, tmp, codec_args, threads)
+        os.replace(tmp, dst)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    finally:
+        # исходник больше не нужен и при ошибке: повтор скачает его заново,
+        # а <stem>.src.<ext> не должны копиться в папке плейлиста
+        try:
+            os.remove(src)
+        except OSError:
+            pass
+    _count("copied" if codec_args == ["-c:a", "copy"] else "transcoded")
+    if tagged:
+        _count("tagged")
+    return dst, tagged
@@ -0,0 +1,152 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from yt_dlp.cookies import YoutubeDLCookieJar
+
+# Долгоживущие экземпляры YoutubeDL: по одному на поток и профиль ("search", "download", ...).
+# Создание YoutubeDL дорогое (инициализация экстракторов + разбор cookies.txt),
+# поэтому экземпляр переиспользуется, пока не поменялись опции или cookies.
+
+STATS = {"created": 0, "reused": 0, "recycled": 0, "cookie_parses": 0}
+
+_local = threading.local()
+_lock = threading.Lock()
+_generation = 0
+_factory = None
+_jars: dict[str, tuple[float, "YoutubeDLCookieJar"]] = {}
+
+
+def load_yt_dlp():
+    """yt_dlp импортируется при первой надобности: сотни экстракторов не нужны, пока не начался поиск."""
+    import yt_dlp
+    return yt_dlp
+
+
+def _count(name: str):
+    with _lock:
+        STATS[name] += 1
+
+
+def invalidate():
+    """Помечает все экземпляры устаревшими (например, после обновления cookies)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _jars.clear()
+
+
+def set_factory(factory):
+    """Подменяет класс YoutubeDL (для офлайн-бенчмарков); None — вернуть настоящий."""
+    global _factory
+    _factory = factory
+    invalidate()
+
+
+def shared_cookie_jar(cookies_file: Optional[str]) -> Optional["YoutubeDLCookieJar"]:
+    """Один разобранный cookie jar на файл; перечитывается только при смене mtime."""
+    global _generation
+    if not cookies_file:
+        return None
+    try:
+        mtime = os.path.getmtime(cookies_file)
+    except OSError:
+        return None
+    with _lock:
+        cached = _jars.get(cookies_file)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        from yt_dlp.cookies import YoutubeDLCookieJar
+        jar = YoutubeDLCookieJar(cookies_file)
+        try:
+            jar.load(ignore_discard=True, ignore_expires=True)
+        except Exception:
+            return None
+        if cached:
+            # файл обновился — старые экземпляры держат старый jar
+            _generation += 1
+        _jars[cookies_file] = (mtime, jar)
+        STATS["cookie_parses"] += 1
+        return jar
+
+
+def _opts_key(opts: dict) -> str:
+    return repr(sorted((k, repr(v)) for k, v in opts.items() if k != "outtmpl"))
+
+
+def _attach_cookie_jar(ydl, jar: "YoutubeDLCookieJar"):
+    # cookiejar и _request_director у YoutubeDL — cached_property: подменяем jar
+    # до первого запроса, а уже созданный director (если был) пересоздастся с новым jar
+    ydl.__dict__["cookiejar"] = jar
+    director = ydl.__dict__.pop("_request_director", None)
+    if director is not None:
+        try:
+            director.close()
+        except Exception:
+            pass
+
+
+def _handles() -> dict:
+    handles = getattr(_local, "handles", None)
+    if handles is None:
+        handles = _local.handles = {}
+    return handles
+
+
+def get_ydl(profile: str, opts: dict):
+    """
+    Возвращает YoutubeDL текущего потока для профиля.
+    cookiefile из opts не передаётся в yt-dlp: вместо этого подставляется общий jar.
+    """
+    cookies_file = opts.get("cookiefile")
+    jar = shared_cookie_jar(cookies_file) if cookies_file and os.path.exists(cookies_file) else None
+    key = (_opts_key(opts), cookies_file if jar is not None else None)
+
+    handles = _handles()
+    cur = handles.get(profile)
+    if cur is not None and cur[0] == key and cur[1] == _generation:
+        _count("reused")
+        return cur[2]
+    if cur is not None:
+        _count("recycled")
+        _close(cur[2])
+
+    params = {k: v for k, v in opts.items() if k != "cookiefile"}
+    ydl = (_factory or load_yt_dlp().YoutubeDL)(params)
+    if jar is not None:
+        _attach_cookie_jar(ydl, jar)
+    handles[profile] = (key, _generation, ydl)
+    _count("created")
+    return ydl
+
+
+def set_outtmpl(ydl, outtmpl: str):
+    """Меняет шаблон имени файла у уже созданного экземпляра (он разный для каждого трека)."""
+    current = ydl.params.get("outtmpl")
+    if isinstance(current, dict):
+        current["default"] = outtmpl
+    else:
+        ydl.params["outtmpl"] = {"default": outtmpl}
+
+
+def discard(profile: str):
+    """Выбрасывает экземпляр профиля текущего потока (после ошибки, чтобы не тащить его состояние)."""
+    cur = _handles().pop(profile, None)
+    if cur is not None:
+        _close(cur[2])
+
+
+def release_thread():
+    """Закрывает все экземпляры текущего потока — вызывается воркером перед завершением."""
+    handles = _handles()
+    for _, _, ydl in handles.values():
+        _close(ydl)
+    handles.clear()
+
+
+def _close(ydl):
+    try:
+        ydl.close()
+    except Exception:
+        pass